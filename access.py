@@ -0,0 +1,167 @@
+import json
+import logging
+
+from callbacks import Op, SEP
+from shared_store import VersionConflict
+
+logger = logging.getLogger(__name__)
+
+CASHIER = "cashier"
+MANAGER = "manager"
+ADMIN = "admin"
+ROLE_LEVELS = {CASHIER: 1, MANAGER: 2, ADMIN: 3}
+ROLE_TITLES = {CASHIER: "кассир", MANAGER: "менеджер", ADMIN: "администратор"}
+
+# Ключ назначенных ролей в общем хранилище воркеров
+ROLES_STORE_KEY = "roles"
+
+# Действия старше кассира; всё, что не перечислено, доступно кассиру
+CALLBACK_ROLES = {
+    Op.CLOSE_SHIFT: MANAGER,
+    Op.REFUND_MENU: MANAGER,
+    Op.REFUND_SALE: MANAGER,
+    Op.ADD_PAYOUT: MANAGER,
+    Op.COUNT_CASH: MANAGER,
+    Op.ARCHIVE: MANAGER,
+    Op.ARCHIVE_VIEW: MANAGER,
+    Op.ARCHIVE_PICK: MANAGER,
+    Op.ARCHIVE_COMPARE: MANAGER,
+    Op.ARCHIVE_FILE: MANAGER,
+    Op.DASHBOARD_PIN: MANAGER,
+    Op.DASHBOARD_UNPIN: MANAGER,
+}
+COMMAND_ROLES = {
+    "export": MANAGER,
+    "peaks": MANAGER,
+    "network": MANAGER,
+    "role": ADMIN,
+    "jobs": ADMIN,
+}
+
+
+def user_key(value) -> str:
+    """Ключ пользователя в таблице ролей: id числом или @username в нижнем регистре"""
+    value = str(value).strip()
+    return value if value.lstrip("-").isdigit() else "@" + value.lstrip("@").lower()
+
+
+def parse_roles(text: str) -> dict:
+    """«@ivan:manager,123456:cashier» → {ключ пользователя: роль}"""
+    roles = {}
+    for part in (text or "").split(","):
+        user, _, role = part.rpartition(":")
+        role = role.strip().lower()
+        if not user.strip():
+            continue
+        if role not in ROLE_LEVELS:
+            raise ValueError(f"Неизвестная роль «{role}» для {user}")
+        roles[user_key(user)] = role
+    return roles
+
+
+def command_name(text: str):
+    """«/export@bot 01.10.2026» → «export»; None — не команда"""
+    if not text or not text.startswith("/"):
+        return None
+    parts = text[1:].split(maxsplit=1)
+    return parts[0].split("@", 1)[0].lower() if parts else None
+
+
+class AccessControl:
+    """Роли пользователей в памяти и проверка прав до обработчиков.
+
+    Роли берутся из конфига (ACCESS_ROLES, ADMIN_USERNAME) и общего
+    хранилища; проверка — два поиска в словаре на обновление. Роль
+    попадает в обработчики аргументом ``role``.
+    """
+
+    def __init__(self, config_roles: dict, default_role: str = None, store=None):
+        self.config_roles = config_roles
+        self.default_role = default_role or None
+        self.store = store
+        self.assigned = {}
+        self._version = 0
+        self.roles = dict(config_roles)
+        self.denied = 0
+
+    def load(self):
+        """Перечитать назначенные роли из хранилища (при старте и смене лидера)"""
+        if self.store is not None:
+            value, self._version = self.store.get(ROLES_STORE_KEY)
+            self.assigned = json.loads(value) if value else {}
+        # Назначения командой /role важнее конфига
+        self.roles = {**self.config_roles, **self.assigned}
+        logger.info(f"🔐 Загружено ролей: {len(self.roles)}")
+
+    def assign(self, user, role) -> bool:
+        """Назначение (role=None — снятие); False — без хранилища, до перезапуска"""
+        key = user_key(user)
+        for _ in range(2):
+            assigned = dict(self.assigned)
+            if role is None:
+                assigned.pop(key, None)
+            else:
+                assigned[key] = role
+            if self.store is None:
+                break
+            try:
+                self._version = self.store.put(ROLES_STORE_KEY, json.dumps(assigned), self._version)
+                break
+            except VersionConflict:
+                # Роли изменил другой воркер — перечитываем и повторяем
+                self.load()
+        else:
+            raise VersionConflict(ROLES_STORE_KEY)
+
+        self.assigned = assigned
+        # Снятая командой роль возвращается к роли из конфига, если она там есть
+        self.roles = {**self.config_roles, **assigned}
+        return self.store is not None
+
+    def role_of(self, user):
+        if user is None:
+            return None
+        role = self.roles.get(str(user.id))
+        if role is None and user.username:
+            role = self.roles.get("@" + user.username.lower())
+        return role or self.default_role
+
+    @staticmethod
+    def allows(role, required) -> bool:
+        return role is not None and ROLE_LEVELS[role] >= ROLE_LEVELS[required]
+
+    def required_for(self, event) -> str:
+        data = getattr(event, "data", None)
+        if data is not None:
+            return CALLBACK_ROLES.get(data.split(SEP, 1)[0], CASHIER)
+        command = command_name(getattr(event, "text", None))
+        return COMMAND_ROLES.get(command, CASHIER)
+
+    async def check(self, handler, event, data):
+        """Outer-middleware для сообщений, кнопок и inline-запросов"""
+        role = self.role_of(data.get("event_from_user"))
+        required = self.required_for(event)
+        if not self.allows(role, required):
+            self.denied += 1
+            user = data.get("event_from_user")
+            logger.warning(f"⛔ Нет прав ({role or 'нет роли'} < {required}): "
+                           f"{user.username if user else '?'}")
+            await self._deny(event, required)
+            return None
+        data["role"] = role
+        return await handler(event, data)
+
+    @staticmethod
+    async def _deny(event, required):
+        text = f"⛔ Недостаточно прав (нужна роль: {ROLE_TITLES[required]})"
+        if hasattr(event, "data"):
+            await event.answer(text, show_alert=True)
+        elif hasattr(event, "query"):
+            await event.answer([], cache_time=0, is_personal=True)
+        else:
+            await event.answer(text)
+
+    def install(self, dispatcher):
+        dispatcher.message.outer_middleware(self.check)
+        dispatcher.callback_query.outer_middleware(self.check)
+        dispatcher.inline_query.outer_middleware(self.check)
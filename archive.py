@@ -0,0 +1,227 @@
+import datetime
+import glob
+import json
+import logging
+import os
+import threading
+import zlib
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Размер блока при потоковом чтении из пакета
+READ_CHUNK = 64 * 1024
+
+def shift_file_date(filename: str) -> datetime.datetime:
+    """Дата смены из имени файла вида смена_YYYYMMDD_HHMMSS.ext"""
+    return datetime.datetime.strptime(filename.replace('смена_', '')[:8], '%Y%m%d')
+
+
+class ShiftArchive:
+    """Архив закрытых смен: сжатые gzip-пакеты по месяцам с индексом смещений.
+
+    Каждый файл смены хранится в пакете ``archive/YYYY-MM.bundle`` отдельным
+    gzip-блоком, а ``YYYY-MM.index.json`` хранит его смещение и длину, поэтому
+    одна смена читается одним seek без распаковки всего месяца. Свежие смены
+    лежат в папке как обычные файлы, пока не станут старше ``archive_after_days``.
+
+    Обслуживание идёт в рабочем потоке, пока обработчики читают архив:
+    индексы меняются только под ``_lock``, а читатели берут из них копию.
+    """
+
+    def __init__(self, config=Config):
+        self.folder = config.CLOSED_SESSIONS_FOLDER
+        self.archive_folder = os.path.join(self.folder, "archive")
+        self.archive_after_days = config.ARCHIVE_AFTER_DAYS
+        self.retention_days = config.ARCHIVE_RETENTION_DAYS
+        self._indexes = None
+        self._lock = threading.RLock()
+
+    # ---------- индекс ----------
+    def _bundle_path(self, month: str) -> str:
+        return os.path.join(self.archive_folder, f"{month}.bundle")
+
+    def _index_path(self, month: str) -> str:
+        return os.path.join(self.archive_folder, f"{month}.index.json")
+
+    def _load_indexes(self):
+        with self._lock:
+            return self._load_indexes_locked()
+
+    def _load_indexes_locked(self):
+        if self._indexes is None:
+            self._indexes = {}
+            for index_file in glob.glob(os.path.join(self.archive_folder, "*.index.json")):
+                month = os.path.basename(index_file)[:-len(".index.json")]
+                try:
+                    with open(index_file, 'r', encoding='utf-8') as f:
+                        self._indexes[month] = json.load(f)
+                except Exception as e:
+                    logger.error(f"❌ Повреждён индекс архива {index_file}: {e}")
+        return self._indexes
+
+    def _save_index(self, month: str):
+        index_file = self._index_path(month)
+        tmp_file = f"{index_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._indexes[month], f, ensure_ascii=False)
+        os.replace(tmp_file, index_file)
+
+    # ---------- список и чтение ----------
+    def list_files(self, suffix: str):
+        """Все файлы смен с расширением suffix: свежие и заархивированные"""
+        files = {}
+        for filepath in glob.glob(os.path.join(self.folder, f"смена_*{suffix}")):
+            files[os.path.basename(filepath)] = None
+        with self._lock:
+            packed = [(month, list(index)) for month, index in self._load_indexes().items()]
+        for month, filenames in packed:
+            for filename in filenames:
+                if filename.endswith(suffix):
+                    files.setdefault(filename, month)
+        return files
+
+    def read_bytes(self, filename: str) -> bytes:
+        """Содержимое файла смены (из папки или из пакета)"""
+        return b"".join(self._iter_chunks(filename))
+
+    def iter_lines(self, filename: str):
+        """Построчное чтение файла смены без загрузки целиком"""
+        pending = b""
+        for chunk in self._iter_chunks(filename):
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield line.decode('utf-8') + "\n"
+        if pending:
+            yield pending.decode('utf-8')
+
+    def _iter_chunks(self, filename: str):
+        filename = os.path.basename(filename)
+        loose_path = os.path.join(self.folder, filename)
+        try:
+            f = open(loose_path, 'rb')
+        except FileNotFoundError:
+            # Нет в папке (или только что упакован) — читаем из пакета
+            pass
+        else:
+            with f:
+                while chunk := f.read(READ_CHUNK):
+                    yield chunk
+            return
+
+        month = self._find_month(filename)
+        if month is None:
+            raise FileNotFoundError(filename)
+        yield from self._iter_packed(month, filename)
+
+    def _iter_packed(self, month: str, filename: str):
+        """Распаковка блока файла из месячного пакета"""
+        with self._lock:
+            offset, length = self._indexes[month][filename][:2]
+        decompressor = zlib.decompressobj(wbits=31)
+        with open(self._bundle_path(month), 'rb') as f:
+            f.seek(offset)
+            left = length
+            while left:
+                data = f.read(min(READ_CHUNK, left))
+                if not data:
+                    raise EOFError(f"Пакет {month} обрезан на {filename}")
+                left -= len(data)
+                yield decompressor.decompress(data)
+        yield decompressor.flush()
+
+    def _packed_equals(self, month: str, filename: str, raw: bytes) -> bool:
+        try:
+            return b"".join(self._iter_packed(month, filename)) == raw
+        except (EOFError, zlib.error):
+            # Повреждённый блок заменяется свежей копией
+            return False
+
+    def _find_month(self, filename: str):
+        try:
+            month = shift_file_date(filename).strftime('%Y-%m')
+        except ValueError:
+            return None
+        with self._lock:
+            return month if filename in self._load_indexes().get(month, {}) else None
+
+    # ---------- обслуживание ----------
+    def compress_closed(self, now=None) -> int:
+        """Упаковка файлов смен старше archive_after_days в месячные пакеты"""
+        now = now or datetime.datetime.now()
+        border = (now - datetime.timedelta(days=self.archive_after_days)).date()
+        indexes = self._load_indexes()
+        packed = 0
+
+        for filepath in sorted(glob.glob(os.path.join(self.folder, "смена_*"))):
+            filename = os.path.basename(filepath)
+            try:
+                file_date = shift_file_date(filename)
+            except ValueError:
+                continue
+            if file_date.date() >= border:
+                continue
+
+            month = file_date.strftime('%Y-%m')
+            with self._lock:
+                archived = filename in indexes.get(month, {})
+            with open(filepath, 'rb') as f:
+                raw = f.read()
+            # Файл уже в пакете (например, импорт переписал его заново): если
+            # содержимое другое, дописывается новый блок и индекс переводится на
+            # него, а старый блок остаётся мёртвым местом до удаления пакета
+            if not archived or not self._packed_equals(month, filename, raw):
+                # gzip-блок (wbits=31), чтобы пакет читался и обычным zcat
+                compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+                block = compressor.compress(raw) + compressor.flush()
+
+                os.makedirs(self.archive_folder, exist_ok=True)
+                with open(self._bundle_path(month), 'ab') as f:
+                    offset = f.tell()
+                    f.write(block)
+                    f.flush()
+                    os.fsync(f.fileno())
+                with self._lock:
+                    indexes.setdefault(month, {})[filename] = [offset, len(block), len(raw)]
+                    self._save_index(month)
+                packed += 1
+
+            # Файл удаляется только после записи индекса
+            os.remove(filepath)
+
+        if packed:
+            logger.info(f"🗜️ Упаковано в архив файлов смен: {packed}")
+        return packed
+
+    def apply_retention(self, now=None) -> int:
+        """Удаление месячных пакетов, целиком вышедших за срок хранения"""
+        if not self.retention_days:
+            return 0
+        now = now or datetime.datetime.now()
+        border = now - datetime.timedelta(days=self.retention_days)
+        removed = 0
+
+        for month in list(self._load_indexes()):
+            month_start = datetime.datetime.strptime(month, '%Y-%m')
+            month_end = (month_start + datetime.timedelta(days=32)).replace(day=1)
+            if month_end > border:
+                continue
+            with self._lock:
+                # Сначала из индекса: читатели перестают искать смены в пакете
+                del self._indexes[month]
+                for path in (self._index_path(month), self._bundle_path(month)):
+                    if os.path.exists(path):
+                        os.remove(path)
+            removed += 1
+            logger.info(f"🗑️ Архив за {month} удалён по сроку хранения")
+        return removed
+
+    def maintain(self):
+        """Упаковка старых смен и очистка по сроку хранения"""
+        try:
+            self.compress_closed()
+            self.apply_retention()
+        except Exception as e:
+            logger.error(f"❌ Ошибка обслуживания архива: {e}")
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Повтор неудачной записи: пауза удваивается от первой до предельной
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+
+
+class AutoSaveScheduler:
+    """Отложенное сохранение бэкапа: пишет на диск только при изменениях.
+
+    Изменения копятся и сбрасываются одной записью после ``max_changes``
+    мутаций или через ``max_delay_ms`` после первой несохранённой мутации —
+    что наступит раньше. Пока изменений нет, задача спит и диск не трогает.
+    """
+
+    def __init__(self, save_func, max_changes=10, max_delay_ms=2000):
+        self.save_func = save_func
+        self.max_changes = max(1, max_changes)
+        self.max_delay = max(0, max_delay_ms) / 1000
+        self.pending = 0
+        self.first_change_at = None
+        self.task = None
+        self.failures = 0
+        self._dirty = asyncio.Event()
+        self.stats = {
+            "changes": 0,
+            "writes": 0,
+            "writes_avoided": 0,
+            "forced_flushes": 0,
+            "failed_writes": 0,
+        }
+
+    def mark_dirty(self):
+        """Отметить изменение состояния смены"""
+        self.stats["changes"] += 1
+        if not self.pending:
+            self.first_change_at = time.monotonic()
+        self.pending += 1
+
+        if self.pending >= self.max_changes or self.task is None:
+            # Порог достигнут (или планировщик не запущен) — пишем сразу
+            self.stats["forced_flushes"] += 1
+            self.flush()
+        else:
+            self._dirty.set()
+
+    def flush(self):
+        """Немедленная запись накопленных изменений.
+
+        Изменения считаются сохранёнными только после успешной записи: при
+        ошибке они остаются в очереди, и фоновая задача повторит запись с
+        нарастающей паузой.
+        """
+        if not self.pending:
+            return False
+
+        if self.save_func():
+            self.stats["writes"] += 1
+            self.stats["writes_avoided"] += self.pending - 1
+            self.pending = 0
+            self.first_change_at = None
+            self.failures = 0
+            self._dirty.clear()
+            return True
+
+        self.stats["failed_writes"] += 1
+        self.failures += 1
+        delay = min(RETRY_BASE_SECONDS * 2 ** (self.failures - 1), RETRY_MAX_SECONDS)
+        logger.warning(f"⚠️ Бэкап не записан, повтор через {delay:g} с")
+        # Срок следующей записи в _run — first_change_at + max_delay
+        self.first_change_at = time.monotonic() + delay - self.max_delay
+        self._dirty.set()
+        return False
+
+    def discard(self):
+        """Сбросить несохранённые изменения (смена закрыта, бэкап не нужен)"""
+        self.pending = 0
+        self.first_change_at = None
+        self.failures = 0
+        self._dirty.clear()
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            while self.pending:
+                remaining = self.first_change_at + self.max_delay - time.monotonic()
+                if remaining <= 0:
+                    self.flush()
+                    break
+                await asyncio.sleep(remaining)
+
+    def start(self):
+        """Запуск фоновой задачи сохранения"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+            logger.info(
+                f"🔄 Автосохранение запущено (каждые {self.max_changes} изм. "
+                f"или {int(self.max_delay * 1000)} мс)"
+            )
+
+    def stop(self):
+        """Остановка с финальной записью несохранённых изменений"""
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        self.flush()
+        logger.info(
+            f"🛑 Автосохранение остановлено (записей: {self.stats['writes']}, "
+            f"сэкономлено: {self.stats['writes_avoided']})"
+        )
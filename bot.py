@@ -1,54 +1,178 @@
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher, types, F, Router
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from aiogram.filters import Command, StateFilter
+import logging.handlers
+from aiogram import Bot, Dispatcher, types, Router
+from aiogram.types import (
+    InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery,
+    InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+)
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 import datetime
 import os
-import json
-import glob
+import time
 
 # Импортируем из отдельных файлов
 from config import Config
-from categories import CATEGORIES_DATA, PEOPLE_ITEMS, ONLINE_COMBO_ITEMS, INVITATION_ITEMS
 from models import SessionStates
-
-# Создание необходимых папок
-from config import Config
-Config.create_folders()
-
-# ====== ЛОГИРОВАНИЕ ======
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+from catalog import Catalog
+from shift import SessionManager, Cart, MAX_QUANTITY, item_qty
+from lifecycle import LifecycleManager
+from archive import ShiftArchive
+from guards import IdempotencyGuard
+from callbacks import CallbackDispatcher, Op
+from access import AccessControl, CALLBACK_ROLES, CASHIER, ADMIN, ROLE_LEVELS, ROLE_TITLES, parse_roles, user_key
+from events import EventSampler, EventsOnly, JsonEventFormatter, parse_sample_rates, start_queue_logging, log_event
+from shared_store import SQLiteStore, LeaderElection
+from fsm_storage import SQLiteFSMStorage
+from reports import (
+    format_currency, format_line, save_session_report, get_closed_sessions,
+    build_combined_report, build_metrics_report, build_receipts_report,
+    build_receipts_page, receipts_page_count,
+    build_timeline_report, build_period_timeline, build_cash_report,
+    build_summary_report, build_comparison_report, build_network_report, ReportCache
 )
+from dashboard import LiveDashboard
+from quicksale import parse_sell
+from pricing import DayCalendar
+from summaries import ShiftSummaries, PeriodTimelines, shift_key, summary_filename, summarize_metrics, save_shift_summary
+from export import save_session_sales, sales_filename, iter_period_shifts, write_export
+from scheduler import JobScheduler
+from network import NetworkPool, parse_venues, collect_network
+
 logger = logging.getLogger(__name__)
 
-# ====== ПРОВЕРКА КОНФИГУРАЦИИ ======
-if not Config.BOT_TOKEN:
-    logger.error("Токен бота не установлен!")
-    exit(1)
+# Обработчики регистрируются на роутере при импорте, а бот, диспетчер и
+# состояние смены создаются только в create_app()
+router = Router()
+# Кнопки: короткий код действия → обработчик (см. callbacks.py)
+callbacks = CallbackDispatcher()
 
-logger.info(f"Бот инициализирован с токеном: {Config.BOT_TOKEN[:10]}...")
+# ====== ЛОГИРОВАНИЕ ======
+def _rotating_handler(filename, config=Config):
+    # Лог-файл ротируется, чтобы не занимать весь диск на маленьких инстансах
+    if config.LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            filename, when=config.LOG_ROTATE_WHEN,
+            backupCount=config.LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    return logging.handlers.RotatingFileHandler(
+        filename, maxBytes=config.LOG_MAX_BYTES,
+        backupCount=config.LOG_BACKUP_COUNT, encoding='utf-8'
+    )
 
-# ====== НАСТРОЙКА БОТА ======
-bot = Bot(token=Config.BOT_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
-router = Router()
-dp.include_router(router)
+def setup_logging(config=Config):
+    """Настройка логирования процесса (вызывается из точки входа).
+
+    Обработчики работают в потоке QueueListener — запись в файл не блокирует
+    цикл событий. Возвращает listener, его нужно остановить при выходе.
+    """
+    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    handlers = [_rotating_handler(config.LOG_FILE, config), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    if config.LOG_EVENTS_FILE:
+        events_handler = _rotating_handler(config.LOG_EVENTS_FILE, config)
+        events_handler.addFilter(EventsOnly())
+        events_handler.setFormatter(JsonEventFormatter())
+        handlers.append(events_handler)
+    
+    sampler = EventSampler(parse_sample_rates(config.LOG_EVENT_SAMPLE_RATES))
+    return start_queue_logging(handlers, sampler)
+
+# ====== СБОРКА ПРИЛОЖЕНИЯ ======
+class App:
+    """Собранное приложение: бот, диспетчер и состояние смены"""
+    def __init__(self, config, bot, dp, session, catalog, archive, lifecycle, dashboard, election=None):
+        self.config = config
+        self.bot = bot
+        self.dp = dp
+        self.session = session
+        self.catalog = catalog
+        self.archive = archive
+        self.lifecycle = lifecycle
+        self.dashboard = dashboard
+        # Выбор лидера между воркерами (None — единственный процесс)
+        self.election = election
+        self.access = None
+        self.timelines = None
+        self.scheduler = None
+        self.network_pool = None
+
+def create_app(config=Config) -> App:
+    """Создание бота, диспетчера, хранилища, каталога и смены по требованию"""
+    started = time.perf_counter()
+    
+    if not config.BOT_TOKEN:
+        raise RuntimeError("Токен бота не установлен!")
+    
+    # Создание необходимых папок
+    config.create_folders()
+    
+    store = election = None
+    if config.SHARED_STORE_PATH:
+        store = SQLiteStore(config.SHARED_STORE_PATH)
+        election = LeaderElection(store, lease_seconds=config.LEADER_LEASE_SECONDS)
+        storage = SQLiteFSMStorage(store)
+    else:
+        storage = MemoryStorage()
+    
+    bot = Bot(token=config.BOT_TOKEN)
+    # Таблица кнопок проверяется до запуска: коды однозначны и укладываются в 64 байта
+    callbacks.codec.self_check()
+    dp = Dispatcher(storage=storage)
+    dp.include_router(router)
+    
+    lifecycle = LifecycleManager(drain_timeout=config.SHUTDOWN_DRAIN_TIMEOUT)
+    lifecycle.install(dp)
+    # Права проверяются раньше отсева дублей: отклонённое нажатие не считается выполненным
+    config_roles = parse_roles(config.ACCESS_ROLES)
+    if config.ADMIN_USERNAME:
+        config_roles.setdefault(user_key(config.ADMIN_USERNAME), ADMIN)
+    access = AccessControl(config_roles, default_role=config.ACCESS_DEFAULT_ROLE, store=store)
+    access.load()
+    access.install(dp)
+    IdempotencyGuard(window_seconds=config.CALLBACK_DEDUP_SECONDS).install(dp)
+    
+    session = SessionManager(config, store=store)
+    catalog = Catalog(calendar=DayCalendar(config.PRICING_HOLIDAYS.split(",")))
+    archive = ShiftArchive(config)
+    dashboard = LiveDashboard(session, interval=config.DASHBOARD_REFRESH_SECONDS)
+    summaries = ShiftSummaries(archive, cache_size=config.ARCHIVE_SUMMARY_CACHE_SIZE)
+    timelines = PeriodTimelines(archive, bucket_minutes=config.TIMELINE_BUCKET_MINUTES)
+    reports = ReportCache(size=config.REPORT_CACHE_SIZE)
+    # Площадки сводного отчёта: своя первой, затем остальные из NETWORK_VENUES
+    venues = [{"name": config.VENUE_NAME, "folder": config.CLOSED_SESSIONS_FOLDER, "store": None},
+              *parse_venues(config.NETWORK_VENUES)]
+    network_pool = NetworkPool(max_workers=min(len(venues), os.cpu_count() or 1))
+    
+    # Доступны обработчикам как аргументы session / catalog / archive / summaries / dashboard / config
+    dp["session"] = session
+    dp["catalog"] = catalog
+    dp["archive"] = archive
+    dp["summaries"] = summaries
+    dp["dashboard"] = dashboard
+    dp["config"] = config
+    dp["access"] = access
+    dp["timelines"] = timelines
+    dp["venues"] = venues
+    dp["network_pool"] = network_pool
+    dp["reports"] = reports
+    
+    logger.info(f"Бот инициализирован с токеном: {config.BOT_TOKEN[:10]}... "
+                f"({(time.perf_counter() - started) * 1000:.0f} мс)")
+    app = App(config, bot, dp, session, catalog, archive, lifecycle, dashboard, election)
+    app.access = access
+    app.timelines = timelines
+    app.network_pool = network_pool
+    app.scheduler = build_scheduler(app)
+    dp["scheduler"] = app.scheduler
+    return app
 
 # ====== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ======
-def format_currency(amount):
-    """Форматирование суммы с разделителями тысяч"""
-    return f"{amount:,.0f}₸".replace(",", ".")
-
 def validate_amount(text: str) -> tuple[bool, int | None]:
     """Валидация числового ввода (без проверки на положительное)"""
     try:
@@ -58,572 +182,335 @@ def validate_amount(text: str) -> tuple[bool, int | None]:
         return False, None
 
 async def safe_edit_message(message, text: str, reply_markup=None):
-    """Безопасное редактирование сообщения с fallback"""
+    """Безопасное редактирование сообщения с fallback.
+    
+    Возвращает False, если сообщение уже показывает этот текст и клавиатуру.
+    """
     try:
         await message.edit_text(text, reply_markup=reply_markup)
     except Exception as e:
+        if isinstance(e, TelegramBadRequest) and "message is not modified" in str(e):
+            return False
         logger.warning(f"Не удалось изменить сообщение: {e}")
         await message.answer(text, reply_markup=reply_markup)
-
-def save_session_report(session_data: dict) -> str:
-    """Сохранение отчета о смене в файл"""
-    try:
-        filename = f"{Config.CLOSED_SESSIONS_FOLDER}/смена_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        
-        report_content = f"""Астана, «Космопарк 01»
-Смена от: {session_data['open_time'].strftime('%d.%m.%Y %H:%M')}
-Закрыта: {datetime.datetime.now().strftime('%d.%m.%Y %H:%M')}
-Длительность: {str(session_data['close_time'] - session_data['open_time']).split('.')[0]}
-
-{session_data['combined_report']}
-
-{session_data['metrics_report']}
-
-{session_data['receipts_report']}
-"""
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(report_content)
-        
-        logger.info(f"Отчет сохранен в файл: {filename}")
-        return filename
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении отчета: {e}")
-        return None
-
-def get_closed_sessions():
-    """Получение списка закрытых смен за последние 30 дней"""
-    sessions = []
-    try:
-        # Получаем все txt файлы в папке закрытых смен
-        pattern = f"{Config.CLOSED_SESSIONS_FOLDER}/смена_*.txt"
-        files = glob.glob(pattern)
-        
-        # Фильтруем файлы за последние 30 дней
-        thirty_days_ago = datetime.datetime.now() - datetime.timedelta(days=30)
-        
-        for filepath in files:
-            try:
-                filename = os.path.basename(filepath)
-                # Извлекаем дату из имени файла
-                date_str = filename.replace('смена_', '').replace('.txt', '')[:8]
-                file_date = datetime.datetime.strptime(date_str, '%Y%m%d')
-                
-                if file_date >= thirty_days_ago:
-                    sessions.append({
-                        'filename': filename,
-                        'filepath': filepath,
-                        'date': file_date,
-                        'display_date': file_date.strftime('%d.%m.%Y')
-                    })
-            except Exception as e:
-                logger.warning(f"Ошибка обработки файла {filepath}: {e}")
-        
-        # Сортируем по дате (новые сверху)
-        sessions.sort(key=lambda x: x['date'], reverse=True)
-        return sessions
-        
-    except Exception as e:
-        logger.error(f"Ошибка при получении закрытых смен: {e}")
-        return []
-
-# ====== ДАННЫЕ СМЕНЫ И БЭКАПЫ ======
-class SessionManager:
-    def __init__(self):
-        self.is_open = False
-        self.sales = []
-        self.cart = []
-        self.mixed_amount = None
-        self.custom_item_temp = None
-        self.item_mapping = {}
-        self.open_time = None
-        self.last_report_type = None
-        self.exchange_cash = 0
-        self.auto_save_task = None
-    
-    def reset(self):
-        self.is_open = False
-        self.sales = []
-        self.cart = []
-        self.mixed_amount = None
-        self.custom_item_temp = None
-        self.open_time = None
-        self.last_report_type = None
-        self.exchange_cash = 0
-    
-    def get_cart_total(self):
-        """Возвращает общую сумму корзины"""
-        return sum(item["price"] for item in self.cart)
-    
-    def add_sale(self, items, cash_amount=0, cashless_amount=0):
-        """Добавление продажи"""
-        sale = {
-            "id": len(self.sales) + 1,
-            "items": items.copy(),
-            "cash_amount": cash_amount,
-            "cashless_amount": cashless_amount,
-            "time": datetime.datetime.now(),
-            "total": cash_amount + cashless_amount
-        }
-        self.sales.append(sale)
-    
-    def save_backup(self):
-        """Сохранение резервной копии открытой смены"""
-        try:
-            if self.is_open:
-                backup_data = {
-                    'is_open': self.is_open,
-                    'sales': self.sales,
-                    'exchange_cash': self.exchange_cash,
-                    'open_time': self.open_time.isoformat() if self.open_time else None,
-                    'last_backup': datetime.datetime.now().isoformat()
-                }
-                
-                # Создаем папку для бэкапов если её нет
-                os.makedirs(Config.BACKUP_FOLDER, exist_ok=True)
-                
-                backup_file = f"{Config.BACKUP_FOLDER}/session_backup.json"
-                with open(backup_file, 'w', encoding='utf-8') as f:
-                    json.dump(backup_data, f, ensure_ascii=False, indent=2, default=str)
-                
-                logger.info("✅ Бэкап смены сохранен")
-                return True
-                
-        except Exception as e:
-            logger.error(f"❌ Ошибка при сохранении бэкапа: {e}")
-            return False
-    
-    def load_backup(self):
-        """Загрузка последней резервной копии"""
-        try:
-            backup_file = f"{Config.BACKUP_FOLDER}/session_backup.json"
-            if os.path.exists(backup_file):
-                with open(backup_file, 'r', encoding='utf-8') as f:
-                    backup_data = json.load(f)
-                
-                # Конвертируем время из строки обратно в datetime
-                if backup_data.get('open_time'):
-                    backup_data['open_time'] = datetime.datetime.fromisoformat(backup_data['open_time'])
-                
-                logger.info("✅ Бэкап смены загружен")
-                return backup_data
-                
-        except Exception as e:
-            logger.error(f"❌ Ошибка при загрузке бэкапа: {e}")
-        
-        return None
-    
-    def restore_session(self):
-        """Восстановление сессии из бэкапа"""
-        backup_data = self.load_backup()
-        if backup_data and backup_data.get('is_open'):
-            self.is_open = True
-            self.sales = backup_data.get('sales', [])
-            self.exchange_cash = backup_data.get('exchange_cash', 0)
-            self.open_time = backup_data.get('open_time')
-            
-            last_backup = backup_data.get('last_backup', 'неизвестно')
-            logger.info(f"🔄 Восстановлена открытая смена из бэкапа от {last_backup}")
-            return True
-        
-        return False
-    
-    def delete_backup(self):
-        """Удаление файла бэкапа (при корректном закрытии смены)"""
-        try:
-            backup_file = f"{Config.BACKUP_FOLDER}/session_backup.json"
-            if os.path.exists(backup_file):
-                os.remove(backup_file)
-                logger.info("🗑️ Бэкап смены удален")
-                return True
-        except Exception as e:
-            logger.error(f"❌ Ошибка при удалении бэкапа: {e}")
-        
-        return False
-    
-    async def start_auto_save(self, interval_seconds=120):
-        """Запуск автоматического сохранения"""
-        async def auto_save_loop():
-            while True:
-                await asyncio.sleep(interval_seconds)
-                if self.is_open:
-                    self.save_backup()
-                    logger.debug("🔄 Автосохранение выполнено")
-        
-        self.auto_save_task = asyncio.create_task(auto_save_loop())
-        logger.info(f"🔄 Автосохранение запущено (интервал: {interval_seconds}сек)")
-    
-    def stop_auto_save(self):
-        """Остановка автоматического сохранения"""
-        if self.auto_save_task:
-            self.auto_save_task.cancel()
-            logger.info("🛑 Автосохранение остановлено")
-
-session = SessionManager()
-
-# ====== ИНИЦИАЛИЗАЦИЯ КАТЕГОРИЙ ======
-CATEGORIES_IDS = {}
-ITEMS_MAPPING = {}
-
-for i, (category_name, items) in enumerate(CATEGORIES_DATA.items()):
-    cat_id = f"cat{i}"
-    CATEGORIES_IDS[cat_id] = category_name
-    
-    for j, (item_name, price) in enumerate(items.items()):
-        item_id = f"item{i}_{j}"
-        ITEMS_MAPPING[item_id] = {
-            "name": item_name,
-            "price": price,
-            "category": category_name
-        }
-
-session.item_mapping = ITEMS_MAPPING
+    return True
 
 # ====== ИНЛАЙН КЛАВИАТУРЫ ======
-def get_main_kb():
-    buttons = [
-        [InlineKeyboardButton(text="🎬 Открыть смену", callback_data="open_shift")],
-        [InlineKeyboardButton(text="➕ Продажа", callback_data="start_sale")],
-        [InlineKeyboardButton(text="💵 Внести размен", callback_data="add_exchange")],
-        [InlineKeyboardButton(text="📊 Отчёт", callback_data="show_report")],
-        [InlineKeyboardButton(text="📋 Архив смен", callback_data="session_archive")],
+def cached_per_role(build):
+    """Клавиатура, зависящая только от роли, собирается один раз на роль"""
+    cache = {}
+    def get(role):
+        markup = cache.get(role)
+        if markup is None:
+            markup = cache[role] = build(role)
+        return markup
+    return get
+
+def role_buttons(role, rows):
+    """Строки (кнопка, код действия) без недоступных роли"""
+    return [
+        [InlineKeyboardButton(text=text, callback_data=data)]
+        for text, op, data in rows
+        if AccessControl.allows(role, CALLBACK_ROLES.get(op, CASHIER))
     ]
-    if Config.ADMIN_USERNAME:
-        buttons.append([InlineKeyboardButton(text="↩️ Возврат", callback_data="refund_menu")])
-    buttons.append([InlineKeyboardButton(text="✅ Закрыть смену", callback_data="close_shift")])
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_categories_kb():
+@cached_per_role
+def get_main_kb(role):
+    return InlineKeyboardMarkup(inline_keyboard=role_buttons(role, [
+        ("🎬 Открыть смену", Op.OPEN_SHIFT, callbacks.pack(Op.OPEN_SHIFT)),
+        ("➕ Продажа", Op.START_SALE, callbacks.pack(Op.START_SALE)),
+        ("💵 Касса", Op.CASH_MENU, callbacks.pack(Op.CASH_MENU)),
+        ("📊 Отчёт", Op.REPORT, callbacks.pack(Op.REPORT)),
+        ("📋 Архив смен", Op.ARCHIVE, callbacks.pack(Op.ARCHIVE)),
+        ("↩️ Возврат", Op.REFUND_MENU, callbacks.pack(Op.REFUND_MENU)),
+        ("✅ Закрыть смену", Op.CLOSE_SHIFT, callbacks.pack(Op.CLOSE_SHIFT)),
+    ]))
+
+@cached_per_role
+def get_cash_kb(role):
+    return InlineKeyboardMarkup(inline_keyboard=role_buttons(role, [
+        ("🔄 Внести размен", Op.ADD_EXCHANGE, callbacks.pack(Op.ADD_EXCHANGE)),
+        ("💸 Выплата из кассы", Op.ADD_PAYOUT, callbacks.pack(Op.ADD_PAYOUT)),
+        ("🧮 Пересчёт кассы", Op.COUNT_CASH, callbacks.pack(Op.COUNT_CASH)),
+        ("⬅️ Назад", Op.MAIN_MENU, callbacks.pack(Op.MAIN_MENU)),
+    ]))
+
+def get_categories_kb(catalog: Catalog):
     buttons = []
-    for cat_id, cat_name in CATEGORIES_IDS.items():
-        buttons.append([InlineKeyboardButton(text=cat_name, callback_data=f"cat_{cat_id}")])
-    buttons.append([InlineKeyboardButton(text="🛒 Корзина", callback_data="show_cart")])
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="main_menu")])
+    for cat_id, cat_name in catalog.categories.items():
+        buttons.append([InlineKeyboardButton(text=cat_name, callback_data=callbacks.pack(Op.CATEGORY, category_id=cat_id))])
+    # Поиск по названию через inline-режим в этом же чате
+    buttons.append([InlineKeyboardButton(text="🔎 Поиск товара", switch_inline_query_current_chat="")])
+    buttons.append([InlineKeyboardButton(text="🛒 Корзина", callback_data=callbacks.pack(Op.SHOW_CART))])
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=callbacks.pack(Op.MAIN_MENU))])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_items_kb(category_id: str):
-    if category_id not in CATEGORIES_IDS:
-        return get_categories_kb()
+def get_items_kb(catalog: Catalog, category_id: str):
+    if category_id not in catalog.categories:
+        return get_categories_kb(catalog)
     
-    category_name = CATEGORIES_IDS[category_id]
     buttons = []
     
-    for item_id, item_data in ITEMS_MAPPING.items():
-        if item_data["category"] == category_name:
-            if item_data["price"] == "custom":
-                price_display = "⚡ Задать название и цену"
-            elif item_data["price"] == 0:
-                price_display = "БЕСПЛАТНО"
-            else:
-                price_display = f"{format_currency(item_data['price'])}"
-                
-            buttons.append([InlineKeyboardButton(
-                text=f"{item_data['name']} - {price_display}", 
-                callback_data=f"item_{item_id}"
-            )])
-    
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_categories")])
-    buttons.append([InlineKeyboardButton(text="🛒 Корзина", callback_data="show_cart")])
+    for item_id, item_data in catalog.category_items(category_id):
+        # Цена на сегодня (будний день или выходной/праздник)
+        _, price = catalog.resolve(item_id)
+        if price == "custom":
+            price_display = "⚡ Задать название и цену"
+        elif price == 0:
+            price_display = "БЕСПЛАТНО"
+        else:
+            price_display = f"{format_currency(price)}"
+            
+        buttons.append([InlineKeyboardButton(
+            text=f"{item_data['name']} - {price_display}", 
+            callback_data=callbacks.pack(Op.ITEM, item_id=item_id)
+        )])
+    
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=callbacks.pack(Op.CATEGORIES))])
+    buttons.append([InlineKeyboardButton(text="🛒 Корзина", callback_data=callbacks.pack(Op.SHOW_CART))])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 def get_cart_kb():
     buttons = [
-        [InlineKeyboardButton(text="💵 Оплата наличными", callback_data="payment_cash")],
-        [InlineKeyboardButton(text="💳 Оплата картой", callback_data="payment_card")],
-        [InlineKeyboardButton(text="💱 Смешанная оплата", callback_data="payment_mixed")],
-        [InlineKeyboardButton(text="🗑 Удалить позиции", callback_data="remove_items")],
-        [InlineKeyboardButton(text="🔄 Продолжить покупки", callback_data="back_to_categories")],
-        [InlineKeyboardButton(text="🗑 Очистить корзину", callback_data="clear_cart")]
+        [InlineKeyboardButton(text="💵 Оплата наличными", callback_data=callbacks.pack(Op.PAY_CASH))],
+        [InlineKeyboardButton(text="💳 Оплата картой", callback_data=callbacks.pack(Op.PAY_CARD))],
+        [InlineKeyboardButton(text="💱 Смешанная оплата", callback_data=callbacks.pack(Op.PAY_MIXED))],
+        [InlineKeyboardButton(text="✏️ Изменить количество", callback_data=callbacks.pack(Op.QTY_EDITOR))],
+        [InlineKeyboardButton(text="🔄 Продолжить покупки", callback_data=callbacks.pack(Op.CATEGORIES))],
+        [InlineKeyboardButton(text="🗑 Очистить корзину", callback_data=callbacks.pack(Op.CLEAR_CART))]
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_remove_items_kb():
+def get_remove_items_kb(session: SessionManager):
     buttons = []
-    for i, item in enumerate(session.cart, 1):
-        price_display = "БЕСПЛАТНО" if item["price"] == 0 else f"{format_currency(item['price'])}"
+    for key, line in session.cart:
         buttons.append([
-            InlineKeyboardButton(
-                text=f"❌ {i}. {item['item']} - {price_display}", 
-                callback_data=f"remove_{i-1}"
-            )
+            InlineKeyboardButton(text="➖", callback_data=callbacks.pack(Op.QTY_DEC, key=key)),
+            InlineKeyboardButton(text=f"✏️ {line['item']} ×{line['qty']}", callback_data=callbacks.pack(Op.QTY_SET, key=key)),
+            InlineKeyboardButton(text="➕", callback_data=callbacks.pack(Op.QTY_INC, key=key))
         ])
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад к корзине", callback_data="show_cart")])
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад к корзине", callback_data=callbacks.pack(Op.SHOW_CART))])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_report_kb():
+@cached_per_role
+def get_report_kb(role):
+    return InlineKeyboardMarkup(inline_keyboard=role_buttons(role, [
+        ("🧾 Детализация по чекам", Op.REPORT_RECEIPTS, callbacks.pack(Op.REPORT_RECEIPTS, page=0)),
+        ("📈 Отчёт по показателям", Op.REPORT_METRICS, callbacks.pack(Op.REPORT_METRICS)),
+        ("⏱ По времени", Op.REPORT_TIMELINE, callbacks.pack(Op.REPORT_TIMELINE)),
+        ("📌 Живой отчёт", Op.DASHBOARD_PIN, callbacks.pack(Op.DASHBOARD_PIN)),
+        ("⬅️ Назад", Op.MAIN_MENU, callbacks.pack(Op.MAIN_MENU)),
+    ]))
+
+def get_receipts_kb(page: int, pages: int, role: str):
+    """Отчётное меню с листанием детализации (страница 0 — последние чеки)"""
+    nav = []
+    if page + 1 < pages:
+        nav.append(InlineKeyboardButton(text="⬅️ Раньше", callback_data=callbacks.pack(Op.REPORT_RECEIPTS, page=page + 1)))
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="Позже ➡️", callback_data=callbacks.pack(Op.REPORT_RECEIPTS, page=page - 1)))
+    keyboard = get_report_kb(role).inline_keyboard
+    return InlineKeyboardMarkup(inline_keyboard=[nav, *keyboard] if nav else keyboard)
+
+def get_dashboard_kb():
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🧾 Детализация по чекам", callback_data="report_receipts")],
-        [InlineKeyboardButton(text="📈 Отчёт по показателям", callback_data="report_metrics")],
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data="main_menu")]
+        [InlineKeyboardButton(text="❌ Открепить", callback_data=callbacks.pack(Op.DASHBOARD_UNPIN))]
     ])
 
-def get_refund_kb():
+def get_refund_kb(session: SessionManager):
     buttons = []
     for sale in session.sales[-20:]:
         time_str = sale["time"].strftime("%H:%M") if isinstance(sale["time"], datetime.datetime) else sale["time"][11:16]
         buttons.append([
             InlineKeyboardButton(
                 text=f"🧾 Чек #{sale['id']} ({time_str}) - {format_currency(sale['total'])}",
-                callback_data=f"refund_{sale['id']}"
+                callback_data=callbacks.pack(Op.REFUND_SALE, sale_id=sale['id'])
             )
         ])
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="main_menu")])
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=callbacks.pack(Op.MAIN_MENU))])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_session_archive_kb():
-    """Клавиатура для архива смен"""
-    sessions = get_closed_sessions()
+def get_session_archive_kb(archive: ShiftArchive, compare_with=None):
+    """Клавиатура для архива смен (просмотр сводки или выбор смены для сравнения с compare_with)"""
+    sessions = get_closed_sessions(archive)
     buttons = []
-    for session_data in sessions[:10]:  # Показываем последние 10 смен
+    shown = 0
+    for session_data in sessions:
+        key = shift_key(session_data['filename'])
+        if key == compare_with:
+            continue
         buttons.append([
             InlineKeyboardButton(
-                text=f"📅 {session_data['display_date']}",
-                callback_data=f"archive_{session_data['filename']}"
+                text=f"📅 {session_data['display_date']} {key[9:11]}:{key[11:13]}",
+                callback_data=(
+                    callbacks.pack(Op.ARCHIVE_COMPARE, first_key=compare_with, second_key=key)
+                    if compare_with else callbacks.pack(Op.ARCHIVE_VIEW, key=key)
+                )
             )
         ])
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="main_menu")])
+        shown += 1
+        if shown == 10:  # Показываем последние 10 смен
+            break
+    back = callbacks.pack(Op.ARCHIVE_VIEW, key=compare_with) if compare_with else callbacks.pack(Op.MAIN_MENU)
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=back)])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-# ====== ФУНКЦИИ ОТЧЕТОВ ======
-def build_combined_report() -> str:
-    """Объединенный отчет: общая статистика + категории"""
-    total_cash_sales = sum(sale["cash_amount"] for sale in session.sales)
-    total_cashless = sum(sale["cashless_amount"] for sale in session.sales)
-    total_revenue = total_cash_sales + total_cashless
-    total_items = sum(len(sale["items"]) for sale in session.sales)
-    
-    # Статистика по категориям
-    category_stats = {}
-    for sale in session.sales:
-        for item in sale["items"]:
-            category = item["category"]
-            item_name = item["item"]
-            price = item["price"]
-            
-            if category not in category_stats:
-                category_stats[category] = {"items": {}, "total_count": 0, "total_revenue": 0}
-            
-            if item_name not in category_stats[category]["items"]:
-                category_stats[category]["items"][item_name] = {"count": 0, "revenue": 0}
-            
-            category_stats[category]["items"][item_name]["count"] += 1
-            category_stats[category]["items"][item_name]["revenue"] += price
-            category_stats[category]["total_count"] += 1
-            category_stats[category]["total_revenue"] += price
-    
-    report_text = f"""📊 ОБЩИЙ ОТЧЁТ С КАТЕГОРИЯМИ
-
-Астана, «Космопарк 01»
-{datetime.datetime.now().strftime('Сегодня %d.%m.%Y')}
-С 10:00 до {datetime.datetime.now().strftime('%H:%M')}
-
-💵 Наличные: {format_currency(total_cash_sales)}
-💳 Безналичные: {format_currency(total_cashless)}
-💰 Общая выручка: {format_currency(total_revenue)}
-💵 Размен: {format_currency(session.exchange_cash)}
-📊 Количество чеков: {len(session.sales)}
-🛒 Всего позиций: {total_items} шт.
-
-📦 ДЕТАЛИЗАЦИЯ ПО КАТЕГОРИЯМ:
-"""
-    
-    for category, stats in sorted(category_stats.items()):
-        report_text += f"\n▶ {category}:\n"
-        report_text += f"   📊 Позиций: {stats['total_count']} шт.\n"
-        report_text += f"   💰 Выручка: {format_currency(stats['total_revenue'])}\n"
-        
-        for item_name, item_data in sorted(stats["items"].items()):
-            if item_data['revenue'] == 0:
-                report_text += f"   • {item_name}: {item_data['count']} шт. (бесплатно)\n"
-            else:
-                avg_price = item_data['revenue'] / item_data['count']
-                report_text += f"   • {item_name}: {item_data['count']} шт. × {format_currency(avg_price)} = {format_currency(item_data['revenue'])}\n"
-    
-    return report_text
-
-def build_metrics_report() -> str:
-    """Отчет по показателям текущей смены"""
-    # Статистика по всем продажам (учитываем возвраты)
-    total_people = 0
-    total_online_combo = 0
-    total_invitations = 0
-    total_partners = 0
-    total_bloggers = 0
-    
-    # Выручка по типам (учитываем возвраты)
-    допы_revenue = 0
-    магазин_revenue = 0
-    
-    # Для среднего чека магазина - считаем только людей, купивших что-то в магазине
-    магазин_покупатели = 0
-    
-    for sale in session.sales:
-        # Проверяем, есть ли в чеке товары магазина
-        has_shop_items = any(item["category"] in ["📝 Другие позиции", "📝 Свободные позиции"] for item in sale["items"])
-        
-        for item in sale["items"]:
-            item_name = item["item"]
-            price = item["price"]  # Уже учитывает возвраты (отрицательные значения)
-            category = item["category"]
-            
-            # Подсчет людей (только положительные продажи)
-            if item_name in PEOPLE_ITEMS and price >= 0:
-                total_people += 1
-            
-            # Подсчет онлайн комбо (только положительные)
-            if item_name in ONLINE_COMBO_ITEMS and price >= 0:
-                total_online_combo += 1
-            
-            # Подсчет пригласительных (только положительные)
-            if item_name in INVITATION_ITEMS and price >= 0:
-                total_invitations += 1
-            
-            # Подсчет партнеров (только положительные)
-            if item_name == "Партнёр" and price >= 0:
-                total_partners += 1
-            
-            # Подсчет блогеров (только положительные)
-            if item_name == "Блогер" and price >= 0:
-                total_bloggers += 1
-            
-            # РАСПРЕДЕЛЕНИЕ ВЫРУЧКИ (учитываем все, включая возвраты)
-            if category in ["📍 Локации", "🍿 Комбо"]:
-                допы_revenue += price
-            elif category in ["📝 Другие позиции", "📝 Свободные позиции"]:
-                магазин_revenue += price
-                # Если это положительная продажа магазина, считаем покупателя
-                if price > 0 and has_shop_items:
-                    магазин_покупатели += 1
-    
-    # Расчет выручки (уже учитывает возвраты)
-    total_revenue = sum(sale['total'] for sale in session.sales)
-    
-    # Расчет средних чеков
-    total_dops_magazin = допы_revenue + магазин_revenue
-    avg_check_total = total_dops_magazin / total_people if total_people > 0 else 0
-    avg_check_shop = магазин_revenue / магазин_покупатели if магазин_покупатели > 0 else 0
-    
-    report_text = f"""📈 ОТЧЁТ ПО ПОКАЗАТЕЛЯМ
-
-Астана, «Космопарк 01»
-{datetime.datetime.now().strftime('Сегодня %d.%m.%Y')}
-С 10:00 до {datetime.datetime.now().strftime('%H:%M')}
-
-👥 Всего людей: {total_people} чел.
-💰 Общая выручка: {format_currency(total_revenue)}
-🎯 Выручка допов + магазин: {format_currency(total_dops_magazin)}
-🛍️ Выручка магазина: {format_currency(магазин_revenue)}
-📊 Средний чек: {format_currency(avg_check_total)}
-🛒 Средний чек магазина: {format_currency(avg_check_shop)}
-
-📱 Онлайн комбо: {total_online_combo} шт.
-🎫 Пригласительные: {total_invitations} шт.
-🤝 Партнеры: {total_partners} шт.
-📸 Блогеры: {total_bloggers} шт.
-"""
-    
-    return report_text
-
-def build_receipts_report() -> str:
-    """Детализация по чекам текущей смены"""
-    if not session.sales:
-        return "📋 Детализация по чекам\n\n📭 Чеков пока нет"
-    
-    report_text = "📋 Детализация по чекам\n\n"
-    for i, sale in enumerate(session.sales, 1):
-        time_str = sale["time"].strftime("%H:%M:%S")
-        payment_type = ""
-        if sale["cash_amount"] > 0 and sale["cashless_amount"] > 0:
-            payment_type = f"💱 Смешанная ({format_currency(sale['cash_amount'])} нал + {format_currency(sale['cashless_amount'])} безнал)"
-        elif sale["cash_amount"] > 0:
-            payment_type = "💵 Наличные"
-        elif sale["cashless_amount"] > 0:
-            payment_type = "💳 Карта"
-        else:
-            payment_type = "🎁 Бесплатно"
-        
-        report_text += f"🧾 Чек #{i} ({time_str})\n"
-        report_text += f"   {payment_type}\n"
-        report_text += f"   💰 Сумма: {format_currency(sale['total'])}\n"
-        report_text += f"   📦 Позиций: {len(sale['items'])} шт.\n"
-        
-        for j, item in enumerate(sale["items"], 1):
-            price_display = "БЕСПЛАТНО" if item["price"] == 0 else f"{format_currency(item['price'])}"
-            report_text += f"      {j}. {item['item']} - {price_display}\n"
-        report_text += "\n"
-    
-    return report_text
+def get_archive_view_kb(key: str):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⚖️ Сравнить с другой сменой", callback_data=callbacks.pack(Op.ARCHIVE_PICK, key=key))],
+        [InlineKeyboardButton(text="📄 Полный отчёт файлом", callback_data=callbacks.pack(Op.ARCHIVE_FILE, key=key))],
+        [InlineKeyboardButton(text="⬅️ К архиву", callback_data=callbacks.pack(Op.ARCHIVE))]
+    ])
 
 # ====== ОСНОВНЫЕ ОБРАБОТЧИКИ ======
-@dp.message(Command("start"))
-async def start_command(message: types.Message):
+@router.message(Command("start"))
+async def start_command(message: types.Message, role: str):
     await message.answer(
         "🎭 Добро пожаловать в бот для учёта продажи билетов!\n\nВыберите действие:",
-        reply_markup=get_main_kb()
+        reply_markup=get_main_kb(role)
     )
 
 # ====== ОБРАБОТЧИКИ CALLBACK ======
-@dp.callback_query(F.data == "main_menu")
-async def main_menu_handler(callback: CallbackQuery):
+@router.callback_query()
+async def callback_dispatch_handler(callback: CallbackQuery, **data):
+    """Единая точка входа для кнопок: разбор callback_data и вызов по коду"""
+    await callbacks.dispatch(callback, data)
+
+@callbacks(Op.MAIN_MENU)
+async def main_menu_handler(callback: CallbackQuery, role: str):
     await safe_edit_message(
         callback.message,
         "🎭 Главное меню\n\nВыберите действие:",
-        get_main_kb()
+        get_main_kb(role)
     )
     await callback.answer()
 
-@dp.callback_query(F.data == "open_shift")
-async def open_shift_handler(callback: CallbackQuery):
-    if session.is_open:
-        await callback.answer("❌ Смена уже открыта!", show_alert=True)
-        return
-    
-    session.is_open = True
-    session.sales = []
-    session.cart = []
-    session.open_time = datetime.datetime.now()
-    session.exchange_cash = 0
-    
-    # Сохраняем бэкап при открытии смены
-    session.save_backup()
+@callbacks(Op.OPEN_SHIFT)
+async def open_shift_handler(callback: CallbackQuery, session: SessionManager, role: str):
+    async with session.lock:
+        if session.is_open:
+            await callback.answer("❌ Смена уже открыта!", show_alert=True)
+            return
+        
+        session.reset()
+        session.is_open = True
+        session.open_time = datetime.datetime.now()
+        
+        # Сохраняем бэкап при открытии смены
+        session.mark_dirty()
+        log_event(logger, "shift_opened", "🎬 Смена открыта", user=callback.from_user.username)
     
     await safe_edit_message(
         callback.message,
         "✅ Смена открыта!\n\nВыберите действие:",
-        get_main_kb()
+        get_main_kb(role)
     )
     await callback.answer()
 
-@dp.callback_query(F.data == "add_exchange")
-async def add_exchange_handler(callback: CallbackQuery, state: FSMContext):
+# ====== ОБРАБОТЧИКИ КАССЫ ======
+@callbacks(Op.CASH_MENU)
+async def cash_menu_handler(callback: CallbackQuery, session: SessionManager, role: str):
     if not session.is_open:
         await callback.answer("❌ Сначала откройте смену!", show_alert=True)
         return
     
-    await callback.message.answer("💵 Введите сумму размена:")
+    await safe_edit_message(callback.message, build_cash_report(session), get_cash_kb(role))
+    await callback.answer()
+
+@callbacks(Op.ADD_EXCHANGE)
+async def add_exchange_handler(callback: CallbackQuery, state: FSMContext, session: SessionManager):
+    if not session.is_open:
+        await callback.answer("❌ Сначала откройте смену!", show_alert=True)
+        return
+    
+    await callback.message.answer("💵 Введите сумму размена (пополнения прибавляются):")
     await state.set_state(SessionStates.waiting_exchange_cash)
     await callback.answer()
 
-@dp.message(SessionStates.waiting_exchange_cash)
-async def process_exchange_cash(message: types.Message, state: FSMContext):
+@router.message(SessionStates.waiting_exchange_cash)
+async def process_exchange_cash(message: types.Message, state: FSMContext, session: SessionManager, role: str):
     is_valid, exchange_amount = validate_amount(message.text)
     if not is_valid:
         await message.answer("❌ Пожалуйста, введите корректное число:")
         return
+    if not session.is_open:
+        await message.answer("❌ Смена не открыта!", reply_markup=get_main_kb(role))
+        await state.clear()
+        return
     
-    session.exchange_cash = exchange_amount
+    session.ledger.add_exchange(exchange_amount)
     
     # Сохраняем бэкап после внесения размена
-    session.save_backup()
+    session.mark_dirty()
     
     await message.answer(
-        f"✅ Размен внесен!\n💵 Сумма: {format_currency(exchange_amount)}",
-        reply_markup=get_main_kb()
+        f"✅ Размен внесен!\n💵 Сумма: {format_currency(exchange_amount)}\n"
+        f"🔄 Всего размена: {format_currency(session.exchange_cash)}",
+        reply_markup=get_cash_kb(role)
     )
     await state.clear()
 
-@dp.callback_query(F.data == "start_sale")
-async def start_sale_handler(callback: CallbackQuery):
+@callbacks(Op.ADD_PAYOUT)
+async def add_payout_handler(callback: CallbackQuery, state: FSMContext, session: SessionManager):
+    if not session.is_open:
+        await callback.answer("❌ Сначала откройте смену!", show_alert=True)
+        return
+    
+    await callback.message.answer("💸 Введите сумму выплаты и через пробел комментарий (необязательно):")
+    await state.set_state(SessionStates.waiting_payout)
+    await callback.answer()
+
+@router.message(SessionStates.waiting_payout)
+async def process_payout(message: types.Message, state: FSMContext, session: SessionManager, role: str):
+    amount_text, _, note = (message.text or "").strip().partition(" ")
+    is_valid, amount = validate_amount(amount_text)
+    if not is_valid or amount <= 0:
+        await message.answer("❌ Введите положительную сумму выплаты:")
+        return
+    if not session.is_open:
+        await message.answer("❌ Смена не открыта!", reply_markup=get_main_kb(role))
+        await state.clear()
+        return
+    
+    session.ledger.add_payout(amount, note.strip() or None)
+    session.mark_dirty()
+    
+    await message.answer(
+        f"✅ Выплата записана: {format_currency(amount)}\n"
+        f"🧮 Ожидается в кассе: {format_currency(session.ledger.expected)}",
+        reply_markup=get_cash_kb(role)
+    )
+    await state.clear()
+
+@callbacks(Op.COUNT_CASH)
+async def count_cash_handler(callback: CallbackQuery, state: FSMContext, session: SessionManager):
+    if not session.is_open:
+        await callback.answer("❌ Сначала откройте смену!", show_alert=True)
+        return
+    
+    await callback.message.answer("🧮 Пересчитайте наличные в кассе и введите сумму:")
+    await state.set_state(SessionStates.waiting_cash_count)
+    await callback.answer()
+
+@router.message(SessionStates.waiting_cash_count)
+async def process_cash_count(message: types.Message, state: FSMContext, session: SessionManager, role: str):
+    is_valid, amount = validate_amount(message.text)
+    if not is_valid or amount < 0:
+        await message.answer("❌ Введите сумму наличных в кассе:")
+        return
+    if not session.is_open:
+        await message.answer("❌ Смена не открыта!", reply_markup=get_main_kb(role))
+        await state.clear()
+        return
+    
+    session.ledger.record_count(amount)
+    session.mark_dirty()
+    
+    await message.answer(build_cash_report(session), reply_markup=get_cash_kb(role))
+    await state.clear()
+
+@callbacks(Op.START_SALE)
+async def start_sale_handler(callback: CallbackQuery, session: SessionManager, catalog: Catalog):
     if not session.is_open:
         await callback.answer("❌ Сначала откройте смену!", show_alert=True)
         return
@@ -631,42 +518,40 @@ async def start_sale_handler(callback: CallbackQuery):
     await safe_edit_message(
         callback.message,
         "🛍 Выберите категорию:",
-        get_categories_kb()
+        get_categories_kb(catalog)
     )
     await callback.answer()
 
-@dp.callback_query(F.data == "back_to_categories")
-async def back_to_categories_handler(callback: CallbackQuery):
+@callbacks(Op.CATEGORIES)
+async def back_to_categories_handler(callback: CallbackQuery, catalog: Catalog):
     await safe_edit_message(
         callback.message,
         "🛍 Выберите категорию:",
-        get_categories_kb()
+        get_categories_kb(catalog)
     )
     await callback.answer()
 
-@dp.callback_query(F.data.startswith("cat_"))
-async def category_handler(callback: CallbackQuery):
-    category_id = callback.data.replace("cat_", "")
-    if category_id not in CATEGORIES_IDS:
+@callbacks(Op.CATEGORY, category_id=str)
+async def category_handler(callback: CallbackQuery, catalog: Catalog, category_id: str):
+    if category_id not in catalog.categories:
         await callback.answer("❌ Категория не найдена!", show_alert=True)
         return
     
-    category_name = CATEGORIES_IDS[category_id]
+    category_name = catalog.categories[category_id]
     await safe_edit_message(
         callback.message,
         f"📁 {category_name}\n\nВыберите товар:",
-        get_items_kb(category_id)
+        get_items_kb(catalog, category_id)
     )
     await callback.answer()
 
-@dp.callback_query(F.data.startswith("item_"))
-async def item_handler(callback: CallbackQuery, state: FSMContext):
-    item_id = callback.data.replace("item_", "")
-    if item_id not in ITEMS_MAPPING:
+@callbacks(Op.ITEM, item_id=str)
+async def item_handler(callback: CallbackQuery, state: FSMContext, session: SessionManager, catalog: Catalog, item_id: str):
+    if item_id not in catalog.items:
         await callback.answer("❌ Товар не найден!", show_alert=True)
         return
     
-    item_data = ITEMS_MAPPING[item_id]
+    item_data = catalog.items[item_id]
     
     if item_data["price"] == "custom":
         session.custom_item_temp = {"category": item_data["category"]}
@@ -675,106 +560,136 @@ async def item_handler(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
         return
     
-    session.cart.append({
-        "item": item_data["name"],
-        "price": item_data["price"],
-        "category": item_data["category"],
-        "item_id": item_id
-    })
+    name, price = catalog.resolve(item_id)
+    key = session.cart.add(item_id, name, price, item_data["category"])
+    session.mark_dirty()
     
-    cart_count = len(session.cart)
+    cart_count = session.cart.count
     cart_total = session.get_cart_total()
     
-    price_display = "БЕСПЛАТНО" if item_data["price"] == 0 else f"{format_currency(item_data['price'])}"
-    
     await safe_edit_message(
         callback.message,
-        f"✅ Добавлено: {item_data['name']} - {price_display}\n\n"
+        f"✅ Добавлено: {format_line(session.cart.lines[key])}\n\n"
         f"🛒 В корзине: {cart_count} позиций на сумму {format_currency(cart_total)}\n\n"
         f"Выберите следующую категорию:",
-        get_categories_kb()
+        get_categories_kb(catalog)
     )
-    await callback.answer(f"✅ {item_data['name']} добавлен в корзину!")
+    await callback.answer(f"✅ {name} добавлен в корзину!")
 
 # ====== ОБРАБОТЧИК КОРЗИНЫ ======
-@dp.callback_query(F.data == "show_cart")
-async def show_cart_handler(callback: CallbackQuery):
+@callbacks(Op.SHOW_CART)
+async def show_cart_handler(callback: CallbackQuery, session: SessionManager):
     if not session.cart:
         await safe_edit_message(
             callback.message,
             "🛒 Корзина пуста",
             InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🛍 К покупкам", callback_data="back_to_categories")],
-                [InlineKeyboardButton(text="⬅️ Назад", callback_data="main_menu")]
+                [InlineKeyboardButton(text="🛍 К покупкам", callback_data=callbacks.pack(Op.CATEGORIES))],
+                [InlineKeyboardButton(text="⬅️ Назад", callback_data=callbacks.pack(Op.MAIN_MENU))]
             ])
         )
         await callback.answer()
         return
     
     cart_text = "🛒 Ваша корзина:\n\n"
-    total = 0
     
-    for i, item in enumerate(session.cart, 1):
-        price_display = "БЕСПЛАТНО" if item["price"] == 0 else f"{format_currency(item['price'])}"
-        cart_text += f"{i}. {item['item']} - {price_display}\n"
-        total += item["price"]
+    for i, (key, line) in enumerate(session.cart, 1):
+        cart_text += f"{i}. {format_line(line)}\n"
     
-    cart_text += f"\n💵 Итого: {format_currency(total)}"
+    cart_text += f"\n📦 Позиций: {session.cart.count} шт."
+    cart_text += f"\n💵 Итого: {format_currency(session.get_cart_total())}"
     
     await safe_edit_message(callback.message, cart_text, get_cart_kb())
     await callback.answer()
 
-@dp.callback_query(F.data == "clear_cart")
-async def clear_cart_handler(callback: CallbackQuery):
+@callbacks(Op.CLEAR_CART)
+async def clear_cart_handler(callback: CallbackQuery, session: SessionManager, catalog: Catalog):
     session.cart.clear()
+    session.mark_dirty()
     await safe_edit_message(
         callback.message,
         "🗑 Корзина очищена!",
-        get_categories_kb()
+        get_categories_kb(catalog)
     )
     await callback.answer("Корзина очищена!")
 
-@dp.callback_query(F.data == "remove_items")
-async def remove_items_handler(callback: CallbackQuery):
+@callbacks(Op.QTY_EDITOR)
+async def remove_items_handler(callback: CallbackQuery, session: SessionManager):
     if not session.cart:
         await callback.answer("❌ Корзина пуста!", show_alert=True)
         return
     
     await safe_edit_message(
         callback.message,
-        "🗑 Выберите позиции для удаления:",
-        get_remove_items_kb()
+        "✏️ Измените количество (➖ до нуля — удаление):",
+        get_remove_items_kb(session)
     )
     await callback.answer()
 
-@dp.callback_query(F.data.startswith("remove_"))
-async def remove_single_item_handler(callback: CallbackQuery):
-    try:
-        index = int(callback.data.replace("remove_", ""))
-        if 0 <= index < len(session.cart):
-            removed_item = session.cart.pop(index)
-            await callback.answer(f"❌ {removed_item['item']} удален из корзины")
-            
-            if session.cart:
-                await safe_edit_message(
-                    callback.message,
-                    "🗑 Выберите позиции для удаления:",
-                    get_remove_items_kb()
-                )
-            else:
-                await safe_edit_message(
-                    callback.message,
-                    "🛒 Корзина пуста",
-                    get_categories_kb()
-                )
-        else:
-            await callback.answer("❌ Позиция не найдена!", show_alert=True)
-    except ValueError:
-        await callback.answer("❌ Ошибка удаления!", show_alert=True)
+async def show_quantity_editor(message, session: SessionManager, catalog: Catalog):
+    """Экран изменения количества или категории, если корзина опустела"""
+    if session.cart:
+        await safe_edit_message(
+            message,
+            f"✏️ Измените количество (➖ до нуля — удаление):\n\n"
+            f"🛒 В корзине: {session.cart.count} позиций на сумму {format_currency(session.get_cart_total())}",
+            get_remove_items_kb(session)
+        )
+    else:
+        await safe_edit_message(message, "🛒 Корзина пуста", get_categories_kb(catalog))
+
+async def change_quantity(callback: CallbackQuery, session: SessionManager, catalog: Catalog, key: str, delta: int):
+    if not session.cart.change_quantity(key, delta):
+        await callback.answer("❌ Позиция не найдена!", show_alert=True)
+        return
+    session.mark_dirty()
+    
+    await show_quantity_editor(callback.message, session, catalog)
+    await callback.answer()
+
+@callbacks(Op.QTY_INC, key=str)
+async def increase_quantity_handler(callback: CallbackQuery, session: SessionManager, catalog: Catalog, key: str):
+    await change_quantity(callback, session, catalog, key, 1)
+
+@callbacks(Op.QTY_DEC, key=str)
+async def decrease_quantity_handler(callback: CallbackQuery, session: SessionManager, catalog: Catalog, key: str):
+    await change_quantity(callback, session, catalog, key, -1)
+
+@callbacks(Op.QTY_SET, key=str)
+async def set_quantity_handler(callback: CallbackQuery, state: FSMContext, session: SessionManager, key: str):
+    line = session.cart.lines.get(key)
+    if line is None:
+        await callback.answer("❌ Позиция не найдена!", show_alert=True)
+        return
+    
+    session.quantity_key = key
+    await callback.message.answer(f"🔢 Введите количество для «{line['item']}» (сейчас {line['qty']}, 0 — удалить):")
+    await state.set_state(SessionStates.waiting_item_quantity)
+    await callback.answer()
+
+@router.message(SessionStates.waiting_item_quantity)
+async def process_item_quantity(message: types.Message, state: FSMContext, session: SessionManager, catalog: Catalog):
+    is_valid, qty = validate_amount(message.text)
+    if not is_valid or not 0 <= qty <= MAX_QUANTITY:
+        await message.answer(f"❌ Введите число от 0 до {MAX_QUANTITY}:")
+        return
+    
+    if not session.cart.set_quantity(session.quantity_key, qty):
+        await message.answer("❌ Позиция не найдена!", reply_markup=get_categories_kb(catalog))
+    else:
+        session.mark_dirty()
+        await message.answer(
+            f"✅ Количество изменено!\n\n"
+            f"🛒 В корзине: {session.cart.count} позиций на сумму {format_currency(session.get_cart_total())}",
+            reply_markup=get_cart_kb() if session.cart else get_categories_kb(catalog)
+        )
+    
+    session.quantity_key = None
+    await state.clear()
 
 # ====== ОБРАБОТЧИК КАСТОМНЫХ ПОЗИЦИЙ ======
-@dp.message(SessionStates.waiting_custom_name)
-async def process_custom_name(message: types.Message, state: FSMContext):
+@router.message(SessionStates.waiting_custom_name)
+async def process_custom_name(message: types.Message, state: FSMContext, session: SessionManager):
     custom_name = message.text.strip()
     if not custom_name:
         await message.answer("❌ Название не может быть пустым. Введите название:")
@@ -784,21 +699,17 @@ async def process_custom_name(message: types.Message, state: FSMContext):
     await message.answer("💵 Введите цену позиции (в рублях):")
     await state.set_state(SessionStates.waiting_custom_price)
 
-@dp.message(SessionStates.waiting_custom_price)
-async def process_custom_price(message: types.Message, state: FSMContext):
+@router.message(SessionStates.waiting_custom_price)
+async def process_custom_price(message: types.Message, state: FSMContext, session: SessionManager, catalog: Catalog):
     is_valid, price = validate_amount(message.text)
     if not is_valid:
         await message.answer("❌ Пожалуйста, введите корректное число:")
         return
     
-    session.cart.append({
-        "item": session.custom_item_temp["name"],
-        "price": price,
-        "category": "📝 Свободные позиции",
-        "item_id": "custom"
-    })
+    session.cart.add("custom", session.custom_item_temp["name"], price, "📝 Свободные позиции")
+    session.mark_dirty()
     
-    cart_count = len(session.cart)
+    cart_count = session.cart.count
     cart_total = session.get_cart_total()
     
     await message.answer(
@@ -807,48 +718,126 @@ async def process_custom_price(message: types.Message, state: FSMContext):
         f"💵 Цена: {format_currency(price)}\n\n"
         f"🛒 В корзине: {cart_count} позиций на сумму {format_currency(cart_total)}\n\n"
         f"Выберите следующую категорию:",
-        reply_markup=get_categories_kb()
+        reply_markup=get_categories_kb(catalog)
     )
     
     session.custom_item_temp = None
     await state.clear()
 
 # ====== ОБРАБОТЧИК ОПЛАТЫ ======
-@dp.callback_query(F.data.in_(["payment_cash", "payment_card"]))
-async def payment_handler(callback: CallbackQuery):
-    if not session.cart:
-        await callback.answer("❌ Корзина пуста!", show_alert=True)
-        return
-    
-    total = session.get_cart_total()
-    pay_type = "наличные" if callback.data == "payment_cash" else "карта"
-    
-    if pay_type == "наличные":
-        session.add_sale(session.cart, cash_amount=total)
-    else:
-        session.add_sale(session.cart, cashless_amount=total)
-    
-    # Сохраняем бэкап после продажи
-    session.save_backup()
+@callbacks(Op.PAY_CASH)
+async def payment_cash_handler(callback: CallbackQuery, session: SessionManager, role: str):
+    await take_payment(callback, session, "наличные", role)
+
+@callbacks(Op.PAY_CARD)
+async def payment_card_handler(callback: CallbackQuery, session: SessionManager, role: str):
+    await take_payment(callback, session, "карта", role)
+
+async def take_payment(callback: CallbackQuery, session: SessionManager, pay_type: str, role: str):
+    async with session.lock:
+        if not session.is_open:
+            await callback.answer("❌ Смена не открыта!", show_alert=True)
+            return
+        if not session.cart:
+            await callback.answer("❌ Корзина пуста!", show_alert=True)
+            return
+        
+        total = session.get_cart_total()
+        items_count = session.cart.count
+        if pay_type == "наличные":
+            session.add_sale(session.cart.to_items(), cash_amount=total)
+        else:
+            session.add_sale(session.cart.to_items(), cashless_amount=total)
+        
+        # Корзина очищается до ответа, чтобы следующий тап не продал её ещё раз
+        session.cart.clear()
+        
+        # Сохраняем бэкап после продажи
+        session.mark_dirty()
     
     if total == 0:
         await safe_edit_message(
             callback.message,
-            f"✅ Бесплатный заказ оформлен!\n📦 Позиций: {len(session.cart)}",
-            get_main_kb()
+            f"✅ Бесплатный заказ оформлен!\n📦 Позиций: {items_count}",
+            get_main_kb(role)
         )
     else:
         await safe_edit_message(
             callback.message,
-            f"✅ Продажа оформлена!\n💳 Способ: {pay_type}\n💰 Сумма: {format_currency(total)}\n📦 Позиций: {len(session.cart)}",
-            get_main_kb()
+            f"✅ Продажа оформлена!\n💳 Способ: {pay_type}\n💰 Сумма: {format_currency(total)}\n📦 Позиций: {items_count}",
+            get_main_kb(role)
         )
     
-    session.cart.clear()
     await callback.answer()
 
-@dp.callback_query(F.data == "payment_mixed")
-async def payment_mixed_handler(callback: CallbackQuery, state: FSMContext):
+# ====== БЫСТРАЯ ПРОДАЖА ======
+@router.message(Command("sell"))
+async def sell_command(message: types.Message, command: CommandObject, session: SessionManager, catalog: Catalog, role: str):
+    if not command.args:
+        await message.answer(
+            "ℹ️ Формат: /sell 4 Будний взрослый, 2 МК1 cash\n"
+            "Оплата последним словом: cash/нал или card/карта. Без оплаты позиции добавятся в корзину."
+        )
+        return
+    
+    order = parse_sell(command.args, catalog)
+    if order.errors or not order.lines:
+        await message.answer("❌ Не удалось разобрать:\n" + ("\n".join(order.errors) or "нет позиций"))
+        return
+    
+    async with session.lock:
+        if not session.is_open:
+            await message.answer("❌ Смена не открыта!")
+            return
+        
+        # С оплатой — отдельный чек, корзина не затрагивается
+        cart = session.cart if order.payment is None else Cart()
+        for item_id, qty in order.lines:
+            name, price = catalog.resolve(item_id)
+            cart.add(item_id, name, price, catalog.items[item_id]["category"], qty)
+        
+        total = cart.total
+        lines = [format_line(line) for _, line in cart]
+        if order.payment == "cash":
+            session.add_sale(cart.to_items(), cash_amount=total)
+        elif order.payment == "card":
+            session.add_sale(cart.to_items(), cashless_amount=total)
+        session.mark_dirty()
+    
+    if order.payment is None:
+        await message.answer(
+            "🛒 Позиции добавлены, в корзине:\n" + "\n".join(lines) +
+            f"\n\n💵 Итого в корзине: {format_currency(total)}",
+            reply_markup=get_cart_kb()
+        )
+        return
+    
+    pay_type = "наличные" if order.payment == "cash" else "карта"
+    await message.answer(
+        f"✅ Продажа оформлена!\n💳 Способ: {pay_type}\n💰 Сумма: {format_currency(total)}\n\n" +
+        "\n".join(lines),
+        reply_markup=get_main_kb(role)
+    )
+
+# ====== INLINE-ПОИСК ПО КАТАЛОГУ ======
+@router.inline_query()
+async def inline_search_handler(inline_query: InlineQuery, catalog: Catalog):
+    results = []
+    for item_id in catalog.search(inline_query.query):
+        item_data = catalog.items[item_id]
+        _, price = catalog.resolve(item_id)
+        price = "БЕСПЛАТНО" if price == 0 else format_currency(price)
+        results.append(InlineQueryResultArticle(
+            id=item_id,
+            title=item_data["name"],
+            description=f"{price} · {item_data['category']}",
+            # Выбранный товар приходит в чат командой и попадает в корзину
+            input_message_content=InputTextMessageContent(message_text=f"/sell {item_data['name']}")
+        ))
+    await inline_query.answer(results, cache_time=300, is_personal=False)
+
+@callbacks(Op.PAY_MIXED)
+async def payment_mixed_handler(callback: CallbackQuery, state: FSMContext, session: SessionManager):
     if not session.cart:
         await callback.answer("❌ Корзина пуста!", show_alert=True)
         return
@@ -862,41 +851,55 @@ async def payment_mixed_handler(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer(
         f"💱 Введите сумму наличными (из {format_currency(total)}):",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="⬅️ Назад", callback_data="show_cart")]
+            [InlineKeyboardButton(text="⬅️ Назад", callback_data=callbacks.pack(Op.SHOW_CART))]
         ])
     )
     await state.set_state(SessionStates.waiting_mixed_cash)
     await callback.answer()
 
-@dp.message(SessionStates.waiting_mixed_cash)
-async def process_mixed_cash(message: types.Message, state: FSMContext):
+@router.message(SessionStates.waiting_mixed_cash)
+async def process_mixed_cash(message: types.Message, state: FSMContext, session: SessionManager, role: str):
     is_valid, cash_amount = validate_amount(message.text)
     if not is_valid:
         await message.answer("❌ Пожалуйста, введите корректное число:")
         return
     
-    if cash_amount > session.mixed_amount:
-        await message.answer(f"❌ Сумма не может превышать {format_currency(session.mixed_amount)}. Введите снова:")
-        return
-    
-    cashless_amount = session.mixed_amount - cash_amount
-    session.add_sale(session.cart, cash_amount, cashless_amount)
-    
-    # Сохраняем бэкап после продажи
-    session.save_backup()
+    async with session.lock:
+        if not session.is_open or not session.cart or session.mixed_amount is None:
+            await state.clear()
+            await message.answer("❌ Корзина пуста или смена закрыта!", reply_markup=get_main_kb(role))
+            return
+        
+        total = session.mixed_amount
+        if session.get_cart_total() != total:
+            # Корзину изменили после запроса суммы — оплата разошлась бы с позициями
+            session.mixed_amount = session.get_cart_total()
+            await message.answer(
+                f"⚠️ Корзина изменилась, сумма теперь {format_currency(session.mixed_amount)}.\n"
+                f"💱 Введите сумму наличными заново:"
+            )
+            return
+        if cash_amount > total:
+            await message.answer(f"❌ Сумма не может превышать {format_currency(total)}. Введите снова:")
+            return
+        
+        cashless_amount = total - cash_amount
+        session.add_sale(session.cart.to_items(), cash_amount, cashless_amount)
+        session.cart.clear()
+        session.mixed_amount = None
+        
+        # Сохраняем бэкап после продажи
+        session.mark_dirty()
     
+    await state.clear()
     await message.answer(
-        f"✅ Продажа оформлена!\n💱 Смешанная оплата\n💵 Наличные: {format_currency(cash_amount)}\n💳 Карта: {format_currency(cashless_amount)}\n💰 Всего: {format_currency(session.mixed_amount)}",
-        reply_markup=get_main_kb()
+        f"✅ Продажа оформлена!\n💱 Смешанная оплата\n💵 Наличные: {format_currency(cash_amount)}\n💳 Карта: {format_currency(cashless_amount)}\n💰 Всего: {format_currency(total)}",
+        reply_markup=get_main_kb(role)
     )
-    
-    session.cart.clear()
-    session.mixed_amount = None
-    await state.clear()
 
 # ====== ОБРАБОТЧИК ВОЗВРАТОВ ======
-@dp.callback_query(F.data == "refund_menu")
-async def refund_menu_handler(callback: CallbackQuery):
+@callbacks(Op.REFUND_MENU)
+async def refund_menu_handler(callback: CallbackQuery, session: SessionManager):
     if not session.is_open:
         await callback.answer("❌ Смена не открыта!", show_alert=True)
         return
@@ -908,25 +911,28 @@ async def refund_menu_handler(callback: CallbackQuery):
     await safe_edit_message(
         callback.message,
         "↩️ Выберите чек для возврата:",
-        get_refund_kb()
+        get_refund_kb(session)
     )
     await callback.answer()
 
-@dp.callback_query(F.data.startswith("refund_"))
-async def refund_sale_handler(callback: CallbackQuery):
-    try:
-        sale_id = int(callback.data.replace("refund_", ""))
-        # Поиск чека по ID
-        sale_to_refund = None
-        for sale in session.sales:
-            if sale['id'] == sale_id:
-                sale_to_refund = sale
-                break
+@callbacks(Op.REFUND_SALE, sale_id=int)
+async def refund_sale_handler(callback: CallbackQuery, session: SessionManager, sale_id: int, role: str):
+    async with session.lock:
+        if sale_id in session.sales.refunded:
+            await callback.answer("ℹ️ По этому чеку уже оформлен возврат", show_alert=True)
+            return
+        
+        # Чек читается по номеру (старые — из файла смены по смещению)
+        sale_to_refund = session.sales.get(sale_id)
         
         if not sale_to_refund:
             await callback.answer("❌ Чек не найден!", show_alert=True)
             return
         
+        if sale_to_refund.get('refund_of'):
+            await callback.answer("❌ Это чек возврата!", show_alert=True)
+            return
+        
         # Создаем возврат (добавляем чек с отрицательными суммами)
         refund_items = []
         for item in sale_to_refund['items']:
@@ -934,67 +940,102 @@ async def refund_sale_handler(callback: CallbackQuery):
                 'item': f"↩️ ВОЗВРАТ: {item['item']}",
                 'price': -item['price'],
                 'category': item['category'],
-                'item_id': item.get('item_id', 'refund')
+                'item_id': item.get('item_id', 'refund'),
+                'qty': item_qty(item)
             })
         
         session.add_sale(
             refund_items, 
             cash_amount=-sale_to_refund['cash_amount'],
-            cashless_amount=-sale_to_refund['cashless_amount']
+            cashless_amount=-sale_to_refund['cashless_amount'],
+            refund_of=sale_id
         )
         
         # Сохраняем бэкап после возврата
-        session.save_backup()
-        
-        await safe_edit_message(
-            callback.message,
-            f"✅ Возврат оформлен!\n🧾 Чек #{sale_id}\n💰 Сумма: {format_currency(sale_to_refund['total'])}",
-            get_main_kb()
-        )
-        await callback.answer()
-        
-    except ValueError:
-        await callback.answer("❌ Ошибка возврата!", show_alert=True)
+        session.mark_dirty()
+    
+    await safe_edit_message(
+        callback.message,
+        f"✅ Возврат оформлен!\n🧾 Чек #{sale_id}\n💰 Сумма: {format_currency(sale_to_refund['total'])}",
+        get_main_kb(role)
+    )
+    await callback.answer()
 
 # ====== ОБРАБОТЧИК ОТЧЕТОВ ======
-@dp.callback_query(F.data == "show_report")
-async def show_report_handler(callback: CallbackQuery):
+async def show_cached_report(callback: CallbackQuery, reports: ReportCache, key: tuple, build, reply_markup):
+    """Отчёт из кэша по (тип, версия смены, страница).
+    
+    Правку без изменений Telegram отклоняет — тогда отчёт на экране уже актуален.
+    """
+    report_text = reports.render(key, build)
+    if not await safe_edit_message(callback.message, report_text, reply_markup):
+        await callback.answer("ℹ️ Новых продаж нет, отчёт актуален")
+        return
+    await callback.answer()
+
+def metrics_report_key(session: SessionManager) -> tuple:
+    # В шапке отчёта — текущие дата и время, поэтому раз в минуту он обновляется
+    return ("metrics", session.revision, datetime.datetime.now().strftime('%d.%m %H:%M'))
+
+@callbacks(Op.REPORT)
+async def show_report_handler(callback: CallbackQuery, session: SessionManager, reports: ReportCache, role: str):
     if not session.is_open:
         await callback.answer("❌ Смена не открыта!", show_alert=True)
         return
     
     # Показываем только отчет по показателям и чекам (без общего отчета)
-    report_text = build_metrics_report()
-    await safe_edit_message(callback.message, report_text, get_report_kb())
-    session.last_report_type = "metrics"
-    await callback.answer()
-
-@dp.callback_query(F.data == "report_receipts")
-async def report_receipts_handler(callback: CallbackQuery):
-    if session.last_report_type == "receipts":
-        await callback.answer("ℹ️ Уже показан этот отчёт", show_alert=True)
+    await show_cached_report(callback, reports, metrics_report_key(session),
+                             lambda: build_metrics_report(session), get_report_kb(role))
+
+@callbacks(Op.REPORT_RECEIPTS, page=int)
+async def report_receipts_handler(callback: CallbackQuery, session: SessionManager, reports: ReportCache,
+                                  config, page: int, role: str):
+    pages = receipts_page_count(session, config.RECEIPTS_PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+    await show_cached_report(callback, reports, ("receipts", session.revision, page),
+                             lambda: build_receipts_page(session, page, config.RECEIPTS_PAGE_SIZE),
+                             get_receipts_kb(page, pages, role))
+
+@callbacks(Op.REPORT_METRICS)
+async def report_metrics_handler(callback: CallbackQuery, session: SessionManager, reports: ReportCache, role: str):
+    await show_cached_report(callback, reports, metrics_report_key(session),
+                             lambda: build_metrics_report(session), get_report_kb(role))
+
+@callbacks(Op.REPORT_TIMELINE)
+async def report_timeline_handler(callback: CallbackQuery, session: SessionManager, reports: ReportCache, role: str):
+    await show_cached_report(callback, reports, ("timeline", session.revision, 0),
+                             lambda: build_timeline_report(session.metrics.timeline), get_report_kb(role))
+
+@callbacks(Op.DASHBOARD_PIN)
+async def dashboard_pin_handler(callback: CallbackQuery, session: SessionManager, dashboard: LiveDashboard):
+    if not session.is_open:
+        await callback.answer("❌ Смена не открыта!", show_alert=True)
         return
     
-    report_text = build_receipts_report()
-    await safe_edit_message(callback.message, report_text, get_report_kb())
-    session.last_report_type = "receipts"
-    await callback.answer()
+    # Отдельное сообщение, которое дальше обновляется в фоне
+    message = await callback.message.answer(dashboard.render(), reply_markup=get_dashboard_kb())
+    dashboard.pin(message.chat.id, message.message_id)
+    try:
+        await callback.bot.pin_chat_message(message.chat.id, message.message_id, disable_notification=True)
+    except Exception as e:
+        # В группе без прав на закрепление отчёт всё равно обновляется
+        logger.warning(f"Не удалось закрепить живой отчёт: {e}")
+    await callback.answer("📌 Живой отчёт включён")
 
-@dp.callback_query(F.data == "report_metrics")
-async def report_metrics_handler(callback: CallbackQuery):
-    if session.last_report_type == "metrics":
-        await callback.answer("ℹ️ Уже показан этот отчёт", show_alert=True)
-        return
-    
-    report_text = build_metrics_report()
-    await safe_edit_message(callback.message, report_text, get_report_kb())
-    session.last_report_type = "metrics"
+@callbacks(Op.DASHBOARD_UNPIN)
+async def dashboard_unpin_handler(callback: CallbackQuery, dashboard: LiveDashboard, role: str):
+    dashboard.unpin(callback.message.chat.id)
+    try:
+        await callback.bot.unpin_chat_message(callback.message.chat.id, message_id=callback.message.message_id)
+    except Exception as e:
+        logger.warning(f"Не удалось открепить живой отчёт: {e}")
+    await safe_edit_message(callback.message, "📌 Живой отчёт отключён", get_main_kb(role))
     await callback.answer()
 
 # ====== ОБРАБОТЧИК АРХИВА СМЕН ======
-@dp.callback_query(F.data == "session_archive")
-async def session_archive_handler(callback: CallbackQuery):
-    sessions = get_closed_sessions()
+@callbacks(Op.ARCHIVE)
+async def session_archive_handler(callback: CallbackQuery, archive: ShiftArchive):
+    sessions = get_closed_sessions(archive)
     if not sessions:
         await callback.answer("📭 Архив смен пуст", show_alert=True)
         return
@@ -1002,22 +1043,63 @@ async def session_archive_handler(callback: CallbackQuery):
     await safe_edit_message(
         callback.message,
         "📋 Архив закрытых смен (последние 30 дней):\n\nВыберите смену для просмотра:",
-        get_session_archive_kb()
+        get_session_archive_kb(archive)
     )
     await callback.answer()
 
-@dp.callback_query(F.data.startswith("archive_"))
-async def archive_session_handler(callback: CallbackQuery):
-    filename = callback.data.replace("archive_", "")
-    filepath = f"{Config.CLOSED_SESSIONS_FOLDER}/{filename}"
+@callbacks(Op.ARCHIVE_VIEW, key=str)
+async def archive_view_handler(callback: CallbackQuery, summaries: ShiftSummaries, key: str):
+    # Сводка — короткая запись; повторные просмотры берутся из кэша
+    summary = await asyncio.to_thread(summaries.get, key)
+    if summary is None:
+        text = "ℹ️ Для этой смены нет сводки, доступен только файл отчёта"
+    else:
+        text = build_summary_report(summary, key)
+    await safe_edit_message(callback.message, text, get_archive_view_kb(key))
+    await callback.answer()
+
+@callbacks(Op.ARCHIVE_PICK, key=str)
+async def archive_pick_handler(callback: CallbackQuery, archive: ShiftArchive, key: str):
+    await safe_edit_message(
+        callback.message,
+        "⚖️ Выберите смену для сравнения:",
+        get_session_archive_kb(archive, compare_with=key)
+    )
+    await callback.answer()
+
+@callbacks(Op.ARCHIVE_COMPARE, first_key=str, second_key=str)
+async def archive_compare_handler(callback: CallbackQuery, summaries: ShiftSummaries, first_key: str, second_key: str):
+    first, second = await asyncio.gather(
+        asyncio.to_thread(summaries.get, first_key),
+        asyncio.to_thread(summaries.get, second_key)
+    )
+    if first is None or second is None:
+        await callback.answer("❌ Для одной из смен нет сводки", show_alert=True)
+        return
+    
+    # Более ранняя смена — A
+    if second_key < first_key:
+        first, second, first_key, second_key = second, first, second_key, first_key
+    await safe_edit_message(
+        callback.message,
+        build_comparison_report(first, second, first_key, second_key),
+        InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="⬅️ К архиву", callback_data=callbacks.pack(Op.ARCHIVE))]
+        ])
+    )
+    await callback.answer()
+
+@callbacks(Op.ARCHIVE_FILE, key=str)
+async def archive_session_handler(callback: CallbackQuery, archive: ShiftArchive, key: str):
+    filename = f"смена_{key}.txt"
     
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # Смена может лежать файлом или в сжатом пакете — читаем через архив
+        content = archive.read_bytes(filename)
         
         # Отправляем файл
         await callback.message.answer_document(
-            document=types.FSInputFile(filepath),
+            document=types.BufferedInputFile(content, filename=filename),
             caption=f"📄 Отчет по смене: {filename}"
         )
         
@@ -1026,78 +1108,374 @@ async def archive_session_handler(callback: CallbackQuery):
         logger.error(f"Ошибка при чтении файла смены: {e}")
         await callback.answer("❌ Ошибка при загрузке отчета", show_alert=True)
 
-# ====== ОБРАБОТЧИК ЗАКРЫТИЯ СМЕНЫ ======
-@dp.callback_query(F.data == "close_shift")
-async def close_shift_handler(callback: CallbackQuery):
-    if not session.is_open:
-        await callback.answer("❌ Смена не открыта!", show_alert=True)
+# ====== ВЫГРУЗКА ДЛЯ БУХГАЛТЕРИИ ======
+def parse_export_period(args: str | None):
+    """Период выгрузки: без аргументов — текущая смена, иначе 'дд.мм.гггг [дд.мм.гггг]'"""
+    if not args:
+        return None
+    parts = args.split()
+    if len(parts) > 2:
+        raise ValueError(args)
+    dates = [datetime.datetime.strptime(part, '%d.%m.%Y').date() for part in parts]
+    date_from, date_to = dates[0], dates[-1]
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+    return date_from, date_to
+
+@router.message(Command("export"))
+async def export_command(message: types.Message, command: CommandObject, session: SessionManager,
+                         archive: ShiftArchive, config):
+    try:
+        period = parse_export_period(command.args)
+    except ValueError:
+        await message.answer("❌ Формат: /export или /export дд.мм.гггг [дд.мм.гггг]")
         return
     
-    await callback.message.answer("📊 Формирую итоговые отчёты...")
+    current_shift = None
+    if session.is_open:
+        # Снимок списка чеков: продажи могут добавляться во время выгрузки
+        current_shift = (f"текущая ({session.open_time.strftime('%d.%m.%Y %H:%M')})", session.sales.snapshot())
+    
+    if period is None:
+        if not current_shift:
+            await message.answer("❌ Смена не открыта! Укажите период: /export дд.мм.гггг [дд.мм.гггг]")
+            return
+        shifts = [current_shift]
+        export_name = f"выгрузка_{session.open_time.strftime('%Y%m%d_%H%M')}.csv"
+    else:
+        date_from, date_to = period
+        shifts = iter_period_shifts(date_from, date_to, archive)
+        if current_shift and date_from <= session.open_time.date() <= date_to:
+            shifts = [*shifts, current_shift]
+        export_name = f"выгрузка_{date_from.strftime('%Y%m%d')}_{date_to.strftime('%Y%m%d')}.csv"
+    
+    # Файл пишется в отдельном потоке, чтобы не блокировать обработку продаж
+    path, rows = await asyncio.to_thread(write_export, shifts, config.REPORTS_FOLDER)
+    try:
+        if not rows:
+            await message.answer("📭 За выбранный период продаж нет")
+            return
+        await message.answer_document(
+            document=types.FSInputFile(path, filename=export_name),
+            caption=f"📤 Выгрузка продаж: {rows} строк"
+        )
+    finally:
+        os.remove(path)
+
+def default_peaks_period():
+    """Период /peaks по умолчанию — последние 30 дней, как в архиве смен"""
+    date_to = datetime.date.today()
+    return date_to - datetime.timedelta(days=30), date_to
+
+@router.message(Command("peaks"))
+async def peaks_command(message: types.Message, command: CommandObject, session: SessionManager,
+                        archive: ShiftArchive, timelines: PeriodTimelines, config):
+    try:
+        period = parse_export_period(command.args)
+    except ValueError:
+        await message.answer("❌ Формат: /peaks или /peaks дд.мм.гггг [дд.мм.гггг]")
+        return
+    
+    closed = None
+    if period is None:
+        date_from, date_to = default_peaks_period()
+        # Закрытые смены за 30 дней обычно уже посчитаны фоновым заданием
+        closed = timelines.get(date_from, date_to)
+        if closed is None:
+            closed = await asyncio.to_thread(timelines.compute, date_from, date_to)
+        shifts = []
+    else:
+        date_from, date_to = period
+        shifts = iter_period_shifts(date_from, date_to, archive)
+    
+    if session.is_open and date_from <= session.open_time.date() <= date_to:
+        shifts = [*shifts, ("текущая", session.sales.snapshot())]
+    
+    # Чтение архива — в отдельном потоке
+    timeline = await asyncio.to_thread(build_period_timeline, shifts, config.TIMELINE_BUCKET_MINUTES)
+    if closed is not None:
+        timeline.merge(closed)
+    if not timeline.shifts:
+        await message.answer("📭 За выбранный период смен нет")
+        return
+    
+    title = f"⏱ ЗАГРУЗКА ПО ВРЕМЕНИ {date_from.strftime('%d.%m.%Y')}–{date_to.strftime('%d.%m.%Y')}"
+    await message.answer(build_timeline_report(timeline, title))
+
+@router.message(Command("network"))
+async def network_command(message: types.Message, command: CommandObject, session: SessionManager,
+                          venues: list, network_pool: NetworkPool, config):
+    """/network — итоги сети за сегодня, /network дд.мм.гггг [дд.мм.гггг] — за период"""
+    try:
+        period = parse_export_period(command.args)
+    except ValueError:
+        await message.answer("❌ Формат: /network или /network дд.мм.гггг [дд.мм.гггг]")
+        return
+    date_from, date_to = period or (datetime.date.today(), datetime.date.today())
+    
+    started = time.perf_counter()
+    await message.answer(f"🌐 Собираю данные площадок: {len(venues)}...")
+    open_shifts = {}
+    if session.is_open and date_from <= session.open_time.date() <= date_to:
+        # Своя открытая смена — из счётчиков в памяти, без чтения чеков
+        open_shifts[config.VENUE_NAME] = session.metrics
+    network = await collect_network(venues, date_from, date_to, config.TIMELINE_BUCKET_MINUTES,
+                                    open_shifts=open_shifts, process_days=config.NETWORK_PROCESS_POOL_DAYS,
+                                    pool=network_pool)
+    logger.info(f"🌐 Отчёт по сети: площадок {len(venues)}, "
+                f"{(time.perf_counter() - started) * 1000:.0f} мс")
+    await message.answer(build_network_report(network, date_from, date_to))
+
+# ====== РОЛИ ======
+@router.message(Command("role"))
+async def role_command(message: types.Message, command: CommandObject, access: AccessControl):
+    """/role — список, /role @user manager — назначить, /role @user none — снять"""
+    args = (command.args or "").split()
+    if not args:
+        lines = [f"{user} — {ROLE_TITLES[role]}" for user, role in sorted(access.roles.items())]
+        default = ROLE_TITLES.get(access.default_role, "нет доступа")
+        await message.answer("🔐 Роли:\n" + "\n".join(lines) + f"\n\nОстальные: {default}")
+        return
+    
+    if len(args) != 2 or (args[1] not in ROLE_LEVELS and args[1] != "none"):
+        await message.answer("❌ Формат: /role @user cashier|manager|admin|none")
+        return
+    
+    user, role = args[0], None if args[1] == "none" else args[1]
+    try:
+        persisted = await asyncio.to_thread(access.assign, user, role)
+    except Exception as e:
+        logger.error(f"Ошибка при назначении роли: {e}")
+        await message.answer("❌ Не удалось сохранить роль")
+        return
+    
+    log_event(logger, "role_assigned", f"🔐 {user_key(user)}: {role or 'роль снята'}",
+              user=user_key(user), role=role, by=message.from_user.username)
+    note = "" if persisted else "\nℹ️ Без общего хранилища роль действует до перезапуска"
+    await message.answer(f"✅ {user_key(user)}: {ROLE_TITLES.get(role, 'роль снята')}{note}")
+
+# ====== ОБРАБОТЧИК ЗАКРЫТИЯ СМЕНЫ ======
+async def finalize_shift(session: SessionManager, config, user=None):
+    """Итоговые отчёты, файлы смены и сброс; вызывается под session.lock.
+    
+    Возвращает файл отчёта (None — отчёт сохранить не удалось).
+    """
+    started = time.perf_counter()
     
     # Собираем все отчеты
     session_data = {
         'open_time': session.open_time,
         'close_time': datetime.datetime.now(),
-        'combined_report': build_combined_report(),
-        'metrics_report': build_metrics_report(),
-        'receipts_report': build_receipts_report()
+        'combined_report': build_combined_report(session),
+        'metrics_report': build_metrics_report(session),
+        'cash_report': build_cash_report(session),
+        'timeline_report': build_timeline_report(session.metrics.timeline),
+        'receipts_report': build_receipts_report(session)
     }
     
     # Сохраняем в файл
-    filename = save_session_report(session_data)
+    filename = await asyncio.to_thread(save_session_report, session_data, config)
     
     if filename:
+        # Построчные продажи для выгрузки в бухгалтерию
+        await asyncio.to_thread(save_session_sales, session.sales, sales_filename(filename))
+        # Компактная сводка для просмотра и сравнения в архиве
+        summary = summarize_metrics(session.metrics, session.open_time, session_data['close_time'], session.ledger)
+        await asyncio.to_thread(save_shift_summary, summary, summary_filename(filename))
+        
         # Удаляем бэкап при корректном закрытии смены
+        session.autosave.discard()
         session.delete_backup()
+        log_event(logger, "shift_closed", f"✅ Смена закрыта: {filename}", user=user,
+                  receipts=session.metrics.receipts, revenue=session.metrics.revenue,
+                  duration_ms=round((time.perf_counter() - started) * 1000, 1))
+    
+    # Закрываем смену
+    session.reset()
+    return filename
+
+@callbacks(Op.CLOSE_SHIFT)
+async def close_shift_handler(callback: CallbackQuery, session: SessionManager, timelines: PeriodTimelines,
+                              config, role: str):
+    # Под локом смены: продажа или возврат не вклинится между отчётом и сбросом
+    async with session.lock:
+        if not session.is_open:
+            await callback.answer("❌ Смена не открыта!", show_alert=True)
+            return
         
+        await callback.message.answer("📊 Формирую итоговые отчёты...")
+        filename = await finalize_shift(session, config, user=callback.from_user.username)
+    # В архиве появилась новая смена — раскладку /peaks нужно пересчитать
+    timelines.invalidate()
+    
+    if filename:
         # Отправляем файл пользователю
         await callback.message.answer_document(
             document=types.FSInputFile(filename),
             caption="📄 Полный отчет по смене"
         )
         
-        await callback.message.answer("✅ Смена закрыта! Отчет сохранен в файл.", reply_markup=get_main_kb())
+        await callback.message.answer("✅ Смена закрыта! Отчет сохранен в файл.", reply_markup=get_main_kb(role))
     else:
-        await callback.message.answer("❌ Ошибка при сохранении отчета!", reply_markup=get_main_kb())
+        await callback.message.answer("❌ Ошибка при сохранении отчета!", reply_markup=get_main_kb(role))
     
-    # Закрываем смену
-    session.reset()
     await callback.answer()
 
+# ====== ФОНОВЫЕ ЗАДАНИЯ ======
+def build_scheduler(app: App) -> JobScheduler:
+    """Автозакрытие смены, обслуживание архива, предрасчёт отчётов и проверка смены"""
+    config = app.config
+    scheduler = JobScheduler(
+        state_path=f"{config.BACKUP_FOLDER}/scheduler_state.json",
+        idle_for=app.lifecycle.idle_for,
+        idle_seconds=config.SCHEDULER_IDLE_SECONDS
+    )
+    jitter = config.SCHEDULER_JITTER_SECONDS
+    
+    async def auto_close_shift():
+        session = app.session
+        # Плановое время последнего запуска: смену, открытую после него, не трогаем
+        due = scheduler.jobs["auto_close"].last_due(datetime.datetime.now())
+        async with session.lock:
+            if not session.is_open or session.open_time >= due:
+                return
+            logger.info(f"⏲ Автозакрытие смены от {session.open_time.strftime('%d.%m.%Y %H:%M')}")
+            filename = await finalize_shift(session, config, user="auto")
+        app.timelines.invalidate()
+        # Отчёт — в чаты с живым отчётом смены
+        for chat_id in list(app.dashboard.pins):
+            try:
+                if filename:
+                    await app.bot.send_document(chat_id, types.FSInputFile(filename),
+                                                caption="⏲ Смена закрыта автоматически. Полный отчет по смене")
+                else:
+                    await app.bot.send_message(chat_id, "❌ Автозакрытие: ошибка при сохранении отчета!")
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось отправить отчёт автозакрытия в чат {chat_id}: {e}")
+    
+    async def maintain_archive():
+        # Упаковка старых смен в архив и очистка по сроку хранения
+        await asyncio.to_thread(app.archive.maintain)
+        app.timelines.invalidate()
+    
+    async def precompute_reports():
+        # Сводки недавних смен — в кэш архива, раскладка /peaks за 30 дней — заранее
+        sessions = await asyncio.to_thread(get_closed_sessions, app.archive)
+        keys = [shift_key(s['filename']) for s in sessions]
+        await asyncio.to_thread(app.dp["summaries"].precompute, keys)
+        date_from, date_to = default_peaks_period()
+        if app.timelines.get(date_from, date_to) is None:
+            await asyncio.to_thread(app.timelines.compute, date_from, date_to)
+    
+    async def check_shift_integrity():
+        # Под локом смены: проверка не пересечётся с продажей или возвратом.
+        # Идёт в цикле событий (в простое), чтобы счётчики не менялись из потока
+        session = app.session
+        async with session.lock:
+            if not session.is_open:
+                return
+            session.check_integrity()
+    
+    if config.SHIFT_AUTO_CLOSE_AT:
+        scheduler.daily("auto_close", datetime.time.fromisoformat(config.SHIFT_AUTO_CLOSE_AT),
+                        auto_close_shift, jitter=jitter)
+    scheduler.daily("archive", datetime.time.fromisoformat(config.ARCHIVE_MAINTAIN_AT),
+                    maintain_archive, jitter=jitter)
+    scheduler.every("precompute", config.PRECOMPUTE_INTERVAL_SECONDS, precompute_reports,
+                    jitter=jitter, catch_up=False, idle_only=True)
+    scheduler.every("integrity", config.INTEGRITY_CHECK_SECONDS, check_shift_integrity,
+                    jitter=jitter, catch_up=False, idle_only=True)
+    return scheduler
+
+@router.message(Command("jobs"))
+async def jobs_command(message: types.Message, scheduler: JobScheduler):
+    """Фоновые задания: запуски, ошибки и время выполнения"""
+    lines = ["⏲ ФОНОВЫЕ ЗАДАНИЯ"]
+    for name, job in scheduler.jobs.items():
+        stats = job.stats
+        avg = stats["total_ms"] / stats["runs"] if stats["runs"] else 0
+        lines.append(f"\n{name}: запусков {stats['runs']} (догоняющих {stats['caught_up']}), ошибок {stats['failures']}")
+        lines.append(f"Время: посл. {stats['last_ms']:.0f} мс, ср. {avg:.0f} мс, макс. {stats['max_ms']:.0f} мс")
+        if job.last_run:
+            lines.append(f"Последний: {job.last_run.strftime('%d.%m %H:%M:%S')}")
+        if job.running:
+            lines.append("Выполняется сейчас")
+        elif job.next_run:
+            lines.append(f"Следующий: {job.next_run.strftime('%d.%m %H:%M:%S')}")
+    await message.answer("\n".join(lines))
+
 # ====== GRACEFUL SHUTDOWN ======
-async def shutdown():
+async def shutdown(app: App):
     """Корректное завершение работы бота"""
     logger.info("Завершение работы бота...")
-    session.save_backup()
-    session.stop_auto_save()
-    await bot.session.close()
+    # Сначала даём закончиться начатым продажам/возвратам, потом пишем бэкап
+    await app.lifecycle.drain()
+    # Автозакрытие, если уже идёт, дописывает отчёт до сохранения бэкапа
+    await app.scheduler.stop(timeout=app.config.SHUTDOWN_DRAIN_TIMEOUT)
+    app.dashboard.stop()
+    app.network_pool.shutdown()
+    app.session.stop_auto_save()
+    if app.election:
+        # Резервный воркер подхватит polling, не дожидаясь истечения аренды
+        app.election.release()
+    await app.bot.session.close()
     logger.info("Бот корректно завершил работу")
 
 # ====== ЗАПУСК БОТА ======
-async def main():
+async def main(app: App = None):
     logger.info("Бот запускается...")
+    started = time.perf_counter()
+    if app is None:
+        app = create_app()
+    app.lifecycle.install_signal_handlers()
     
     try:
+        if app.election:
+            # Polling ведёт только лидер; остальные воркеры ждут в резерве
+            if not await app.election.acquire(should_stop=lambda: app.lifecycle.stop_requested):
+                return
+            # При потере аренды polling останавливается, и run_bot снова
+            # ставит воркер в очередь за лидерством
+            app.election.start_keep_alive(on_lost=app.lifecycle.stop_polling)
+            # Роли могли назначить на прежнем лидере
+            app.access.load()
+        
         # Восстановление сессии из бэкапа
-        session.restore_session()
+        app.session.restore_session()
         
         # Запуск автосохранения
-        await session.start_auto_save(interval_seconds=120)
+        await app.session.start_auto_save()
+        
+        # Автозакрытие, обслуживание архива и предрасчёт; пропущенные
+        # за время простоя бота запуски выполняются сразу
+        app.scheduler.start()
+        
+        app.dashboard.start(app.bot, reply_markup=get_dashboard_kb())
+        
+        if app.lifecycle.stop_requested:
+            return
+        if app.election and not app.election.is_leader:
+            # Аренду потеряли, пока поднимались
+            return
         
-        logger.info("Бот начал polling...")
-        await dp.start_polling(bot)
+        logger.info(f"Бот начал polling (старт за {(time.perf_counter() - started) * 1000:.0f} мс)...")
+        # Сигналы и закрытие сессии обрабатываем сами, чтобы успеть сохранить смену
+        await app.dp.start_polling(app.bot, handle_signals=False, close_bot_session=False)
         
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
         raise
+    finally:
+        await shutdown(app)
 
 if __name__ == "__main__":
+    log_listener = setup_logging()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
-        asyncio.run(shutdown())
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
-        asyncio.run(shutdown())
\ No newline at end of file
+    finally:
+        # Дописываем записи, оставшиеся в очереди
+        log_listener.stop()
@@ -0,0 +1,137 @@
+import logging
+
+from aiogram.dispatcher.event.handler import CallableObject
+
+logger = logging.getLogger(__name__)
+
+SEP = ":"
+# Ограничение Telegram на callback_data
+MAX_CALLBACK_BYTES = 64
+# Значения аргументов для self_check: крайние и типичные для каждого типа
+SELF_CHECK_SAMPLES = {
+    int: (0, -1, 7, 2 ** 31),
+    str: ("", "x", "2026-01-31_23-59"),
+}
+
+
+class Op:
+    """Короткие коды действий для callback_data"""
+    MAIN_MENU = "m"
+    OPEN_SHIFT = "os"
+    CLOSE_SHIFT = "cs"
+    START_SALE = "ss"
+    CATEGORIES = "bc"
+    CATEGORY = "c"
+    ITEM = "i"
+    SHOW_CART = "sc"
+    CLEAR_CART = "cc"
+    QTY_EDITOR = "qe"
+    QTY_INC = "q+"
+    QTY_DEC = "q-"
+    QTY_SET = "q="
+    PAY_CASH = "pc"
+    PAY_CARD = "pk"
+    PAY_MIXED = "pm"
+    CASH_MENU = "km"
+    ADD_EXCHANGE = "ke"
+    ADD_PAYOUT = "kp"
+    COUNT_CASH = "kc"
+    REFUND_MENU = "rf"
+    REFUND_SALE = "rs"
+    REPORT = "r"
+    REPORT_RECEIPTS = "rr"
+    REPORT_METRICS = "rm"
+    REPORT_TIMELINE = "rt"
+    DASHBOARD_PIN = "dp"
+    DASHBOARD_UNPIN = "du"
+    ARCHIVE = "a"
+    ARCHIVE_VIEW = "av"
+    ARCHIVE_PICK = "ak"
+    ARCHIVE_COMPARE = "ac"
+    ARCHIVE_FILE = "af"
+
+
+class CallbackCodec:
+    """Упаковка действия и аргументов в callback_data: «код:арг1:арг2».
+
+    Код сравнивается целиком (до разделителя), поэтому коды не могут
+    перекрываться как префиксы, а аргументы приводятся к объявленным типам.
+    """
+
+    def __init__(self):
+        # код → {имя аргумента: тип}
+        self.specs = {}
+
+    def register(self, op: str, **arg_types):
+        if op in self.specs:
+            raise ValueError(f"Код callback «{op}» уже занят")
+        if not op or SEP in op:
+            raise ValueError(f"Недопустимый код callback «{op}»")
+        self.specs[op] = arg_types
+
+    def pack(self, op: str, **args) -> str:
+        spec = self.specs[op]
+        if set(args) != set(spec):
+            raise ValueError(f"«{op}» ожидает аргументы {list(spec)}, получены {list(args)}")
+        parts = [op]
+        for name, arg_type in spec.items():
+            value = str(arg_type(args[name]))
+            if SEP in value:
+                raise ValueError(f"Аргумент «{name}» содержит «{SEP}»: {value}")
+            parts.append(value)
+        data = SEP.join(parts)
+        if len(data.encode("utf-8")) > MAX_CALLBACK_BYTES:
+            raise ValueError(f"callback_data длиннее {MAX_CALLBACK_BYTES} байт: {data}")
+        return data
+
+    def unpack(self, data: str):
+        """(код, аргументы) или ValueError для чужих и устаревших данных"""
+        op, *values = (data or "").split(SEP)
+        spec = self.specs.get(op)
+        if spec is None or len(values) != len(spec):
+            raise ValueError(f"Неизвестный callback: {data}")
+        return op, {name: arg_type(value) for (name, arg_type), value in zip(spec.items(), values)}
+
+    def self_check(self):
+        """Проверка таблицы: данные каждого кода распаковываются в тот же код
+        и те же аргументы — на крайних значениях каждого типа.
+
+        Код ищется в словаре целиком до разделителя, так что чужим кодом данные
+        могут оказаться только при сдвиге аргументов — его и ловит проверка.
+        """
+        for op, spec in self.specs.items():
+            rounds = max((len(SELF_CHECK_SAMPLES[arg_type]) for arg_type in spec.values()), default=1)
+            for i in range(rounds):
+                args = {name: SELF_CHECK_SAMPLES[arg_type][i % len(SELF_CHECK_SAMPLES[arg_type])]
+                        for name, arg_type in spec.items()}
+                data = self.pack(op, **args)
+                if self.unpack(data) != (op, args):
+                    raise RuntimeError(f"callback «{op}» {args} распаковывается неоднозначно: {data}")
+
+
+class CallbackDispatcher:
+    """Обработчики callback по коду: один поиск в словаре вместо цепочки фильтров"""
+
+    def __init__(self):
+        self.codec = CallbackCodec()
+        self.handlers = {}
+
+    def __call__(self, op: str, **arg_types):
+        """Декоратор обработчика; аргументы кода приходят в него по именам"""
+        def register(func):
+            self.codec.register(op, **arg_types)
+            self.handlers[op] = CallableObject(func)
+            return func
+        return register
+
+    def pack(self, op: str, **args) -> str:
+        return self.codec.pack(op, **args)
+
+    async def dispatch(self, callback, data: dict):
+        try:
+            op, args = self.codec.unpack(callback.data)
+        except ValueError:
+            logger.warning(f"⚠️ Устаревшая кнопка: {callback.data}")
+            await callback.answer("⚠️ Кнопка устарела, откройте меню заново", show_alert=True)
+            return None
+        return await self.handlers[op].call(callback, **data, **args)
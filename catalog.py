@@ -0,0 +1,217 @@
+import bisect
+import datetime
+import difflib
+import re
+from collections import OrderedDict
+
+from categories import CATEGORIES_DATA
+from pricing import DAY_TYPES, DayCalendar
+
+
+# Сколько последних запросов поиска держать в кэше
+SEARCH_CACHE_SIZE = 512
+
+DAY_WORDS = {day_type.lower() for day_type in DAY_TYPES}
+
+
+def trigrams(text: str):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def normalize_name(text: str) -> str:
+    """Название для поиска: нижний регистр, ё → е, без знаков препинания"""
+    text = text.lower().replace("ё", "е")
+    return " ".join(re.findall(r"\w+", text))
+
+
+class Catalog:
+    """Справочник категорий и товаров с короткими id для callback_data"""
+
+    def __init__(self, categories_data=CATEGORIES_DATA, calendar: DayCalendar = None):
+        self.categories = {}
+        self.items = {}
+        self.calendar = calendar or DayCalendar()
+
+        for i, (category_name, items) in enumerate(categories_data.items()):
+            cat_id = f"cat{i}"
+            self.categories[cat_id] = category_name
+
+            for j, (item_name, price) in enumerate(items.items()):
+                item_id = f"item{i}_{j}"
+                if isinstance(price, dict):
+                    # Цена по типу дня: одна позиция вместо пары «Будний …»/«Выходной …»
+                    self.items[item_id] = {
+                        "name": item_name[0].upper() + item_name[1:],
+                        "price": None,
+                        "prices": price,
+                        "variant": item_name,
+                        "category": category_name
+                    }
+                    continue
+                self.items[item_id] = {
+                    "name": item_name,
+                    "price": price,
+                    "category": category_name
+                }
+        
+        self._build_search_index()
+    
+    def _build_search_index(self):
+        """Индекс для поиска товара по тексту (/sell): имена, слова и сокращения"""
+        self.names = {}
+        self.compact_names = {}
+        self.trigrams = {}
+        self._search_cache = OrderedDict()
+        tokens = []
+        initials = {}
+        for item_id, item_data in self.items.items():
+            if item_data["price"] == "custom":
+                continue
+            name = normalize_name(item_data["name"])
+            self.names[name] = item_id
+            self.compact_names[name.replace(" ", "")] = item_id
+            for trigram in trigrams(name):
+                self.trigrams.setdefault(trigram, set()).add(item_id)
+            for token in name.split():
+                tokens.append((token, item_id))
+            # Сокращение по первым буквам слов: «бвб» — Будний взрослый билет
+            words = name.split()
+            if len(words) > 1:
+                initials.setdefault("".join(word[0] for word in words), []).append(item_id)
+        
+        # Сокращение работает, только если оно однозначно и не совпадает с именем
+        self.aliases = {
+            alias: ids[0] for alias, ids in initials.items()
+            if len(ids) == 1 and alias not in self.names
+        }
+        # Отсортированные списки — поиск по префиксу через bisect
+        self._sorted_names = sorted(self.names)
+        self._sorted_tokens = sorted(tokens)
+    
+    def _names_with_prefix(self, prefix):
+        start = bisect.bisect_left(self._sorted_names, prefix)
+        result = []
+        for name in self._sorted_names[start:]:
+            if not name.startswith(prefix):
+                break
+            result.append(self.names[name])
+        return result
+    
+    def _ids_with_token_prefix(self, prefix):
+        start = bisect.bisect_left(self._sorted_tokens, (prefix,))
+        result = set()
+        for token, item_id in self._sorted_tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            result.add(item_id)
+        return result
+    
+    def find_items(self, query: str):
+        """Поиск товара по тексту; возвращает список подходящих id.
+        
+        Порядок: точное имя или сокращение, начало имени, начала всех слов
+        запроса, затем нечёткое совпадение. Один id — однозначный ответ.
+        """
+        query = normalize_name(query)
+        # Старые названия «Будний …»/«Выходной …»: цену выбирает календарь
+        day_word, _, rest = query.partition(" ")
+        if rest and day_word in DAY_WORDS:
+            query = rest
+        if not query:
+            return []
+        if query in self.names:
+            return [self.names[query]]
+        if query in self.aliases:
+            return [self.aliases[query]]
+        # «комбо 2» → Комбо2
+        compact = query.replace(" ", "")
+        if compact in self.compact_names:
+            return [self.compact_names[compact]]
+        
+        matches = self._names_with_prefix(query)
+        if matches:
+            return matches
+        
+        # Каждое слово запроса — начало какого-нибудь слова имени
+        candidates = None
+        for token in query.split():
+            ids = self._ids_with_token_prefix(token)
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                break
+        if candidates:
+            return sorted(candidates, key=lambda item_id: len(self.items[item_id]["name"]))
+        
+        close = difflib.get_close_matches(query, self._sorted_names, n=3, cutoff=0.75)
+        return [self.names[name] for name in close]
+
+    def search(self, query: str, limit: int = 50):
+        """Ранжированный поиск для inline-режима (результат кэшируется по запросу).
+        
+        Сначала однозначные совпадения и начала имени, затем совпадения
+        по началам слов, затем подстрока в любом месте имени (по триграммам).
+        """
+        query = normalize_name(query)
+        cached = self._search_cache.get(query)
+        if cached is not None:
+            self._search_cache.move_to_end(query)
+            return cached[:limit]
+        
+        if not query:
+            indexed = set(self.names.values())
+            ranked = [item_id for item_id in self.items if item_id in indexed]
+        else:
+            ranked = []
+            seen = set()
+            
+            def extend(ids):
+                for item_id in ids:
+                    if item_id not in seen:
+                        seen.add(item_id)
+                        ranked.append(item_id)
+            
+            extend(self.find_items(query))
+            if len(query) >= 3:
+                # Кандидаты — пересечение триграмм, затем проверка подстроки
+                candidates = None
+                for trigram in trigrams(query):
+                    ids = self.trigrams.get(trigram, set())
+                    candidates = ids if candidates is None else candidates & ids
+                    if not candidates:
+                        break
+                extend(sorted(
+                    (item_id for item_id in candidates or ()
+                     if query in normalize_name(self.items[item_id]["name"])),
+                    key=lambda item_id: len(self.items[item_id]["name"])
+                ))
+        
+        self._search_cache[query] = ranked
+        if len(self._search_cache) > SEARCH_CACHE_SIZE:
+            self._search_cache.popitem(last=False)
+        return ranked[:limit]
+    
+    def resolve(self, item_id, day: datetime.date = None):
+        """Название и цена позиции в чеке на день продажи (по умолчанию — сегодня)"""
+        item_data = self.items[item_id]
+        prices = item_data.get("prices")
+        if prices is None:
+            return item_data["name"], item_data["price"]
+        day_type = self.calendar.day_type(day or datetime.date.today())
+        return f"{day_type} {item_data['variant']}", prices[day_type]
+    
+    def sale_categories(self) -> dict:
+        """Категории по названию в чеке, включая все варианты по типу дня"""
+        result = {}
+        for item_data in self.items.values():
+            for day_type in item_data.get("prices", ()):
+                result[f"{day_type} {item_data['variant']}"] = item_data["category"]
+            result[item_data["name"]] = item_data["category"]
+        return result
+    
+    def category_items(self, category_id):
+        """Товары категории в порядке справочника"""
+        category_name = self.categories.get(category_id)
+        return [
+            (item_id, item_data) for item_id, item_data in self.items.items()
+            if item_data["category"] == category_name
+        ]
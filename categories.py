@@ -1,30 +1,21 @@
 # categories.py
 CATEGORIES_DATA = {
+    # Позиции с ценой по типу дня: в меню одна кнопка, при продаже название
+    # получает приставку «Будний»/«Выходной» (см. pricing.py)
     "🎫 Входные билеты": {
-        "Будний взрослый билет": 3699,
-        "Будний детский билет": 3699,
-        "Выходной взрослый билет": 4299,
-        "Выходной детский билет": 4299
+        "взрослый билет": {"Будний": 3699, "Выходной": 4299},
+        "детский билет": {"Будний": 3699, "Выходной": 4299}
     },
     "🎯 Скидки": {
-        "Будний Пенсионеры 20%": 2959,
-        "Будний Ветераны 25%": 2774,
-        "Будний Инвалиды 20% (3 группа)": 2959,
-        "Будний Инвалиды 50% (1 и 2 группа)": 1850,
-        "Будний Многодетный взрослый 20%": 2959,
-        "Будний Многодетный детский 20%": 2959,
-        "Будний День рождения взрослый 50%": 1850,
-        "Будний День рождения детский 50%": 1850,
-        "Будний Билет взрослый групповой": 2300,
-        "Выходной Пенсионеры 20%": 3439,
-        "Выходной Ветераны 25%": 3224,
-        "Выходной Инвалиды 20% (3 группа)": 3439,
-        "Выходной Инвалиды 50% (1 и 2 группа)": 2150,
-        "Выходной Многодетный взрослый 20%": 3439,
-        "Выходной Многодетный детский 20%": 3439,
-        "Выходной День рождения взрослый 50%": 2150,
-        "Выходной День рождения детский 50%": 2150,
-        "Выходной Билет взрослый групповой": 2300
+        "Пенсионеры 20%": {"Будний": 2959, "Выходной": 3439},
+        "Ветераны 25%": {"Будний": 2774, "Выходной": 3224},
+        "Инвалиды 20% (3 группа)": {"Будний": 2959, "Выходной": 3439},
+        "Инвалиды 50% (1 и 2 группа)": {"Будний": 1850, "Выходной": 2150},
+        "Многодетный взрослый 20%": {"Будний": 2959, "Выходной": 3439},
+        "Многодетный детский 20%": {"Будний": 2959, "Выходной": 3439},
+        "День рождения взрослый 50%": {"Будний": 1850, "Выходной": 2150},
+        "День рождения детский 50%": {"Будний": 1850, "Выходной": 2150},
+        "Билет взрослый групповой": {"Будний": 2300, "Выходной": 2300}
     },
     "📍 Локации": {
         "МК1": 3000, "МК2": 2500, "МК3": 2000, "МК4": 1500,
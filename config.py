@@ -1,23 +1,96 @@
 import os
 from dotenv import load_dotenv
 
+from pricing import DEFAULT_HOLIDAYS
+
 load_dotenv()
 
 class Config:
     BOT_TOKEN = os.getenv("BOT_TOKEN")
     ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "Pavel_Andch")
+    # Роли: «@ivan:manager,123456:cashier» (кассир — продажи и касса; менеджер —
+    # ещё возвраты, выплаты, пересчёт, закрытие смены, архив и выгрузки;
+    # администратор — ещё /role и /jobs). ADMIN_USERNAME — администратор.
+    ACCESS_ROLES = os.getenv("ACCESS_ROLES", "")
+    # Роль остальных пользователей; пусто — доступ только по списку
+    ACCESS_DEFAULT_ROLE = os.getenv("ACCESS_DEFAULT_ROLE", "cashier")
+    
+    # Площадка в шапке отчётов
+    VENUE_NAME = os.getenv("VENUE_NAME", "Астана, «Космопарк 01»")
+    # Другие площадки сети для /network: «Название=папка_архива[|хранилище.sqlite];...»
+    # (хранилище — общее SQLite площадки, из него берётся открытая смена)
+    NETWORK_VENUES = os.getenv("NETWORK_VENUES", "")
+    # Периоды длиннее N дней считаются в пуле процессов, короткие — в потоках
+    NETWORK_PROCESS_POOL_DAYS = int(os.getenv("NETWORK_PROCESS_POOL_DAYS", "7"))
     
     # Для Railway используем абсолютные пути
     REPORTS_FOLDER = os.getenv("REPORTS_FOLDER", "/tmp/reports")
     BACKUP_FOLDER = os.getenv("BACKUP_FOLDER", "/tmp/backups")
     CLOSED_SESSIONS_FOLDER = os.getenv("CLOSED_SESSIONS_FOLDER", "/tmp/closed_sessions")
     
+    # Автосохранение: запись после N изменений или через T мс после первого
+    # (1 изменение = максимальная надёжность, большие значения = меньше записей)
+    AUTO_SAVE_MAX_CHANGES = int(os.getenv("AUTO_SAVE_MAX_CHANGES", "5"))
+    AUTO_SAVE_MAX_DELAY_MS = int(os.getenv("AUTO_SAVE_MAX_DELAY_MS", "3000"))
+    
+    # Чеки открытой смены: сколько последних держать в памяти (старые уходят
+    # в файл рядом с бэкапом, 0 = все в памяти) и чеков на странице детализации
+    SALES_HOT_LIMIT = int(os.getenv("SALES_HOT_LIMIT", "200"))
+    RECEIPTS_PAGE_SIZE = int(os.getenv("RECEIPTS_PAGE_SIZE", "10"))
+    # Сколько готовых текстов отчётов смены (с учётом страниц) держать в памяти
+    REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "16"))
+    
+    # Остановка и перезапуск
+    SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10"))
+    RESTART_DELAY_SECONDS = float(os.getenv("RESTART_DELAY_SECONDS", "0.5"))
+    
+    # Окно, в котором повторное нажатие оплаты/возврата/закрытия считается дублем
+    CALLBACK_DEDUP_SECONDS = float(os.getenv("CALLBACK_DEDUP_SECONDS", "5"))
+    
+    # Архив закрытых смен: упаковка в gzip-пакеты по месяцам и срок хранения
+    # (0 дней хранения = хранить бессрочно)
+    ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "1"))
+    ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "365"))
+    # Сколько сводок недавно просмотренных смен держать в памяти
+    ARCHIVE_SUMMARY_CACHE_SIZE = int(os.getenv("ARCHIVE_SUMMARY_CACHE_SIZE", "32"))
+    
+    # Фоновые задания: автозакрытие забытой смены в ЧЧ:ММ (пусто = выключено),
+    # обслуживание архива, предрасчёт сводок в простое; случайный сдвиг запуска
+    SHIFT_AUTO_CLOSE_AT = os.getenv("SHIFT_AUTO_CLOSE_AT", "")
+    ARCHIVE_MAINTAIN_AT = os.getenv("ARCHIVE_MAINTAIN_AT", "04:00")
+    PRECOMPUTE_INTERVAL_SECONDS = float(os.getenv("PRECOMPUTE_INTERVAL_SECONDS", "900"))
+    SCHEDULER_IDLE_SECONDS = float(os.getenv("SCHEDULER_IDLE_SECONDS", "120"))
+    SCHEDULER_JITTER_SECONDS = float(os.getenv("SCHEDULER_JITTER_SECONDS", "60"))
+    # Проверка целостности чеков открытой смены в простое (и всегда при восстановлении)
+    INTEGRITY_CHECK_SECONDS = float(os.getenv("INTEGRITY_CHECK_SECONDS", "600"))
+    
+    # Ротация bot.log: по размеру или по времени (LOG_ROTATE_WHEN=midnight)
+    LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "")
+    # Структурированные события (продажи, возвраты, бэкапы) в JSON-строках;
+    # частые можно писать выборочно: LOG_EVENT_SAMPLE_RATES="backup_written=0.1"
+    LOG_EVENTS_FILE = os.getenv("LOG_EVENTS_FILE", "events.jsonl")
+    LOG_EVENT_SAMPLE_RATES = os.getenv("LOG_EVENT_SAMPLE_RATES", "")
+    
+    # Несколько воркеров: общее SQLite-хранилище смены/FSM и аренда polling
+    # (пусто = один процесс, состояние в памяти и бэкап в файле)
+    SHARED_STORE_PATH = os.getenv("SHARED_STORE_PATH", "")
+    LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "15"))
+    
+    # Живой отчёт: не чаще одного редактирования за N секунд и только при изменениях
+    DASHBOARD_REFRESH_SECONDS = float(os.getenv("DASHBOARD_REFRESH_SECONDS", "10"))
+    
+    # Праздничные дни с ценами выходного: «ММ-ДД» каждый год или «ГГГГ-ММ-ДД» разово
+    PRICING_HOLIDAYS = os.getenv("PRICING_HOLIDAYS", ",".join(DEFAULT_HOLIDAYS))
+    
+    # Интервал почасовой аналитики в минутах (15, 30, 60)
+    TIMELINE_BUCKET_MINUTES = int(os.getenv("TIMELINE_BUCKET_MINUTES", "60"))
+    
     @classmethod
     def create_folders(cls):
         """Создание папок при инициализации"""
         for folder in [cls.REPORTS_FOLDER, cls.BACKUP_FOLDER, cls.CLOSED_SESSIONS_FOLDER]:
             if not os.path.exists(folder):
                 os.makedirs(folder, exist_ok=True)
-
-# Создаем папки при импорте
-Config.create_folders()
\ No newline at end of file
@@ -0,0 +1,103 @@
+import asyncio
+import datetime
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from reports import build_metrics_report
+
+logger = logging.getLogger(__name__)
+
+# Ответы Telegram, после которых живое сообщение уже не обновить
+GONE_ERRORS = ("message to edit not found", "message can't be edited", "chat not found")
+
+
+class LiveDashboard:
+    """Закреплённые сообщения с показателями смены, обновляемые в фоне.
+
+    Одно сообщение на чат. Раз в ``interval`` секунд сравнивается снимок
+    счётчиков смены; сообщения редактируются, только если он изменился,
+    поэтому число запросов к API не зависит от темпа продаж.
+    """
+
+    def __init__(self, session, interval: float = 10.0):
+        self.session = session
+        self.interval = interval
+        # chat_id → message_id живого сообщения
+        self.pins = {}
+        self.edits = 0
+        self._signature = None
+        self._retry_at = 0.0
+        self._task = None
+
+    def render(self) -> str:
+        updated = datetime.datetime.now().strftime('%H:%M:%S')
+        return f"{build_metrics_report(self.session)}\n🔴 Live · обновлено в {updated}"
+
+    def pin(self, chat_id: int, message_id: int):
+        """Регистрация живого сообщения чата (прежнее перестаёт обновляться)"""
+        self.pins[chat_id] = message_id
+
+    def unpin(self, chat_id: int):
+        return self.pins.pop(chat_id, None)
+
+    def start(self, bot, reply_markup=None):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(bot, reply_markup))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, bot, reply_markup):
+        while True:
+            await asyncio.sleep(self.interval)
+            # После закрытия смены сообщения остаются с итогами до следующей
+            if self.pins and self.session.is_open:
+                await self.refresh(bot, reply_markup)
+
+    async def refresh(self, bot, reply_markup=None) -> int:
+        """Обновление всех живых сообщений, если показатели изменились.
+
+        Снимок запоминается, только когда обновлены все сообщения: после
+        временной ошибки (сеть, ограничение частоты) правка повторится.
+        """
+        signature = self.session.metrics.signature()
+        if signature == self._signature or time.monotonic() < self._retry_at:
+            return 0
+
+        text = self.render()
+        updated = 0
+        done = True
+        for chat_id, message_id in list(self.pins.items()):
+            try:
+                await bot.edit_message_text(
+                    text, chat_id=chat_id, message_id=message_id, reply_markup=reply_markup
+                )
+                updated += 1
+            except TelegramRetryAfter as e:
+                # Ограничение частоты — остальные чаты обновятся после паузы
+                logger.warning(f"⚠️ Живой отчёт: лимит Telegram, пауза {e.retry_after} с")
+                self._retry_at = time.monotonic() + e.retry_after
+                done = False
+                break
+            except (TelegramBadRequest, TelegramForbiddenError) as e:
+                if "message is not modified" in str(e):
+                    continue
+                if isinstance(e, TelegramForbiddenError) or any(error in str(e) for error in GONE_ERRORS):
+                    # Сообщение удалено или чат недоступен — больше его не трогаем
+                    logger.warning(f"⚠️ Живой отчёт в чате {chat_id} отключён: {e}")
+                    if self.pins.get(chat_id) == message_id:
+                        del self.pins[chat_id]
+                else:
+                    logger.warning(f"⚠️ Живой отчёт в чате {chat_id} не обновлён: {e}")
+                    done = False
+            except Exception as e:
+                logger.warning(f"⚠️ Живой отчёт в чате {chat_id} не обновлён: {e}")
+                done = False
+        if done:
+            self._signature = signature
+        self.edits += updated
+        return updated
@@ -0,0 +1,74 @@
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+
+
+def log_event(logger, event: str, message: str, level=logging.INFO, **fields):
+    """Запись в лог со структурированным событием (попадает и в events.jsonl)"""
+    logger.log(level, message, extra={"event": event, "fields": fields})
+
+
+def parse_sample_rates(text: str) -> dict:
+    """«backup_written=0.1,sale_recorded=0.5» → {событие: доля записей}"""
+    rates = {}
+    for part in (text or "").split(","):
+        name, _, rate = part.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class EventSampler(logging.Filter):
+    """Выборка частых событий: пропускает заданную долю записей события"""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, "event", None), 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class EventsOnly(logging.Filter):
+    def filter(self, record):
+        return hasattr(record, "event")
+
+
+class JsonEventFormatter(logging.Formatter):
+    """Одно событие — одна JSON-строка"""
+
+    def format(self, record):
+        return json.dumps({
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "event": record.event,
+            **record.fields
+        }, ensure_ascii=False, default=str)
+
+
+def start_queue_logging(handlers, sampler: EventSampler = None) -> logging.handlers.QueueListener:
+    """Перевод корневого логгера на очередь: обработчики пишут в отдельном потоке.
+
+    В цикле событий остаётся только постановка записи в очередь, а файлы и
+    консоль обслуживает QueueListener.
+    """
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    if sampler is not None:
+        # Выборка до постановки в очередь — отброшенные записи ничего не стоят
+        queue_handler.addFilter(sampler)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(logging.INFO)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,122 @@
+import csv
+import datetime
+import json
+import logging
+import os
+import tempfile
+
+from archive import ShiftArchive, shift_file_date
+from shift import item_qty, item_amount
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = [
+    "Смена", "Время", "Чек", "Позиция", "Категория",
+    "Цена", "Кол-во", "Сумма", "Наличные", "Безналичные", "Возврат чека"
+]
+
+def sales_filename(report_filename: str) -> str:
+    """Файл со строками продаж рядом с текстовым отчётом смены"""
+    return report_filename[:-len(".txt")] + ".jsonl"
+
+def save_session_sales(sales, filename: str) -> bool:
+    """Сохранение продаж закрытой смены построчно (один чек — одна строка JSON)"""
+    try:
+        with open(filename, 'w', encoding='utf-8') as f:
+            for sale in sales:
+                f.write(json.dumps(sale, ensure_ascii=False, default=str))
+                f.write("\n")
+        logger.info(f"Продажи смены сохранены в файл: {filename}")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении продаж смены: {e}")
+        return False
+
+def iter_saved_sales(archive: ShiftArchive, filename: str):
+    """Чтение продаж закрытой смены по одному чеку, без загрузки файла целиком"""
+    for line in archive.iter_lines(filename):
+        if line.strip():
+            yield json.loads(line)
+
+def find_sales_files(date_from: datetime.date, date_to: datetime.date, archive: ShiftArchive):
+    """Файлы продаж закрытых смен за период (по дате закрытия), от старых к новым"""
+    files = []
+    for filename in archive.list_files('.jsonl'):
+        try:
+            file_date = shift_file_date(filename).date()
+        except ValueError:
+            logger.warning(f"Не удалось определить дату файла {filename}")
+            continue
+        if date_from <= file_date <= date_to:
+            files.append(filename)
+    files.sort()
+    return files
+
+def split_payment(sale):
+    """Разнесение нал/безнал чека по позициям пропорционально сумме строки"""
+    items = sale["items"]
+    total = sale["total"]
+    cash_left = sale["cash_amount"]
+    cashless_left = sale["cashless_amount"]
+
+    for index, item in enumerate(items):
+        if index == len(items) - 1:
+            # Остаток на последнюю позицию, чтобы сумма по строкам сошлась с чеком
+            cash, cashless = cash_left, cashless_left
+        elif total:
+            cash = round(item_amount(item) * sale["cash_amount"] / total)
+            cashless = item_amount(item) - cash
+        else:
+            cash, cashless = 0, 0
+        cash_left -= cash
+        cashless_left -= cashless
+        yield item, cash, cashless
+
+def iter_export_rows(shift_name: str, sales):
+    """Строки выгрузки: по одной на каждую позицию каждого чека"""
+    for sale in sales:
+        sale_time = sale["time"]
+        if isinstance(sale_time, datetime.datetime):
+            sale_time = sale_time.isoformat(sep=" ", timespec="seconds")
+        for item, cash, cashless in split_payment(sale):
+            yield [
+                shift_name,
+                str(sale_time)[:19].replace("T", " "),
+                sale["id"],
+                item["item"],
+                item["category"],
+                item["price"],
+                item_qty(item),
+                item_amount(item),
+                cash,
+                cashless,
+                sale.get("refund_of") or "",
+            ]
+
+def write_export(shifts, directory=None) -> tuple[str, int]:
+    """Потоковая запись выгрузки во временный CSV.
+
+    ``shifts`` — итерируемое пар (название смены, итерируемое чеков). Строки
+    пишутся по мере чтения, поэтому память не зависит от длины периода.
+    Возвращает путь к файлу и количество строк.
+    """
+    fd, path = tempfile.mkstemp(prefix="export_", suffix=".csv", dir=directory)
+    rows = 0
+    try:
+        # utf-8-sig и ";" — чтобы Excel сразу открыл кириллицу по колонкам
+        with os.fdopen(fd, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(EXPORT_COLUMNS)
+            for shift_name, sales in shifts:
+                for row in iter_export_rows(shift_name, sales):
+                    writer.writerow(row)
+                    rows += 1
+    except Exception:
+        os.remove(path)
+        raise
+    return path, rows
+
+def iter_period_shifts(date_from: datetime.date, date_to: datetime.date, archive: ShiftArchive):
+    """Закрытые смены периода в виде (название, генератор чеков)"""
+    for filename in find_sales_files(date_from, date_to, archive):
+        yield filename[:-len(".jsonl")], iter_saved_sales(archive, filename)
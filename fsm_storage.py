@@ -0,0 +1,30 @@
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+from shared_store import SQLiteStore
+
+
+class SQLiteFSMStorage(BaseStorage):
+    """FSM-хранилище aiogram поверх общего SQLiteStore"""
+
+    def __init__(self, store: SQLiteStore):
+        self.store = store
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id}:{key.destiny}"
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self.store.set_fsm_state(self._key(key), state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey):
+        return self.store.get_fsm(self._key(key))[0]
+
+    async def set_data(self, key: StorageKey, data: dict) -> None:
+        self.store.set_fsm_data(self._key(key), data)
+
+    async def get_data(self, key: StorageKey) -> dict:
+        return self.store.get_fsm(self._key(key))[1]
+
+    async def close(self) -> None:
+        pass
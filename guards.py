@@ -0,0 +1,77 @@
+import logging
+import time
+from collections import OrderedDict
+
+from callbacks import Op, SEP
+
+logger = logging.getLogger(__name__)
+
+# Необратимые действия: повторное нажатие той же кнопки на том же экране
+# сообщения в течение окна считается дублем (двойной тап, повторная доставка)
+ONCE_ACTIONS = {Op.OPEN_SHIFT, Op.CLOSE_SHIFT, Op.PAY_CASH, Op.PAY_CARD, Op.REFUND_SALE}
+
+
+class RecentKeys:
+    """Ограниченный набор недавно виденных ключей с временем жизни"""
+
+    def __init__(self, ttl: float, max_size: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._keys = OrderedDict()
+
+    def seen(self, key) -> bool:
+        """True, если ключ уже был в пределах ttl; иначе запоминает его"""
+        now = time.monotonic()
+        # Ключи добавляются по времени, поэтому устаревшие всегда в начале
+        while self._keys:
+            oldest_key, added_at = next(iter(self._keys.items()))
+            if now - added_at < self.ttl and len(self._keys) < self.max_size:
+                break
+            self._keys.popitem(last=False)
+
+        if key in self._keys:
+            return True
+        self._keys[key] = now
+        return False
+
+
+def is_once_action(data: str | None) -> bool:
+    if not data:
+        return False
+    return data.split(SEP, 1)[0] in ONCE_ACTIONS
+
+
+class IdempotencyGuard:
+    """Отсев повторно доставленных обновлений и дублей необратимых callback'ов"""
+
+    def __init__(self, window_seconds: float = 5.0):
+        self.updates = RecentKeys(ttl=max(window_seconds, 60.0))
+        self.callbacks = RecentKeys(ttl=window_seconds)
+        self.dropped = 0
+
+    async def drop_duplicate_updates(self, handler, update, data):
+        """Outer-middleware для dp.update: одно update_id обрабатывается один раз"""
+        if self.updates.seen(update.update_id):
+            self.dropped += 1
+            logger.warning(f"⚠️ Повторная доставка обновления {update.update_id} отброшена")
+            return None
+        return await handler(update, data)
+
+    async def drop_duplicate_callbacks(self, handler, callback, data):
+        """Outer-middleware для dp.callback_query: ключ — сообщение + кнопка"""
+        message = callback.message
+        if is_once_action(callback.data) and message is not None:
+            # edit_date меняется при каждом редактировании сообщения, поэтому
+            # повторная продажа в том же сообщении после нового экрана — не дубль
+            rendered_at = message.edit_date or message.date
+            key = (message.chat.id, message.message_id, rendered_at, callback.data)
+            if self.callbacks.seen(key):
+                self.dropped += 1
+                logger.info(f"ℹ️ Дубль нажатия «{callback.data}» отброшен")
+                await callback.answer("⏳ Уже выполнено")
+                return None
+        return await handler(callback, data)
+
+    def install(self, dispatcher):
+        dispatcher.update.outer_middleware(self.drop_duplicate_updates)
+        dispatcher.callback_query.outer_middleware(self.drop_duplicate_callbacks)
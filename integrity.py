@@ -0,0 +1,180 @@
+import datetime
+import json
+import logging
+import os
+
+from ledger import CashLedger
+from metrics import ShiftMetrics
+
+logger = logging.getLogger(__name__)
+
+# Поля, без которых чек нельзя учесть ни в отчётах, ни в кассе
+REQUIRED_FIELDS = ("id", "items", "cash_amount", "cashless_amount", "time")
+
+
+def _number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _structure_error(sale):
+    """Причина, по которой чек нельзя учесть (None — структура в порядке)"""
+    if not isinstance(sale, dict):
+        return "чек не является записью"
+    missing = [field for field in REQUIRED_FIELDS if field not in sale]
+    if missing:
+        return f"нет полей: {', '.join(missing)}"
+    if not isinstance(sale["id"], int) or isinstance(sale["id"], bool):
+        return "номер чека не число"
+    if not _number(sale["cash_amount"]) or not _number(sale["cashless_amount"]):
+        return "суммы оплаты не числа"
+    if not isinstance(sale["items"], list):
+        return "позиции не списком"
+    for item in sale["items"]:
+        if not isinstance(item, dict) or not _number(item.get("price")) or "item" not in item or "category" not in item:
+            return "повреждена позиция чека"
+        if not _number(item.get("qty", 1)):
+            return "количество позиции не число"
+    if not isinstance(sale["time"], datetime.datetime):
+        try:
+            datetime.datetime.fromisoformat(sale["time"])
+        except (TypeError, ValueError):
+            return "время чека не разбирается"
+    return None
+
+
+class IntegrityReport:
+    """Итог проверки: исправленные, отложенные в карантин и подозрительные чеки"""
+
+    def __init__(self, bucket_minutes: int = 60):
+        self.sales = []
+        self.repaired = []
+        self.quarantined = []
+        self.flagged = []
+        self.metrics = ShiftMetrics(bucket_minutes)
+        # Наличные продажи и возвраты по чекам (без ручных операций кассы)
+        self.ledger = CashLedger()
+        self.checked = 0
+
+    @property
+    def changed(self) -> bool:
+        """Список чеков отличается от проверенного — его нужно заменить"""
+        return bool(self.repaired or self.quarantined)
+
+    def summary(self) -> str:
+        return (f"чеков {self.checked}, исправлено {len(self.repaired)}, "
+                f"в карантине {len(self.quarantined)}, подозрительных {len(self.flagged)}")
+
+
+def verify_sales(sales, bucket_minutes: int = 60) -> IntegrityReport:
+    """Проверка чеков смены за один проход.
+
+    Инварианты: номера чеков уникальны; total = наличные + безнал = сумма
+    позиций; возврат ссылается на более ранний обычный чек, один на чек и
+    на ту же сумму. Попутно заново считаются показатели и наличные кассы —
+    их сравнивают с текущими счётчиками смены.
+
+    Исправляется то, что однозначно выводится из самого чека (итог по оплате
+    и позициям, повтор номера, время строкой). Чек без обязательных полей и
+    точный дубль уходят в карантин. Расхождения оплаты с позициями и
+    нарушения связи возвратов только отмечаются: за ними стоят реальные
+    деньги, и решать по ним должен человек.
+
+    Исправленный список чеков собирается вторым проходом и только если
+    что-то исправлено: обычно вытесненные в файл чеки в памяти не копятся.
+    """
+    report = _verify(sales, bucket_minutes, collect=False)
+    if report.changed:
+        report.sales = _verify(sales, bucket_minutes, collect=True).sales
+    return report
+
+
+def _verify(sales, bucket_minutes, collect) -> IntegrityReport:
+    # Исправления — только в копиях чеков (исходные не меняются): оба прохода
+    # видят одинаковые данные, а в смену исправления попадают через собранный список
+    report = IntegrityReport(bucket_minutes)
+    # Номер чека → (ссылка на возврат, наличные, безнал, итог, время) — без самих чеков
+    seen = {}
+    refunded = set()
+    renumber = []
+    max_id = 0
+
+    for sale in sales:
+        report.checked += 1
+        error = _structure_error(sale)
+        if error:
+            report.quarantined.append((sale, error))
+            continue
+
+        sale_id = sale["id"]
+        if not isinstance(sale["time"], datetime.datetime):
+            # Время строкой (загрузка бэкапа не смогла его разобрать сама)
+            report.repaired.append((sale_id, "время строкой → datetime"))
+            sale = dict(sale, time=datetime.datetime.fromisoformat(sale["time"]))
+
+        key = (sale.get("refund_of"), sale["cash_amount"], sale["cashless_amount"], sale.get("total"), sale["time"])
+        duplicate = sale_id in seen
+        if duplicate:
+            if seen[sale_id] == key:
+                report.quarantined.append((sale, f"повтор чека #{sale_id}"))
+                continue
+        else:
+            seen[sale_id] = key
+            max_id = max(max_id, sale_id)
+
+        paid = sale["cash_amount"] + sale["cashless_amount"]
+        items_sum = sum(item["price"] * item.get("qty", 1) for item in sale["items"])
+        if paid == items_sum:
+            if sale.get("total") != paid:
+                report.repaired.append((sale_id, f"итог {sale.get('total')} → {paid}"))
+                sale = dict(sale, total=paid)
+        else:
+            report.flagged.append((sale_id, f"оплачено {paid}, позиций на {items_sum}"))
+            if "total" not in sale:
+                report.repaired.append((sale_id, f"нет итога → {paid}"))
+                sale = dict(sale, total=paid)
+
+        refund_of = sale.get("refund_of")
+        if refund_of is not None:
+            original = seen.get(refund_of) if refund_of != sale_id else None
+            if original is None:
+                report.flagged.append((sale_id, f"возврат несуществующего чека #{refund_of}"))
+            elif original[0] is not None:
+                report.flagged.append((sale_id, f"возврат чека возврата #{refund_of}"))
+            elif refund_of in refunded:
+                report.flagged.append((sale_id, f"повторный возврат чека #{refund_of}"))
+            elif (sale["cash_amount"], sale["cashless_amount"]) != (-original[1], -original[2]):
+                report.flagged.append((sale_id, f"сумма возврата не совпадает с чеком #{refund_of}"))
+            refunded.add(refund_of)
+
+        if duplicate:
+            # Другой чек под занятым номером — новый номер получит после прохода.
+            # Копия берётся последней: исправления итога выше заменяют sale
+            sale = dict(sale)
+            renumber.append(sale)
+        if collect:
+            report.sales.append(sale)
+        report.metrics.add_sale(sale)
+        report.ledger.record_sale(sale)
+
+    for sale in renumber:
+        max_id += 1
+        report.repaired.append((max_id, f"повтор номера #{sale['id']} → #{max_id}"))
+        sale["id"] = max_id
+    return report
+
+
+def metrics_match(current: ShiftMetrics, fresh: ShiftMetrics) -> bool:
+    """Счётчики смены совпадают с пересчитанными по чекам"""
+    return (current.signature() == fresh.signature()
+            and current.categories == fresh.categories
+            and current.timeline.buckets == fresh.timeline.buckets)
+
+
+def write_quarantine(path: str, quarantined: list):
+    """Дописывание отложенных чеков в файл карантина (JSON-строки с причиной)"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    found_at = datetime.datetime.now().isoformat(timespec="seconds")
+    with open(path, 'a', encoding='utf-8') as f:
+        for sale, reason in quarantined:
+            f.write(json.dumps({"reason": reason, "found_at": found_at, "sale": sale},
+                               ensure_ascii=False, default=str) + "\n")
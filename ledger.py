@@ -0,0 +1,94 @@
+import datetime
+
+# Ручные операции с кассой (наличные продажи и возвраты берутся из чеков)
+EXCHANGE = "exchange"
+PAYOUT = "payout"
+COUNT = "count"
+
+
+class CashLedger:
+    """Журнал наличных в кассе с текущими итогами.
+
+    Размен, пополнения, выплаты и пересчёты хранятся как записи, а продажи
+    и возвраты наличными учитываются из чеков. Ожидаемая сумма и расхождение
+    с пересчётом берутся из итогов, без повторного прохода по чекам.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.exchange_total = 0
+        self.exchange_count = 0
+        self.cash_sales = 0
+        self.cash_refunds = 0
+        self.payouts = 0
+        self.counted = None
+        self.counted_at = None
+        self.counted_expected = None
+
+    @classmethod
+    def restore(cls, events, sales):
+        """Восстановление из сохранённых записей и чеков смены"""
+        ledger = cls()
+        for event in events:
+            ledger._apply(event)
+        for sale in sales:
+            ledger.record_sale(sale)
+        return ledger
+
+    def _apply(self, event):
+        self.events.append(event)
+        if event["type"] == EXCHANGE:
+            self.exchange_total += event["amount"]
+            self.exchange_count += 1
+        elif event["type"] == PAYOUT:
+            self.payouts += event["amount"]
+        elif event["type"] == COUNT:
+            self.counted = event["amount"]
+            self.counted_at = event["time"]
+            # Записи до сохранения ожидаемой суммы сверяются с текущей
+            self.counted_expected = event.get("expected")
+
+    def _add(self, event_type, amount, note=None, **extra):
+        self._apply({
+            "type": event_type,
+            "amount": amount,
+            "note": note,
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            **extra
+        })
+
+    def add_exchange(self, amount: int):
+        """Размен или пополнение размена"""
+        self._add(EXCHANGE, amount)
+
+    def add_payout(self, amount: int, note: str = None):
+        """Выплата наличных из кассы"""
+        self._add(PAYOUT, amount, note)
+
+    def record_count(self, amount: int):
+        """Пересчёт кассы (учитывается последний) с ожидаемой на этот момент суммой"""
+        self._add(COUNT, amount, expected=self.expected)
+
+    def record_sale(self, sale):
+        """Наличная часть чека: продажа или возврат (отрицательная сумма)"""
+        cash = sale["cash_amount"]
+        if cash >= 0:
+            self.cash_sales += cash
+        else:
+            self.cash_refunds -= cash
+
+    @property
+    def expected(self) -> int:
+        """Сколько наличных должно быть в кассе"""
+        return self.exchange_total + self.cash_sales - self.cash_refunds - self.payouts
+
+    @property
+    def discrepancy(self):
+        """Пересчитано минус ожидаемое на момент пересчёта (None — кассу не пересчитывали).
+
+        Операции после пересчёта меняют ожидаемую сумму, но не расхождение.
+        """
+        if self.counted is None:
+            return None
+        expected = self.expected if self.counted_expected is None else self.counted_expected
+        return self.counted - expected
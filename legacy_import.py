@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Импорт старых текстовых отчётов смен в построчные продажи и сводки.
+
+Для каждого смена_*.txt без файла продаж разбирается детализация по чекам
+и пишутся смена_*.jsonl и смена_*.summary.json — после этого старые смены
+доступны в /export, /peaks и архиве так же, как новые. Разбор идёт в пуле
+процессов; хэши обработанных отчётов хранятся в import_state.json, поэтому
+повторный запуск продолжает с места остановки и пропускает готовое.
+
+    python legacy_import.py [--workers N] [--force]
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config import Config
+from archive import ShiftArchive
+from catalog import Catalog
+from metrics import ShiftMetrics
+from export import sales_filename, save_session_sales
+from summaries import summary_filename, summarize_metrics, save_shift_summary
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "import_state.json"
+FREE_CATEGORY = "📝 Свободные позиции"
+
+HEADER_TIME = re.compile(r"^(Смена от|Закрыта): (\d{2}\.\d{2}\.\d{4} \d{2}:\d{2})$")
+CATEGORY_LINE = re.compile(r"^▶ (.+):$")
+CATEGORY_ITEM = re.compile(r"^\s+• (.+?): -?\d+ шт\.")
+RECEIPT_LINE = re.compile(r"^🧾 Чек #(\d+) \((\d{2}:\d{2}:\d{2})\)$")
+MIXED_LINE = re.compile(r"💱 Смешанная \((-?[\d.]+)₸ нал \+ (-?[\d.]+)₸ безнал\)")
+TOTAL_LINE = re.compile(r"^\s+💰 Сумма: (-?[\d.]+)₸$")
+ITEM_LINE = re.compile(r"^\s+\d+\. (.+)$")
+# «МК1 - 2 × 3.000₸ = 6.000₸» и «Бдб ×3 - БЕСПЛАТНО»
+QTY_PRICE = re.compile(r"^(\d+) × (-?[\d.]+)₸ = -?[\d.]+₸$")
+FREE_QTY = re.compile(r"^(.+) ×(\d+)$")
+
+
+def parse_money(text: str) -> int:
+    """«-3.699₸» → -3699 (формат format_currency)"""
+    return int(text.replace("₸", "").replace(".", ""))
+
+
+def parse_item(line: str, categories: dict) -> dict:
+    name, _, price_text = line.rpartition(" - ")
+    qty = 1
+    if price_text == "БЕСПЛАТНО":
+        price = 0
+        if match := FREE_QTY.match(name):
+            name, qty = match.group(1), int(match.group(2))
+    elif match := QTY_PRICE.match(price_text):
+        qty, price = int(match.group(1)), parse_money(match.group(2))
+    else:
+        price = parse_money(price_text)
+    return {"item": name, "price": price, "category": categories.get(name, FREE_CATEGORY), "qty": qty}
+
+
+def parse_report(text: str, catalog_categories: dict) -> dict:
+    """Разбор текстового отчёта смены в список чеков.
+
+    Категории берутся из раздела «детализация по категориям» отчёта, затем
+    из справочника. Способ оплаты возврата в старых отчётах не указан
+    («Бесплатно» с отрицательной суммой) — такие чеки считаются наличными.
+    """
+    times = {}
+    categories = dict(catalog_categories)
+    sales = []
+    current_category = None
+    in_receipts = False
+    sale = None
+
+    for line in text.splitlines():
+        if match := HEADER_TIME.match(line):
+            times[match.group(1)] = datetime.datetime.strptime(match.group(2), "%d.%m.%Y %H:%M")
+            continue
+        if line.startswith("📋 Детализация по чекам"):
+            in_receipts = True
+            continue
+
+        if not in_receipts:
+            if match := CATEGORY_LINE.match(line):
+                current_category = match.group(1)
+            elif current_category and (match := CATEGORY_ITEM.match(line)):
+                categories[match.group(1)] = current_category
+            continue
+
+        if match := RECEIPT_LINE.match(line):
+            sale = {"id": int(match.group(1)), "time": match.group(2), "items": [],
+                    "payment": None, "total": 0}
+            sales.append(sale)
+        elif sale is None:
+            continue
+        elif match := TOTAL_LINE.match(line):
+            sale["total"] = parse_money(match.group(1))
+        elif match := MIXED_LINE.search(line):
+            sale["payment"] = (parse_money(match.group(1)), parse_money(match.group(2)))
+        elif "💵 Наличные" in line or "🎁 Бесплатно" in line:
+            sale["payment"] = "cash"
+        elif "💳 Карта" in line:
+            sale["payment"] = "card"
+        elif match := ITEM_LINE.match(line):
+            sale["items"].append(parse_item(match.group(1), categories))
+
+    open_time = times.get("Смена от")
+    if open_time is None:
+        raise ValueError("нет строки «Смена от»")
+
+    result = []
+    for sale in sales:
+        moment = datetime.datetime.combine(open_time.date(), datetime.time.fromisoformat(sale["time"]))
+        if moment < open_time - datetime.timedelta(minutes=1):
+            # Чек после полуночи
+            moment += datetime.timedelta(days=1)
+        if isinstance(sale["payment"], tuple):
+            cash, cashless = sale["payment"]
+        elif sale["payment"] == "card":
+            cash, cashless = 0, sale["total"]
+        else:
+            cash, cashless = sale["total"], 0
+        result.append({
+            "id": sale["id"],
+            "items": sale["items"],
+            "cash_amount": cash,
+            "cashless_amount": cashless,
+            "time": moment,
+            "total": sale["total"],
+            "refund_of": None
+        })
+
+    return {"open_time": open_time, "close_time": times.get("Закрыта"), "sales": result}
+
+
+def _parse_worker(args):
+    filename, data, catalog_categories = args
+    try:
+        return filename, parse_report(data.decode("utf-8"), catalog_categories), None
+    except Exception as e:
+        return filename, None, str(e)
+
+
+class LegacyImporter:
+    """Инкрементальный импорт: отчёты без продаж, изменившиеся с прошлого раза"""
+
+    def __init__(self, config=Config, workers=None):
+        self.folder = config.CLOSED_SESSIONS_FOLDER
+        self.archive = ShiftArchive(config)
+        self.workers = workers
+        self.state_path = os.path.join(self.folder, STATE_FILE)
+        self.catalog_categories = Catalog().sale_categories()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self, state):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def pending(self, state, force=False):
+        """Отчёты для разбора: (имя, содержимое, sha256)"""
+        reports = self.archive.list_files('.txt')
+        with_sales = self.archive.list_files('.jsonl')
+        for filename in sorted(reports):
+            imported = filename in state
+            # Смены, закрытые уже с файлом продаж, импортировать не нужно
+            if sales_filename(filename) in with_sales and not imported:
+                continue
+            data = self.archive.read_bytes(filename)
+            digest = hashlib.sha256(data).hexdigest()
+            if not force and state.get(filename) == digest:
+                continue
+            yield filename, data, digest
+
+    def run(self, force=False) -> dict:
+        started = time.perf_counter()
+        state = self._load_state()
+        stats = {"files": 0, "failed": 0, "receipts": 0, "bytes": 0}
+
+        jobs = list(self.pending(state, force))
+        digests = {filename: digest for filename, _, digest in jobs}
+        stats["bytes"] = sum(len(data) for _, data, _ in jobs)
+        if not jobs:
+            logger.info("📭 Новых отчётов для импорта нет")
+            return stats
+
+        logger.info(f"📥 К импорту отчётов: {len(jobs)}")
+        args = ((filename, data, self.catalog_categories) for filename, data, _ in jobs)
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for filename, report, error in pool.map(_parse_worker, args, chunksize=4):
+                if error:
+                    stats["failed"] += 1
+                    logger.error(f"❌ Не удалось разобрать {filename}: {error}")
+                    continue
+
+                path = os.path.join(self.folder, filename)
+                metrics = ShiftMetrics.from_sales(report["sales"])
+                summary = summarize_metrics(metrics, report["open_time"], report["close_time"])
+                if not (save_session_sales(report["sales"], sales_filename(path))
+                        and save_shift_summary(summary, summary_filename(path))):
+                    stats["failed"] += 1
+                    continue
+
+                # Состояние пишется после каждого файла — прерванный импорт продолжится
+                state[filename] = digests[filename]
+                self._save_state(state)
+                stats["files"] += 1
+                stats["receipts"] += len(report["sales"])
+
+        elapsed = time.perf_counter() - started
+        stats["seconds"] = elapsed
+        logger.info(
+            f"✅ Импортировано смен: {stats['files']} (чеков: {stats['receipts']}, ошибок: {stats['failed']}) "
+            f"за {elapsed:.1f} с — {stats['files'] / elapsed:.1f} файлов/с, "
+            f"{stats['bytes'] / elapsed / 1024 / 1024:.2f} МБ/с"
+        )
+        return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Импорт старых отчётов смен")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию — по ядрам)")
+    parser.add_argument("--force", action="store_true", help="разобрать заново уже импортированные")
+    options = parser.parse_args()
+    LegacyImporter(Config, workers=options.workers).run(force=options.force)
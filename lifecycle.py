@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import signal
+import time
+from contextlib import suppress
+
+logger = logging.getLogger(__name__)
+
+
+class LifecycleManager:
+    """Жизненный цикл бота: сигналы остановки и дренаж активных обработчиков"""
+
+    def __init__(self, drain_timeout=10.0):
+        self.drain_timeout = drain_timeout
+        self.in_flight = 0
+        self.stop_requested = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._dispatcher = None
+        # Время последнего обработанного обновления (для фоновых заданий)
+        self.last_update = time.monotonic()
+
+    async def track_update(self, handler, event, data):
+        """Outer-middleware: учитывает обновления, которые сейчас обрабатываются"""
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.in_flight -= 1
+            self.last_update = time.monotonic()
+            if self.in_flight == 0:
+                self._idle.set()
+
+    def idle_for(self) -> float:
+        """Сколько секунд бот простаивает (0 — обновления обрабатываются сейчас)"""
+        if self.in_flight:
+            return 0.0
+        return time.monotonic() - self.last_update
+
+    def install(self, dispatcher):
+        """Подключение учёта обработчиков к диспетчеру"""
+        self._dispatcher = dispatcher
+        dispatcher.update.outer_middleware(self.track_update)
+
+    def install_signal_handlers(self):
+        """Перехват SIGTERM/SIGINT вместо встроенной обработки aiogram"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            # На Windows add_signal_handler не поддерживается — остаётся KeyboardInterrupt
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(sig, self.request_stop, sig)
+
+    def request_stop(self, sig=None):
+        """Запрос на остановку: прекращаем polling, дальше работает shutdown"""
+        if self.stop_requested:
+            logger.warning("⚠️ Повторный сигнал остановки, ждём завершения обработчиков")
+            return
+        self.stop_requested = True
+        name = signal.Signals(sig).name if sig else "запрос"
+        logger.info(f"🛑 Получен сигнал остановки ({name})")
+        if self._dispatcher is not None:
+            asyncio.get_running_loop().create_task(self.stop_polling())
+
+    async def stop_polling(self):
+        """Остановка polling без завершения процесса (stop_requested не ставится)"""
+        # Сигнал мог прийти до старта polling — тогда main() сам не запустит его
+        with suppress(RuntimeError):
+            await self._dispatcher.stop_polling()
+
+    async def drain(self):
+        """Ожидание завершения активных обработчиков не дольше drain_timeout"""
+        if self.in_flight == 0:
+            return True
+        logger.info(f"⏳ Ожидаем завершения обработчиков: {self.in_flight}")
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=self.drain_timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"⚠️ Не дождались {self.in_flight} обработчиков за {self.drain_timeout} сек"
+            )
+            return False
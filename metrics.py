@@ -0,0 +1,168 @@
+import datetime
+
+from categories import PEOPLE_ITEMS, ONLINE_COMBO_ITEMS, INVITATION_ITEMS
+from pricing import WEEKDAY, WEEKEND, item_day_type
+
+# Категории для распределения выручки
+DOPS_CATEGORIES = ("📍 Локации", "🍿 Комбо")
+SHOP_CATEGORIES = ("📝 Другие позиции", "📝 Свободные позиции")
+
+
+def sale_time(sale) -> datetime.datetime:
+    """Время чека (в сохранённых сменах оно строкой)"""
+    value = sale["time"]
+    return value if isinstance(value, datetime.datetime) else datetime.datetime.fromisoformat(value)
+
+
+def sale_people(sale) -> int:
+    """Количество людей в чеке (по входным билетам, без возвратов)"""
+    return sum(
+        item.get("qty", 1) for item in sale["items"]
+        if item["item"] in PEOPLE_ITEMS and item["price"] >= 0
+    )
+
+
+class SalesTimeline:
+    """Продажи по интервалам времени суток (по 15 мин, часу и т.п.)"""
+
+    def __init__(self, bucket_minutes: int = 60):
+        self.bucket_minutes = bucket_minutes
+        # минута начала интервала от полуночи → счётчики интервала
+        self.buckets = {}
+        self.shifts = 1
+
+    def add_sale(self, sale, people: int = None):
+        moment = sale_time(sale)
+        start = (moment.hour * 60 + moment.minute) // self.bucket_minutes * self.bucket_minutes
+        bucket = self.buckets.get(start)
+        if bucket is None:
+            bucket = self.buckets[start] = {"receipts": 0, "people": 0, "revenue": 0, "cash": 0, "cashless": 0}
+        bucket["receipts"] += 1
+        bucket["people"] += sale_people(sale) if people is None else people
+        bucket["revenue"] += sale["total"]
+        bucket["cash"] += sale["cash_amount"]
+        bucket["cashless"] += sale["cashless_amount"]
+
+    def merge(self, other: "SalesTimeline"):
+        """Сложение с другой сменой (для сводки по архиву)"""
+        for start, counters in other.buckets.items():
+            bucket = self.buckets.setdefault(start, dict.fromkeys(counters, 0))
+            for name, value in counters.items():
+                bucket[name] += value
+        self.shifts += other.shifts
+
+    def peak(self):
+        """Самый загруженный интервал: по людям, при равенстве — по выручке"""
+        if not self.buckets:
+            return None
+        return max(self.buckets, key=lambda start: (self.buckets[start]["people"], self.buckets[start]["revenue"]))
+
+
+class ShiftMetrics:
+    """Показатели смены, обновляемые по одному чеку (без пересчёта всех продаж)"""
+
+    def __init__(self, bucket_minutes: int = 60):
+        self.receipts = 0
+        self.items = 0
+        self.cash = 0
+        self.cashless = 0
+        self.revenue = 0
+        self.people = 0
+        self.online_combo = 0
+        self.invitations = 0
+        self.partners = 0
+        self.bloggers = 0
+        self.dops_revenue = 0
+        self.shop_revenue = 0
+        # Для среднего чека магазина — только покупатели магазина
+        self.shop_buyers = 0
+        # Выручка позиций с ценой по типу дня (билеты и скидки)
+        self.weekday_revenue = 0
+        self.weekend_revenue = 0
+        # Категория → {"items": {товар: {"count", "revenue"}}, "total_count", "total_revenue"}
+        self.categories = {}
+        self.timeline = SalesTimeline(bucket_minutes)
+
+    @classmethod
+    def from_sales(cls, sales, bucket_minutes: int = 60):
+        metrics = cls(bucket_minutes)
+        for sale in sales:
+            metrics.add_sale(sale)
+        return metrics
+
+    def add_sale(self, sale):
+        """Учёт нового чека (возвраты приходят с отрицательными ценами)"""
+        self.receipts += 1
+        self.cash += sale["cash_amount"]
+        self.cashless += sale["cashless_amount"]
+        self.revenue += sale["total"]
+        has_shop_items = any(item["category"] in SHOP_CATEGORIES for item in sale["items"])
+        people = sale_people(sale)
+        self.people += people
+        self.timeline.add_sale(sale, people)
+
+        for item in sale["items"]:
+            item_name = item["item"]
+            price = item["price"]
+            qty = item.get("qty", 1)
+            category = item["category"]
+            self.items += qty
+
+            stats = self.categories.setdefault(category, {"items": {}, "total_count": 0, "total_revenue": 0})
+            item_stats = stats["items"].setdefault(item_name, {"count": 0, "revenue": 0})
+            item_stats["count"] += qty
+            item_stats["revenue"] += price * qty
+            stats["total_count"] += qty
+            stats["total_revenue"] += price * qty
+
+            day_type = item_day_type(item_name)
+            if day_type == WEEKDAY:
+                self.weekday_revenue += price * qty
+            elif day_type == WEEKEND:
+                self.weekend_revenue += price * qty
+
+            # Штучные показатели — только положительные продажи
+            if price >= 0:
+                if item_name in ONLINE_COMBO_ITEMS:
+                    self.online_combo += qty
+                if item_name in INVITATION_ITEMS:
+                    self.invitations += qty
+                if item_name == "Партнёр":
+                    self.partners += qty
+                if item_name == "Блогер":
+                    self.bloggers += qty
+
+            # Распределение выручки (учитываем все, включая возвраты)
+            if category in DOPS_CATEGORIES:
+                self.dops_revenue += price * qty
+            elif category in SHOP_CATEGORIES:
+                self.shop_revenue += price * qty
+                if price > 0 and has_shop_items:
+                    self.shop_buyers += qty
+
+    def merge(self, other: "ShiftMetrics"):
+        """Сложение с показателями другой смены или площадки (для сводки по сети)"""
+        for name, value in other.__dict__.items():
+            if isinstance(value, (int, float)):
+                setattr(self, name, getattr(self, name) + value)
+        for category, other_stats in other.categories.items():
+            stats = self.categories.setdefault(category, {"items": {}, "total_count": 0, "total_revenue": 0})
+            for item_name, other_item in other_stats["items"].items():
+                item_stats = stats["items"].setdefault(item_name, {"count": 0, "revenue": 0})
+                item_stats["count"] += other_item["count"]
+                item_stats["revenue"] += other_item["revenue"]
+            stats["total_count"] += other_stats["total_count"]
+            stats["total_revenue"] += other_stats["total_revenue"]
+        self.timeline.merge(other.timeline)
+
+    @property
+    def avg_check_total(self):
+        return (self.dops_revenue + self.shop_revenue) / self.people if self.people > 0 else 0
+
+    @property
+    def avg_check_shop(self):
+        return self.shop_revenue / self.shop_buyers if self.shop_buyers > 0 else 0
+
+    def signature(self) -> tuple:
+        """Снимок счётчиков: если он не изменился, отчёт перерисовывать не нужно"""
+        return tuple(value for value in self.__dict__.values() if not isinstance(value, (SalesTimeline, dict)))
@@ -4,4 +4,7 @@ class SessionStates(StatesGroup):
     waiting_custom_name = State()
     waiting_custom_price = State()
     waiting_mixed_cash = State()
-    waiting_exchange_cash = State()
\ No newline at end of file
+    waiting_exchange_cash = State()
+    waiting_payout = State()
+    waiting_cash_count = State()
+    waiting_item_quantity = State()
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""Сводные отчёты по сети площадок.
+
+Каждая площадка — папка архива закрытых смен (как CLOSED_SESSIONS_FOLDER)
+и, при нескольких воркерах, общее SQLite-хранилище с открытой сменой.
+Площадки считаются параллельно: короткие периоды — в потоках, длинные
+(разбор тысяч чеков упирается в GIL) — в пуле процессов. Каждая площадка
+отдаёт ShiftMetrics, которые затем складываются в общий итог.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from config import Config
+from archive import ShiftArchive
+from export import iter_period_shifts
+from metrics import ShiftMetrics
+from shared_store import SQLiteStore
+from shift import SHIFT_STORE_KEY
+
+logger = logging.getLogger(__name__)
+
+
+def parse_venues(text: str) -> list:
+    """«Алматы=/data/almaty|/data/almaty/store.sqlite;Шымкент=/data/shym» → площадки"""
+    venues = []
+    for part in (text or "").split(";"):
+        if not part.strip():
+            continue
+        name, sep, paths = part.partition("=")
+        if not sep or not name.strip() or not paths.strip():
+            raise ValueError(f"Площадка без папки архива: «{part.strip()}»")
+        folder, _, store = paths.partition("|")
+        venues.append({"name": name.strip(), "folder": folder.strip(), "store": store.strip() or None})
+    return venues
+
+
+def venue_archive(folder: str) -> ShiftArchive:
+    """Архив площадки: настройки как у своей, другая папка"""
+    config = type("VenueConfig", (Config,), {"CLOSED_SESSIONS_FOLDER": folder})
+    return ShiftArchive(config)
+
+
+def _open_shift_sales(store_path: str, date_from, date_to):
+    """Чеки открытой смены площадки из её общего хранилища (пусто — смена закрыта или вне периода)"""
+    if not os.path.exists(store_path):
+        raise FileNotFoundError(store_path)
+    store = SQLiteStore(store_path)
+    try:
+        value, _ = store.get(SHIFT_STORE_KEY)
+    finally:
+        store.close()
+    data = json.loads(value) if value else {}
+    if not data.get("is_open") or not data.get("open_time"):
+        return []
+    opened = datetime.datetime.fromisoformat(data["open_time"]).date()
+    return data.get("sales", []) if date_from <= opened <= date_to else []
+
+
+def venue_metrics(venue: dict, date_from, date_to, bucket_minutes: int = 60):
+    """Показатели одной площадки за период: (метрики, число смен).
+
+    Функция верхнего уровня — выполняется и в потоке, и в процессе пула.
+    """
+    metrics = ShiftMetrics(bucket_minutes)
+    shifts = 0
+    for _, sales in iter_period_shifts(date_from, date_to, venue_archive(venue["folder"])):
+        shifts += 1
+        for sale in sales:
+            metrics.add_sale(sale)
+    if venue.get("store"):
+        open_sales = _open_shift_sales(venue["store"], date_from, date_to)
+        if open_sales:
+            shifts += 1
+            for sale in open_sales:
+                metrics.add_sale(sale)
+    metrics.timeline.shifts = shifts
+    return metrics, shifts
+
+
+class NetworkPool:
+    """Пул процессов для длинных периодов: создаётся при первом запросе и
+    живёт до остановки бота, чтобы /network не запускал процессы каждый раз.
+
+    spawn, а не fork: форк процесса с потоками (лог, to_thread) может
+    унаследовать захваченный лок и зависнуть.
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = None
+
+    def get(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+async def collect_network(venues: list, date_from, date_to, bucket_minutes: int = 60,
+                          open_shifts: dict = None, process_days: int = 7, pool: NetworkPool = None) -> dict:
+    """Параллельный сбор показателей всех площадок и общий итог.
+
+    ``open_shifts`` — {название площадки: ShiftMetrics} смен, которые есть
+    только в памяти этого процесса (своя открытая смена). Площадка, которую
+    не удалось прочитать, попадает в отчёт без данных и не останавливает остальные.
+    Без ``pool`` все периоды считаются в потоках.
+    """
+    loop = asyncio.get_running_loop()
+    open_shifts = open_shifts or {}
+    executor = None
+    if pool is not None and (date_to - date_from).days + 1 > process_days:
+        # Длинный период — много файлов смен: считаем в отдельных процессах
+        executor = pool.get()
+    results = await asyncio.gather(
+        *(loop.run_in_executor(executor, venue_metrics, venue, date_from, date_to, bucket_minutes)
+          for venue in venues),
+        return_exceptions=True
+    )
+
+    total = ShiftMetrics(bucket_minutes)
+    total.timeline.shifts = 0
+    network = {"venues": [], "total": total}
+    for venue, result in zip(venues, results):
+        if isinstance(result, BaseException):
+            logger.error(f"❌ Площадка «{venue['name']}» не прочитана: {result}")
+            network["venues"].append({"name": venue["name"], "metrics": None, "shifts": 0})
+            continue
+        metrics, shifts = result
+        if venue["name"] in open_shifts:
+            metrics.merge(open_shifts[venue["name"]])
+            shifts += 1
+        total.merge(metrics)
+        network["venues"].append({"name": venue["name"], "metrics": metrics, "shifts": shifts})
+    return network
@@ -0,0 +1,56 @@
+import datetime
+
+# Тип дня — он же приставка в названии проданной позиции («Будний взрослый билет»)
+WEEKDAY = "Будний"
+WEEKEND = "Выходной"
+DAY_TYPES = (WEEKDAY, WEEKEND)
+
+# Государственные праздники РК (ММ-ДД) — цены выходного дня
+DEFAULT_HOLIDAYS = (
+    "01-01", "01-02", "03-08", "03-21", "03-22", "03-23", "05-01",
+    "05-07", "05-09", "07-06", "08-30", "10-25", "12-16",
+)
+
+
+def item_day_type(name: str):
+    """Тип дня по названию проданной позиции (None — цена от дня не зависит)"""
+    # Возврат: «↩️ ВОЗВРАТ: Будний взрослый билет»
+    prefix = name.rpartition("ВОЗВРАТ: ")[2].split(" ", 1)[0]
+    return prefix if prefix in DAY_TYPES else None
+
+
+class DayCalendar:
+    """Тип дня для цены: выходные и праздники — WEEKEND, остальные — WEEKDAY.
+
+    Праздники задаются как «ММ-ДД» (каждый год) или «ГГГГ-ММ-ДД» (разовые,
+    например перенесённые выходные). Текущий год просчитан заранее,
+    остальные даты кэшируются при первом обращении.
+    """
+
+    def __init__(self, holidays=DEFAULT_HOLIDAYS):
+        self.yearly = set()
+        self.dates = set()
+        for holiday in holidays:
+            holiday = holiday.strip()
+            if not holiday:
+                continue
+            if len(holiday) == 5:  # ММ-ДД
+                self.yearly.add(holiday)
+            else:
+                self.dates.add(datetime.date.fromisoformat(holiday))
+        self._days = {}
+        self.precompute(datetime.date.today().year)
+
+    def precompute(self, year: int):
+        day = datetime.date(year, 1, 1)
+        while day.year == year:
+            self.day_type(day)
+            day += datetime.timedelta(days=1)
+
+    def day_type(self, day: datetime.date) -> str:
+        day_type = self._days.get(day)
+        if day_type is None:
+            holiday = day in self.dates or day.strftime("%m-%d") in self.yearly
+            day_type = WEEKEND if holiday or day.weekday() >= 5 else WEEKDAY
+            self._days[day] = day_type
+        return day_type
@@ -0,0 +1,60 @@
+import re
+
+from catalog import Catalog, normalize_name
+from shift import MAX_QUANTITY
+
+# Способ оплаты последним словом команды
+PAYMENT_WORDS = {
+    "cash": "cash", "нал": "cash", "наличные": "cash", "наличка": "cash",
+    "card": "card", "карта": "card", "картой": "card", "безнал": "card",
+}
+
+# «4 Будний взрослый», «Будний взрослый x4», «МК1 ×2», «МК1*2»
+QTY_BEFORE = re.compile(r"^(\d+)\s+(.+)$")
+QTY_AFTER = re.compile(r"^(.+?)\s*[xх×*]\s*(\d+)$")
+
+
+class SellOrder:
+    """Разобранная команда быстрой продажи"""
+
+    def __init__(self):
+        self.lines = []
+        self.payment = None
+        self.errors = []
+
+
+def parse_sell(text: str, catalog: Catalog) -> SellOrder:
+    """Разбор «/sell 4 Будний взрослый, 2 МК1 cash» в позиции и способ оплаты"""
+    order = SellOrder()
+    text = (text or "").strip()
+
+    words = text.rsplit(None, 1)
+    if words and normalize_name(words[-1]) in PAYMENT_WORDS:
+        order.payment = PAYMENT_WORDS[normalize_name(words[-1])]
+        text = words[0] if len(words) > 1 else ""
+
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+
+        qty, query = 1, part
+        if match := QTY_BEFORE.match(part):
+            qty, query = int(match.group(1)), match.group(2)
+        elif match := QTY_AFTER.match(part):
+            query, qty = match.group(1), int(match.group(2))
+
+        if not 1 <= qty <= MAX_QUANTITY:
+            order.errors.append(f"«{part}»: количество от 1 до {MAX_QUANTITY}")
+            continue
+
+        found = catalog.find_items(query)
+        if len(found) == 1:
+            order.lines.append((found[0], qty))
+        elif not found:
+            order.errors.append(f"«{query}»: товар не найден")
+        else:
+            options = ", ".join(catalog.items[item_id]["name"] for item_id in found[:5])
+            order.errors.append(f"«{query}»: уточните — {options}")
+
+    return order
@@ -0,0 +1,405 @@
+import datetime
+import logging
+from collections import OrderedDict
+
+from config import Config
+from archive import ShiftArchive, shift_file_date
+from shift import item_qty, item_amount
+from metrics import SalesTimeline, ShiftMetrics
+from ledger import PAYOUT
+
+logger = logging.getLogger(__name__)
+
+def format_currency(amount):
+    """Форматирование суммы с разделителями тысяч"""
+    return f"{amount:,.0f}₸".replace(",", ".")
+
+def format_line(item) -> str:
+    """Строка позиции: название, количество и сумма"""
+    if item["price"] == 0:
+        price_display = "БЕСПЛАТНО"
+    elif item_qty(item) > 1:
+        price_display = f"{item_qty(item)} × {format_currency(item['price'])} = {format_currency(item_amount(item))}"
+    else:
+        price_display = format_currency(item["price"])
+    qty_display = f" ×{item_qty(item)}" if item["price"] == 0 and item_qty(item) > 1 else ""
+    return f"{item['item']}{qty_display} - {price_display}"
+
+def shift_period(session) -> str:
+    """Строка «С ЧЧ:ММ до ЧЧ:ММ» от открытия смены до текущего момента"""
+    now = datetime.datetime.now()
+    opened = session.open_time or now
+    return f"С {opened.strftime('%H:%M')} до {now.strftime('%H:%M')}"
+
+def save_session_report(session_data: dict, config=Config) -> str:
+    """Сохранение отчета о смене в файл"""
+    try:
+        filename = f"{config.CLOSED_SESSIONS_FOLDER}/смена_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        
+        report_content = f"""{config.VENUE_NAME}
+Смена от: {session_data['open_time'].strftime('%d.%m.%Y %H:%M')}
+Закрыта: {datetime.datetime.now().strftime('%d.%m.%Y %H:%M')}
+Длительность: {str(session_data['close_time'] - session_data['open_time']).split('.')[0]}
+
+{session_data['combined_report']}
+
+{session_data['metrics_report']}
+
+{session_data['cash_report']}
+
+{session_data['timeline_report']}
+
+{session_data['receipts_report']}
+"""
+        
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(report_content)
+        
+        logger.info(f"Отчет сохранен в файл: {filename}")
+        return filename
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении отчета: {e}")
+        return None
+
+def get_closed_sessions(archive: ShiftArchive):
+    """Получение списка закрытых смен за последние 30 дней"""
+    sessions = []
+    try:
+        # Все txt отчёты: свежие файлы и упакованные в архив
+        files = archive.list_files('.txt')
+        
+        # Фильтруем файлы за последние 30 дней
+        thirty_days_ago = datetime.datetime.now() - datetime.timedelta(days=30)
+        
+        for filename, archived_month in files.items():
+            try:
+                # Извлекаем дату из имени файла
+                file_date = shift_file_date(filename)
+                
+                if file_date >= thirty_days_ago:
+                    sessions.append({
+                        'filename': filename,
+                        'archived': archived_month,
+                        'date': file_date,
+                        'display_date': file_date.strftime('%d.%m.%Y')
+                    })
+            except Exception as e:
+                logger.warning(f"Ошибка обработки файла {filename}: {e}")
+        
+        # Сортируем по дате (новые сверху)
+        sessions.sort(key=lambda x: (x['date'], x['filename']), reverse=True)
+        return sessions
+        
+    except Exception as e:
+        logger.error(f"Ошибка при получении закрытых смен: {e}")
+        return []
+
+# ====== ФУНКЦИИ ОТЧЕТОВ ======
+def build_combined_report(session) -> str:
+    """Объединенный отчет: общая статистика + категории"""
+    # Суммы и разбивка по категориям ведутся по мере продаж (ShiftMetrics),
+    # старые чеки смены при этом могут лежать не в памяти, а в файле
+    metrics = session.metrics
+    total_cash_sales = metrics.cash
+    total_cashless = metrics.cashless
+    total_revenue = metrics.revenue
+    total_items = metrics.items
+    category_stats = metrics.categories
+    
+    report_text = f"""📊 ОБЩИЙ ОТЧЁТ С КАТЕГОРИЯМИ
+
+{session.config.VENUE_NAME}
+{datetime.datetime.now().strftime('Сегодня %d.%m.%Y')}
+{shift_period(session)}
+
+💵 Наличные: {format_currency(total_cash_sales)}
+💳 Безналичные: {format_currency(total_cashless)}
+💰 Общая выручка: {format_currency(total_revenue)}
+💵 Размен: {format_currency(session.exchange_cash)}
+📊 Количество чеков: {metrics.receipts}
+🛒 Всего позиций: {total_items} шт.
+
+📦 ДЕТАЛИЗАЦИЯ ПО КАТЕГОРИЯМ:
+"""
+    
+    for category, stats in sorted(category_stats.items()):
+        report_text += f"\n▶ {category}:\n"
+        report_text += f"   📊 Позиций: {stats['total_count']} шт.\n"
+        report_text += f"   💰 Выручка: {format_currency(stats['total_revenue'])}\n"
+        
+        for item_name, item_data in sorted(stats["items"].items()):
+            if item_data['revenue'] == 0:
+                report_text += f"   • {item_name}: {item_data['count']} шт. (бесплатно)\n"
+            else:
+                avg_price = item_data['revenue'] / item_data['count']
+                report_text += f"   • {item_name}: {item_data['count']} шт. × {format_currency(avg_price)} = {format_currency(item_data['revenue'])}\n"
+    
+    return report_text
+
+def format_metrics(metrics: ShiftMetrics) -> str:
+    """Блок показателей: общий для отчёта смены и сводного отчёта сети"""
+    return f"""👥 Всего людей: {metrics.people} чел.
+💰 Общая выручка: {format_currency(metrics.revenue)}
+🎯 Выручка допов + магазин: {format_currency(metrics.dops_revenue + metrics.shop_revenue)}
+🛍️ Выручка магазина: {format_currency(metrics.shop_revenue)}
+📊 Средний чек: {format_currency(metrics.avg_check_total)}
+🛒 Средний чек магазина: {format_currency(metrics.avg_check_shop)}
+📅 Билеты по будним ценам: {format_currency(metrics.weekday_revenue)}
+🎉 Билеты по ценам выходного: {format_currency(metrics.weekend_revenue)}
+
+📱 Онлайн комбо: {metrics.online_combo} шт.
+🎫 Пригласительные: {metrics.invitations} шт.
+🤝 Партнеры: {metrics.partners} шт.
+📸 Блогеры: {metrics.bloggers} шт.
+"""
+
+def build_metrics_report(session) -> str:
+    """Отчет по показателям текущей смены"""
+    # Счётчики ведутся при каждой продаже/возврате, пересчёт чеков не нужен
+    report_text = f"""📈 ОТЧЁТ ПО ПОКАЗАТЕЛЯМ
+
+{session.config.VENUE_NAME}
+{datetime.datetime.now().strftime('Сегодня %d.%m.%Y')}
+{shift_period(session)}
+
+{format_metrics(session.metrics)}"""
+    
+    return report_text
+
+def build_network_report(network: dict, date_from: datetime.date, date_to: datetime.date) -> str:
+    """Сводный отчёт сети: итоги по площадкам и общие показатели"""
+    period = date_from.strftime('%d.%m.%Y')
+    if date_to != date_from:
+        period += f"–{date_to.strftime('%d.%m.%Y')}"
+    total = network["total"]
+    
+    report_text = f"""🌐 ОТЧЁТ ПО СЕТИ
+
+{period} (площадок: {len(network["venues"])})
+
+🏢 ПО ПЛОЩАДКАМ:
+"""
+    for venue in network["venues"]:
+        metrics = venue["metrics"]
+        if metrics is None:
+            report_text += f"• {venue['name']}: ❌ нет данных\n"
+            continue
+        report_text += (f"• {venue['name']}: {format_currency(metrics.revenue)} "
+                        f"(смен: {venue['shifts']}, чеков: {metrics.receipts}, людей: {metrics.people})\n")
+    
+    report_text += f"""
+💵 Наличные: {format_currency(total.cash)}
+💳 Безналичные: {format_currency(total.cashless)}
+📊 Количество чеков: {total.receipts}
+🛒 Всего позиций: {total.items} шт.
+
+{format_metrics(total)}"""
+    
+    return report_text
+
+def build_cash_report(session) -> str:
+    """Сверка кассы: ожидаемые наличные и расхождение с пересчётом"""
+    ledger = session.ledger
+    report_text = f"""💵 КАССА
+
+🔄 Размен: {format_currency(ledger.exchange_total)} (внесений: {ledger.exchange_count})
+➕ Наличные продажи: {format_currency(ledger.cash_sales)}
+➖ Возвраты наличными: {format_currency(ledger.cash_refunds)}
+💸 Выплаты: {format_currency(ledger.payouts)}
+🧮 Ожидается в кассе: {format_currency(ledger.expected)}
+"""
+    
+    if ledger.discrepancy is None:
+        report_text += "\n⚠️ Касса не пересчитана"
+    else:
+        report_text += f"\n🔢 Пересчитано: {format_currency(ledger.counted)} ({ledger.counted_at[11:16]})\n"
+        if ledger.counted_expected is not None and ledger.counted_expected != ledger.expected:
+            report_text += f"🧮 Ожидалось при пересчёте: {format_currency(ledger.counted_expected)}\n"
+        if ledger.discrepancy == 0:
+            report_text += "✅ Расхождений нет"
+        else:
+            sign = "+" if ledger.discrepancy > 0 else "−"
+            label = "Излишек" if ledger.discrepancy > 0 else "Недостача"
+            report_text += f"❗ {label}: {sign}{format_currency(abs(ledger.discrepancy))}"
+    
+    payouts = [event for event in ledger.events if event["type"] == PAYOUT]
+    if payouts:
+        report_text += "\n\n💸 Выплаты:\n"
+        for event in payouts:
+            report_text += f"   • {event['time'][11:16]} {format_currency(event['amount'])}"
+            report_text += f" — {event['note']}\n" if event["note"] else "\n"
+    
+    return report_text
+
+def build_timeline_report(timeline, title="⏱ ПРОДАЖИ ПО ВРЕМЕНИ") -> str:
+    """Гистограмма продаж по интервалам: чеки, люди, выручка и доля наличных"""
+    report_text = f"{title}\n(интервал {timeline.bucket_minutes} мин"
+    report_text += f", смен: {timeline.shifts})\n\n" if timeline.shifts > 1 else ")\n\n"
+    if not timeline.buckets:
+        return report_text + "📭 Продаж пока нет"
+    
+    def interval(start):
+        end = start + timeline.bucket_minutes
+        return f"{start // 60:02d}:{start % 60:02d}–{end // 60 % 24:02d}:{end % 60:02d}"
+    
+    busiest = max(bucket["people"] for bucket in timeline.buckets.values()) or 1
+    for start, bucket in sorted(timeline.buckets.items()):
+        filled = round(10 * max(bucket["people"], 0) / busiest)
+        paid = bucket["cash"] + bucket["cashless"]
+        cash_share = f" · нал {bucket['cash'] * 100 // paid}%" if paid > 0 else ""
+        report_text += (
+            f"{interval(start)[:5]} {'█' * filled}{'░' * (10 - filled)} "
+            f"👥 {bucket['people']} · 🧾 {bucket['receipts']} · {format_currency(bucket['revenue'])}{cash_share}\n"
+        )
+    
+    peak = timeline.peak()
+    peak_bucket = timeline.buckets[peak]
+    report_text += f"\n🔥 Пик: {interval(peak)} — {peak_bucket['people']} чел., {format_currency(peak_bucket['revenue'])}"
+    if timeline.shifts > 1:
+        report_text += f"\n📊 В среднем за смену в пик: {peak_bucket['people'] / timeline.shifts:.1f} чел."
+    return report_text
+
+def build_period_timeline(shifts, bucket_minutes: int = 60) -> SalesTimeline:
+    """Сводная раскладка по времени для пар (название смены, чеки)"""
+    combined = SalesTimeline(bucket_minutes)
+    combined.shifts = 0
+    for _, sales in shifts:
+        timeline = SalesTimeline(bucket_minutes)
+        for sale in sales:
+            timeline.add_sale(sale)
+        combined.merge(timeline)
+    return combined
+
+def _peak_text(summary) -> str:
+    start = summary.get("peak_start")
+    if start is None:
+        return "—"
+    end = start + summary.get("bucket_minutes", 60)
+    return f"{start // 60:02d}:{start % 60:02d}–{end // 60 % 24:02d}:{end % 60:02d} ({summary['peak_people']} чел.)"
+
+def _shift_title(summary, key) -> str:
+    opened = summary.get("open_time") or key
+    return opened.replace("T", " ")[:16]
+
+def build_summary_report(summary: dict, key: str) -> str:
+    """Сводка закрытой смены из сохранённой записи"""
+    report_text = f"""📅 СМЕНА {_shift_title(summary, key)}
+{f"Закрыта: {summary['close_time'].replace('T', ' ')}" if summary.get('close_time') else ""}
+
+💰 Выручка: {format_currency(summary['revenue'])}
+💵 Наличные: {format_currency(summary['cash'])}
+💳 Безналичные: {format_currency(summary['cashless'])}
+👥 Людей: {summary['people']} чел.
+📊 Средний чек: {format_currency(summary['avg_check'])}
+🛍️ Магазин: {format_currency(summary['shop_revenue'])}
+🧾 Чеков: {summary['receipts']}
+🔥 Пик: {_peak_text(summary)}
+"""
+    if summary.get("discrepancy") is not None:
+        report_text += f"🧮 Расхождение кассы: {format_currency(summary['discrepancy'])}\n"
+    return report_text
+
+def build_comparison_report(first: dict, second: dict, first_key: str, second_key: str) -> str:
+    """Две смены рядом: показатель, значения и изменение"""
+    rows = [
+        ("💰 Выручка", "revenue", True),
+        ("👥 Люди", "people", False),
+        ("📊 Ср. чек", "avg_check", True),
+        ("🛍️ Магазин", "shop_revenue", True),
+        ("🧾 Чеки", "receipts", False),
+        ("💵 Наличные", "cash", True),
+        ("💳 Безнал", "cashless", True),
+    ]
+    report_text = (
+        f"⚖️ СРАВНЕНИЕ СМЕН\n\n"
+        f"A: {_shift_title(first, first_key)}\n"
+        f"B: {_shift_title(second, second_key)}\n\n"
+    )
+    for title, field, money in rows:
+        a, b = first.get(field, 0), second.get(field, 0)
+        show = format_currency if money else str
+        change = f"{(b - a) * 100 / a:+.0f}%" if a else "—"
+        report_text += f"{title}: {show(a)} → {show(b)} ({change})\n"
+    report_text += f"\n🔥 Пик A: {_peak_text(first)}\n🔥 Пик B: {_peak_text(second)}"
+    return report_text
+
+def _receipt_text(number: int, sale) -> str:
+    time_str = sale["time"].strftime("%H:%M:%S")
+    payment_type = ""
+    if sale["cash_amount"] > 0 and sale["cashless_amount"] > 0:
+        payment_type = f"💱 Смешанная ({format_currency(sale['cash_amount'])} нал + {format_currency(sale['cashless_amount'])} безнал)"
+    elif sale["cash_amount"] > 0:
+        payment_type = "💵 Наличные"
+    elif sale["cashless_amount"] > 0:
+        payment_type = "💳 Карта"
+    else:
+        payment_type = "🎁 Бесплатно"
+    
+    text = f"🧾 Чек #{number} ({time_str})\n"
+    text += f"   {payment_type}\n"
+    text += f"   💰 Сумма: {format_currency(sale['total'])}\n"
+    text += f"   📦 Позиций: {sum(item_qty(item) for item in sale['items'])} шт.\n"
+    
+    for j, item in enumerate(sale["items"], 1):
+        text += f"      {j}. {format_line(item)}\n"
+    return text + "\n"
+
+def build_receipts_report(session) -> str:
+    """Детализация по чекам текущей смены (целиком — для файла отчёта)"""
+    if not session.sales:
+        return "📋 Детализация по чекам\n\n📭 Чеков пока нет"
+    
+    report_text = "📋 Детализация по чекам\n\n"
+    for i, sale in enumerate(session.sales, 1):
+        report_text += _receipt_text(i, sale)
+    
+    return report_text
+
+def receipts_page_count(session, page_size: int) -> int:
+    return max(1, -(-len(session.sales) // page_size))
+
+def build_receipts_page(session, page: int, page_size: int) -> str:
+    """Страница детализации: страница 0 — последние чеки, дальше — более ранние.
+
+    Читаются только чеки страницы, вытесненные в файл — по индексу смещений.
+    """
+    if not session.sales:
+        return "📋 Детализация по чекам\n\n📭 Чеков пока нет"
+    
+    pages = receipts_page_count(session, page_size)
+    page = min(max(page, 0), pages - 1)
+    stop = len(session.sales) - page * page_size
+    start = max(0, stop - page_size)
+    
+    report_text = f"📋 Детализация по чекам (стр. {pages - page} из {pages})\n\n"
+    for i, sale in enumerate(session.sales[start:stop], start + 1):
+        report_text += _receipt_text(i, sale)
+    return report_text
+
+
+class ReportCache:
+    """Готовые тексты отчётов открытой смены с LRU-вытеснением.
+
+    Ключ — (тип отчёта, версия смены, страница): любая продажа, возврат или
+    операция с кассой повышает ``session.revision``, поэтому устаревший
+    текст по ключу не найдётся.
+    """
+
+    def __init__(self, size: int = 16):
+        self.size = size
+        self._texts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, key: tuple, build) -> str:
+        text = self._texts.get(key)
+        if text is not None:
+            self.hits += 1
+            self._texts.move_to_end(key)
+            return text
+
+        self.misses += 1
+        text = self._texts[key] = build()
+        if len(self._texts) > self.size:
+            self._texts.popitem(last=False)
+        return text
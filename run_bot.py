@@ -3,33 +3,49 @@ import asyncio
 import logging
 import sys
 import os
+import time
 
 # Добавляем путь к проекту
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from bot import main
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+from bot import main, create_app, setup_logging
+from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Верхняя граница задержки при повторяющихся падениях
+MAX_RESTART_DELAY = 10
+
 async def run_bot():
     """Запуск бота с обработкой ошибок"""
+    # Приложение собирается один раз: перезапуск только заново поднимает polling
+    app = create_app(Config)
+    delay = Config.RESTART_DELAY_SECONDS
     while True:
+        started = time.monotonic()
         try:
             logger.info("Запускаем бота...")
-            await main()
+            await main(app)
         except Exception as e:
             logger.error(f"Ошибка в работе бота: {e}")
-            logger.info("Перезапуск через 10 секунд...")
-            await asyncio.sleep(10)
+        
+        # SIGTERM/SIGINT — штатная остановка, смена уже сохранена в shutdown()
+        if app.lifecycle.stop_requested:
+            logger.info("Бот остановлен по сигналу")
+            break
+        
+        # Быстрый перезапуск; если падаем сразу после старта — увеличиваем паузу
+        if time.monotonic() - started > MAX_RESTART_DELAY:
+            delay = Config.RESTART_DELAY_SECONDS
+        logger.info(f"Перезапуск через {delay:g} сек...")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, MAX_RESTART_DELAY)
 
 if __name__ == "__main__":
-    asyncio.run(run_bot())
\ No newline at end of file
+    # Настройка логирования (файлы пишет фоновый поток). Только здесь: процессы
+    # пула /network импортируют этот модуль заново и не должны открывать логи
+    log_listener = setup_logging()
+    try:
+        asyncio.run(run_bot())
+    finally:
+        log_listener.stop()
\ No newline at end of file
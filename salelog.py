@@ -0,0 +1,211 @@
+import array
+import datetime
+import glob
+import itertools
+import json
+import logging
+import mmap
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class SaleSegment:
+    """Файл вытесненных чеков: JSON-строки подряд, чтение через mmap.
+
+    В памяти остаётся только массив смещений начала строк, поэтому чек
+    с номером i читается одним срезом без просмотра файла.
+    """
+
+    def __init__(self, path: str, keep: int = 0):
+        self.path = path
+        self.offsets = array.array("Q")
+        self.size = 0
+        self._map = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a+b")
+        if keep:
+            self._scan(keep)
+        # Хвост сверх keep записан после последнего бэкапа — эти чеки
+        # ещё лежат в бэкапе среди «горячих», дубли не нужны
+        self._file.truncate(self.size)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _scan(self, keep: int):
+        data = self._mapped(os.fstat(self._file.fileno()).st_size)
+        pos = 0
+        while len(self.offsets) < keep and pos < len(data):
+            end = data.find(b"\n", pos)
+            if end < 0:
+                # Строка дописана не до конца (сбой во время записи)
+                break
+            self.offsets.append(pos)
+            pos = end + 1
+        self.size = pos
+        # Файл будет укорочен — старое отображение закрываем до этого
+        if self._map:
+            self._map.close()
+        self._map = None
+
+    def _mapped(self, needed: int):
+        if self._map is None or len(self._map) < needed:
+            if needed == 0:
+                return b""
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def append(self, sale: dict):
+        line = json.dumps(sale, ensure_ascii=False, default=_encode).encode("utf-8") + b"\n"
+        self._file.write(line)
+        self._file.flush()
+        self.offsets.append(self.size)
+        self.size += len(line)
+
+    def read(self, index: int) -> dict:
+        start = self.offsets[index]
+        end = self.offsets[index + 1] if index + 1 < len(self.offsets) else self.size
+        sale = json.loads(self._mapped(end)[start:end])
+        sale["time"] = datetime.datetime.fromisoformat(sale["time"])
+        return sale
+
+
+class SalesLog:
+    """Чеки открытой смены: последние в памяти, старые — в файле-сегменте.
+
+    Ведёт себя как список (len, индексы, срезы, итерация). Когда «горячих»
+    чеков больше ``hot_limit``, старшая половина дописывается в сегмент и
+    читается по требованию. Без ``path`` (общее хранилище воркеров) все
+    чеки остаются в памяти.
+
+    Файл сегмента, на который может ссылаться записанный бэкап, никогда не
+    перезаписывается: новый сегмент открывается в свободном файле
+    ``имя.N.seg``, а лишние файлы удаляются после записи бэкапа (remove_files).
+    """
+
+    def __init__(self, path: str = None, hot_limit: int = 0):
+        self.path = path
+        self.hot_limit = hot_limit
+        self.hot = []
+        self.segment = None
+        # Номера чеков, по которым оформлен возврат
+        self.refunded = set()
+        # Старший номер чека: новый получает следующий, даже если чеки убраны
+        self.last_id = 0
+
+    @property
+    def segment_path(self):
+        return self.segment.path if self.segment is not None else None
+
+    @property
+    def spilled(self) -> int:
+        return len(self.segment) if self.segment is not None else 0
+
+    def __len__(self):
+        return self.spilled + len(self.hot)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("sale index out of range")
+        spilled = self.spilled
+        return self.segment.read(index) if index < spilled else self.hot[index - spilled]
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def snapshot(self):
+        """Чеки на текущий момент; итерацию можно вести из другого потока"""
+        segment, spilled, hot = self.segment, self.spilled, list(self.hot)
+        return itertools.chain((segment.read(i) for i in range(spilled)), hot)
+
+    def get(self, sale_id: int):
+        """Чек по номеру: номера идут подряд с 1, обычно это позиция sale_id - 1"""
+        if 1 <= sale_id <= len(self):
+            sale = self[sale_id - 1]
+            if sale["id"] == sale_id:
+                return sale
+        return next((sale for sale in self if sale["id"] == sale_id), None)
+
+    def append(self, sale: dict):
+        self.hot.append(sale)
+        self.last_id = max(self.last_id, sale["id"])
+        if sale.get("refund_of") is not None:
+            self.refunded.add(sale["refund_of"])
+        if self.path and self.hot_limit and len(self.hot) > self.hot_limit:
+            self._spill()
+
+    def _spill(self):
+        count = len(self.hot) - self.hot_limit // 2
+        if self.segment is None:
+            self.segment = SaleSegment(self._free_path())
+        for sale in self.hot[:count]:
+            self.segment.append(sale)
+        del self.hot[:count]
+        logger.info(f"📦 Чеков вытеснено в файл: {count} (всего в файле {self.spilled})")
+
+    def restore(self, hot: list, spilled: int = 0, segment: str = None):
+        """Восстановление из бэкапа: первые ``spilled`` чеков — в сегменте ``segment``"""
+        self.refunded = set()
+        self.segment = None
+        if spilled and self.path:
+            # Бэкапы без имени сегмента ссылаются на основной файл
+            path = os.path.join(os.path.dirname(self.path), segment) if segment else self.path
+            if os.path.exists(path):
+                self.segment = SaleSegment(path, keep=spilled)
+        if self.spilled < spilled:
+            logger.error(f"❌ В файле чеков {self.spilled} из {spilled}, остальные потеряны")
+        self.hot = list(hot)
+        self.last_id = 0
+        for sale in self:
+            if not isinstance(sale, dict) or not isinstance(sale.get("id"), int):
+                # Повреждённый чек отложит проверка целостности
+                continue
+            self.last_id = max(self.last_id, sale["id"])
+            if sale.get("refund_of") is not None:
+                self.refunded.add(sale["refund_of"])
+
+    def clear(self):
+        self.hot = []
+        self.refunded = set()
+        self.last_id = 0
+        # Сегмент не закрывается: его могут дочитывать снимки в других потоках.
+        # Файл остаётся, пока на него может ссылаться бэкап (см. remove_files)
+        self.segment = None
+
+    def _files(self):
+        root, ext = os.path.splitext(self.path)
+        return [self.path, *glob.glob(f"{glob.escape(root)}.*{ext}")]
+
+    def _free_path(self) -> str:
+        """Первый несуществующий файл сегмента: занятые могут быть нужны бэкапу"""
+        root, ext = os.path.splitext(self.path)
+        path, generation = self.path, 0
+        while os.path.exists(path):
+            generation += 1
+            path = f"{root}.{generation}{ext}"
+        return path
+
+    def remove_files(self, keep: str = None):
+        """Удаление файлов сегментов, кроме ``keep`` — когда бэкап на них не ссылается.
+
+        Открытые дескрипторы и отображения после удаления остаются валидны.
+        """
+        if not self.path:
+            return
+        for path in self._files():
+            if path != keep and os.path.exists(path):
+                os.remove(path)
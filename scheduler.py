@@ -0,0 +1,164 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Как часто перепроверять простой для заданий «только в простое»
+IDLE_RECHECK_SECONDS = 30
+
+
+class Job:
+    """Задание планировщика: по интервалу или ежедневно в заданное время"""
+
+    def __init__(self, name, func, interval=None, daily_at=None, jitter=0.0,
+                 catch_up=True, idle_only=False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.daily_at = daily_at
+        self.jitter = jitter
+        self.catch_up = catch_up
+        self.idle_only = idle_only
+        self.last_run = None
+        self.next_run = None
+        self.running = False
+        self.task = None
+        self.stats = {"runs": 0, "failures": 0, "caught_up": 0, "total_ms": 0.0, "last_ms": 0.0, "max_ms": 0.0}
+
+    def last_due(self, now: datetime.datetime):
+        """Последний момент по расписанию не позже now"""
+        if self.interval is not None:
+            if self.last_run is None:
+                return None
+            periods = (now - self.last_run) // datetime.timedelta(seconds=self.interval)
+            return self.last_run + periods * datetime.timedelta(seconds=self.interval) if periods else None
+        due = datetime.datetime.combine(now.date(), self.daily_at)
+        return due if due <= now else due - datetime.timedelta(days=1)
+
+    def next_due(self, now: datetime.datetime) -> datetime.datetime:
+        if self.interval is not None:
+            base = self.last_run or now
+            due = base + datetime.timedelta(seconds=self.interval)
+            return max(due, now)
+        due = datetime.datetime.combine(now.date(), self.daily_at)
+        return due if due > now else due + datetime.timedelta(days=1)
+
+
+class JobScheduler:
+    """Фоновые задания в цикле событий: расписание, джиттер, догоняющие запуски.
+
+    Время последнего запуска каждого задания хранится в ``state_path``: если
+    бот лежал во время планового запуска, задание с ``catch_up`` выполняется
+    сразу после старта. Задания с ``idle_only`` ждут, пока бот не будет
+    простаивать ``idle_seconds`` (по ``idle_for`` — секунды без обновлений).
+    """
+
+    def __init__(self, state_path=None, idle_for=None, idle_seconds=120):
+        self.state_path = state_path
+        self.idle_for = idle_for
+        self.idle_seconds = idle_seconds
+        self.jobs = {}
+        self.stopping = False
+
+    def every(self, name, seconds, func, **options):
+        self.jobs[name] = Job(name, func, interval=seconds, **options)
+
+    def daily(self, name, at: datetime.time, func, **options):
+        self.jobs[name] = Job(name, func, daily_at=at, **options)
+
+    def _load_state(self):
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения состояния планировщика: {e}")
+            return
+        for name, last_run in state.items():
+            if name in self.jobs:
+                self.jobs[name].last_run = datetime.datetime.fromisoformat(last_run)
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        state = {name: job.last_run.isoformat() for name, job in self.jobs.items() if job.last_run}
+        try:
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи состояния планировщика: {e}")
+
+    async def run_job(self, job: Job):
+        """Выполнение задания с учётом времени; ошибки не останавливают планировщик"""
+        started = time.perf_counter()
+        job.running = True
+        try:
+            await job.func()
+        except Exception as e:
+            job.stats["failures"] += 1
+            logger.error(f"❌ Задание «{job.name}» завершилось ошибкой: {e}")
+        finally:
+            job.running = False
+        elapsed = (time.perf_counter() - started) * 1000
+        job.stats["runs"] += 1
+        job.stats["total_ms"] += elapsed
+        job.stats["last_ms"] = elapsed
+        job.stats["max_ms"] = max(job.stats["max_ms"], elapsed)
+        job.last_run = datetime.datetime.now()
+        self._save_state()
+        logger.info(f"⏲ Задание «{job.name}» выполнено за {elapsed:.0f} мс")
+
+    async def _wait_idle(self, job: Job):
+        if not job.idle_only or self.idle_for is None:
+            return
+        while self.idle_for() < self.idle_seconds:
+            await asyncio.sleep(IDLE_RECHECK_SECONDS)
+
+    async def _loop(self, job: Job):
+        now = datetime.datetime.now()
+        last_due = job.last_due(now)
+        if job.catch_up and last_due is not None and (job.last_run is None or job.last_run < last_due):
+            # Плановый запуск пропущен, пока бот не работал
+            logger.info(f"⏲ Догоняющий запуск «{job.name}» (пропущен {last_due:%d.%m %H:%M})")
+            job.stats["caught_up"] += 1
+            await self._wait_idle(job)
+            await self.run_job(job)
+
+        while not self.stopping:
+            now = datetime.datetime.now()
+            job.next_run = job.next_due(now) + datetime.timedelta(seconds=random.uniform(0, job.jitter))
+            await asyncio.sleep((job.next_run - now).total_seconds())
+            await self._wait_idle(job)
+            await self.run_job(job)
+
+    def start(self):
+        self.stopping = False
+        self._load_state()
+        for job in self.jobs.values():
+            if job.task is None:
+                job.task = asyncio.create_task(self._loop(job))
+        logger.info(f"⏲ Планировщик запущен: {', '.join(self.jobs) or 'заданий нет'}")
+
+    async def stop(self, timeout: float = 10.0):
+        """Остановка: ожидающие задания отменяются, выполняющееся дорабатывает"""
+        self.stopping = True
+        tasks = [job.task for job in self.jobs.values() if job.task is not None]
+        for job in self.jobs.values():
+            if job.task is not None and not job.running:
+                job.task.cancel()
+            job.task = None
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                # Не уложилось в таймаут — прерываем
+                task.cancel()
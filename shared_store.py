@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class VersionConflict(Exception):
+    """Запись уже изменена другим воркером"""
+
+
+class SQLiteStore:
+    """Общее хранилище нескольких воркеров на одном SQLite-файле.
+
+    Хранит состояние смены с номером версии (запись проходит, только если
+    версия не изменилась с момента чтения), состояния FSM и аренды лидерства.
+    WAL позволяет читать, пока другой процесс пишет.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY, value TEXT NOT NULL, version INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS fsm (
+                key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL
+            );
+        """)
+
+    # ---------- версионированные записи ----------
+    def get(self, key: str):
+        """Значение и его версия (None, 0 — записи нет)"""
+        row = self.conn.execute("SELECT value, version FROM kv WHERE key = ?", (key,)).fetchone()
+        return (row[0], row[1]) if row else (None, 0)
+
+    def put(self, key: str, value: str, expected_version: int) -> int:
+        """Запись, если версия не изменилась; возвращает новую версию"""
+        if expected_version == 0:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO kv (key, value, version) VALUES (?, ?, 1)", (key, value)
+            )
+        else:
+            cursor = self.conn.execute(
+                "UPDATE kv SET value = ?, version = version + 1 WHERE key = ? AND version = ?",
+                (value, key, expected_version)
+            )
+        if cursor.rowcount == 0:
+            raise VersionConflict(key)
+        return expected_version + 1
+
+    # ---------- FSM ----------
+    def get_fsm(self, key: str):
+        row = self.conn.execute("SELECT state, data FROM fsm WHERE key = ?", (key,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else (None, {})
+
+    def set_fsm_state(self, key: str, state):
+        self.conn.execute(
+            "INSERT INTO fsm (key, state) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET state = excluded.state", (key, state)
+        )
+
+    def set_fsm_data(self, key: str, data: dict):
+        self.conn.execute(
+            "INSERT INTO fsm (key, data) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (key, json.dumps(data, ensure_ascii=False, default=str))
+        )
+
+    # ---------- аренда лидерства ----------
+    def try_acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Взять или продлить аренду, если она свободна, истекла или уже наша"""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT owner, expires_at FROM leases WHERE name = ?", (name,)
+            ).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                self.conn.execute("COMMIT")
+                return False
+            self.conn.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+                (name, owner, now + ttl)
+            )
+            self.conn.execute("COMMIT")
+            return True
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def release_lease(self, name: str, owner: str):
+        self.conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def close(self):
+        self.conn.close()
+
+
+class LeaderElection:
+    """Выбор одного воркера для polling через аренду в общем хранилище.
+
+    Telegram отдаёт обновления только одному getUpdates, поэтому остальные
+    воркеры ждут в горячем резерве и забирают аренду, если лидер перестал
+    её продлевать (упал или завис) или отпустил при остановке.
+    """
+
+    LEASE_NAME = "polling"
+
+    def __init__(self, store: SQLiteStore, lease_seconds: float = 15.0, worker_id: str = None):
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self.keep_alive_task = None
+
+    async def acquire(self, should_stop=lambda: False) -> bool:
+        """Ожидание лидерства; False — если остановка запрошена раньше"""
+        waiting_logged = False
+        while not should_stop():
+            if self.store.try_acquire_lease(self.LEASE_NAME, self.worker_id, self.lease_seconds):
+                self.is_leader = True
+                logger.info(f"👑 Воркер {self.worker_id} стал лидером")
+                return True
+            if not waiting_logged:
+                logger.info(f"⏳ Воркер {self.worker_id} в резерве, ждём аренду polling")
+                waiting_logged = True
+            await asyncio.sleep(self.lease_seconds / 3)
+        return False
+
+    def start_keep_alive(self, on_lost):
+        """Фоновое продление аренды; при потере вызывается on_lost()"""
+        async def keep_alive():
+            while True:
+                await asyncio.sleep(self.lease_seconds / 3)
+                try:
+                    renewed = self.store.try_acquire_lease(self.LEASE_NAME, self.worker_id, self.lease_seconds)
+                except sqlite3.Error as e:
+                    logger.error(f"❌ Ошибка продления аренды: {e}")
+                    renewed = False
+                if not renewed:
+                    self.is_leader = False
+                    logger.warning(f"⚠️ Воркер {self.worker_id} потерял лидерство")
+                    await on_lost()
+                    return
+
+        self.keep_alive_task = asyncio.create_task(keep_alive())
+
+    def release(self):
+        """Отпустить аренду, чтобы резервный воркер подхватил сразу"""
+        if self.keep_alive_task:
+            self.keep_alive_task.cancel()
+            self.keep_alive_task = None
+        if self.is_leader:
+            self.store.release_lease(self.LEASE_NAME, self.worker_id)
+            self.is_leader = False
+            logger.info(f"👋 Воркер {self.worker_id} отпустил лидерство")
@@ -0,0 +1,412 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+
+from config import Config
+from autosave import AutoSaveScheduler
+from shared_store import VersionConflict
+from metrics import ShiftMetrics
+from ledger import CashLedger, EXCHANGE
+from events import log_event
+from salelog import SalesLog
+from integrity import verify_sales, metrics_match, write_quarantine
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество одной позиции в корзине
+MAX_QUANTITY = 999
+
+# Ключ состояния смены в общем хранилище воркеров
+SHIFT_STORE_KEY = "shift"
+
+
+def item_qty(item) -> int:
+    """Количество в строке чека (в старых чеках и бэкапах поля нет — это 1 шт.)"""
+    return item.get("qty", 1)
+
+
+def item_amount(item):
+    """Сумма строки чека: цена × количество"""
+    return item["price"] * item_qty(item)
+
+
+class Cart:
+    """Корзина: одна строка на товар с количеством, итоги считаются на лету"""
+    def __init__(self):
+        self.lines = {}
+        self.total = 0
+        self.count = 0
+        self._custom_seq = 0
+    
+    def __len__(self):
+        return len(self.lines)
+    
+    def __iter__(self):
+        return iter(self.lines.items())
+    
+    def add(self, item_id, name, price, category, qty=1):
+        """Добавление товара; повторное добавление увеличивает количество"""
+        if item_id == "custom":
+            # Свободные позиции не схлопываются: у каждой своя цена
+            self._custom_seq += 1
+            key = f"c{self._custom_seq}"
+        else:
+            key = item_id
+        
+        line = self.lines.get(key)
+        if line is None:
+            line = self.lines[key] = {
+                "item": name,
+                "price": price,
+                "category": category,
+                "item_id": item_id,
+                "qty": 0
+            }
+        self.set_quantity(key, line["qty"] + qty)
+        return key
+    
+    def set_quantity(self, key, qty):
+        """Установка количества строки (0 — удаление)"""
+        line = self.lines.get(key)
+        if line is None:
+            return False
+        qty = max(0, min(qty, MAX_QUANTITY))
+        delta = qty - line["qty"]
+        self.total += line["price"] * delta
+        self.count += delta
+        line["qty"] = qty
+        if qty == 0:
+            del self.lines[key]
+        return True
+    
+    def change_quantity(self, key, delta):
+        """Изменение количества строки на delta"""
+        line = self.lines.get(key)
+        return line is not None and self.set_quantity(key, line["qty"] + delta)
+    
+    def clear(self):
+        self.lines.clear()
+        self.total = 0
+        self.count = 0
+    
+    def to_items(self):
+        """Строки корзины для записи в чек"""
+        return [dict(line) for line in self.lines.values()]
+    
+    def to_dict(self):
+        """Корзина для бэкапа (порядок строк сохраняется)"""
+        return {"lines": list(self.lines.items()), "custom_seq": self._custom_seq}
+    
+    def load(self, data):
+        """Восстановление корзины из to_dict()"""
+        self.clear()
+        self._custom_seq = data.get("custom_seq", 0)
+        for key, line in data.get("lines", []):
+            self.lines[key] = dict(line, qty=0)
+            self.set_quantity(key, line["qty"])
+
+
+class SessionManager:
+    def __init__(self, config=Config, store=None):
+        self.config = config
+        # Общее хранилище воркеров (SQLiteStore); без него — файл бэкапа
+        self.store = store
+        self.version = 0
+        # Версия данных смены: растёт при каждом изменении (в отличие от
+        # version — версии записи в общем хранилище), по ней кэшируются отчёты
+        self.revision = 0
+        # Замечания последней проверки целостности (чек, причина)
+        self.integrity_flags = set()
+        self.is_open = False
+        # Вытеснение в файл — только для локального бэкапа: файл сегмента
+        # другому воркеру недоступен, в общем хранилище чеки лежат целиком
+        segment_path = None if store is not None else f"{config.BACKUP_FOLDER}/session_sales.seg"
+        self.sales = SalesLog(segment_path, hot_limit=config.SALES_HOT_LIMIT)
+        self.cart = Cart()
+        self.mixed_amount = None
+        self.custom_item_temp = None
+        self.quantity_key = None
+        self.open_time = None
+        self.ledger = CashLedger()
+        self.metrics = ShiftMetrics(config.TIMELINE_BUCKET_MINUTES)
+        # Сериализует изменения смены (продажи, возвраты, закрытие), которые
+        # переживают await. Отчёты и архив только читают и лок не берут.
+        self.lock = asyncio.Lock()
+        self.autosave = AutoSaveScheduler(
+            self.save_backup,
+            max_changes=config.AUTO_SAVE_MAX_CHANGES,
+            max_delay_ms=config.AUTO_SAVE_MAX_DELAY_MS
+        )
+    
+    def reset(self):
+        self.revision += 1
+        self.is_open = False
+        self.sales.clear()
+        self.cart.clear()
+        self.mixed_amount = None
+        self.custom_item_temp = None
+        self.quantity_key = None
+        self.open_time = None
+        self.ledger = CashLedger()
+        self.metrics = ShiftMetrics(self.config.TIMELINE_BUCKET_MINUTES)
+    
+    @property
+    def exchange_cash(self):
+        """Внесённый размен с учётом пополнений"""
+        return self.ledger.exchange_total
+    
+    def get_cart_total(self):
+        """Возвращает общую сумму корзины"""
+        return self.cart.total
+    
+    def add_sale(self, items, cash_amount=0, cashless_amount=0, refund_of=None):
+        """Добавление продажи (refund_of — номер чека, по которому оформлен возврат)"""
+        sale = {
+            # Не len + 1: после карантина чеков номера не должны повторяться
+            "id": self.sales.last_id + 1,
+            "items": items.copy(),
+            "cash_amount": cash_amount,
+            "cashless_amount": cashless_amount,
+            "time": datetime.datetime.now(),
+            "total": cash_amount + cashless_amount,
+            "refund_of": refund_of
+        }
+        self.revision += 1
+        self.sales.append(sale)
+        self.metrics.add_sale(sale)
+        self.ledger.record_sale(sale)
+        if refund_of is None:
+            log_event(logger, "sale_recorded", f"🧾 Чек #{sale['id']}: {sale['total']}",
+                      sale_id=sale["id"], total=sale["total"], cash=cash_amount,
+                      cashless=cashless_amount, items=len(items))
+        else:
+            log_event(logger, "refund_recorded", f"↩️ Возврат #{sale['id']} по чеку #{refund_of}: {sale['total']}",
+                      sale_id=sale["id"], refund_of=refund_of, total=sale["total"],
+                      cash=cash_amount, cashless=cashless_amount)
+    
+    def check_integrity(self, rebuild=False):
+        """Проверка чеков и счётчиков смены с исправлением (см. integrity.verify_sales).
+
+        Исправленные и отложенные в карантин чеки заменяют список смены,
+        расходящиеся с чеками показатели и наличные кассы пересчитываются.
+        rebuild — счётчики пусты (восстановление) и просто берутся из проверки.
+        Исправленная смена сразу записывается в бэкап. Возвращает IntegrityReport.
+        """
+        started = time.perf_counter()
+        report = verify_sales(self.sales, self.config.TIMELINE_BUCKET_MINUTES)
+        
+        if report.quarantined:
+            try:
+                write_quarantine(f"{self.config.BACKUP_FOLDER}/quarantine.jsonl", report.quarantined)
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи карантина чеков: {e}")
+        if report.changed:
+            # Все чеки — в память; при следующей продаже старые снова уйдут в файл.
+            # Файл с вытесненными чеками живёт, пока бэкап ссылается на него
+            self.sales.restore(report.sales)
+        for sale_id, reason in report.repaired:
+            logger.warning(f"🩹 Чек #{sale_id}: {reason}")
+        for sale, reason in report.quarantined:
+            logger.error(f"🚫 Чек в карантине ({reason}): {str(sale)[:200]}")
+        for sale_id, reason in report.flagged:
+            # Подозрительные чеки остаются в смене — о каждом предупреждаем один раз
+            if (sale_id, reason) not in self.integrity_flags:
+                logger.warning(f"⚠️ Чек #{sale_id}: {reason}")
+        self.integrity_flags = set(report.flagged)
+        
+        counters_ok = True
+        if not metrics_match(self.metrics, report.metrics):
+            counters_ok = False
+            self.metrics = report.metrics
+        if (self.ledger.cash_sales, self.ledger.cash_refunds) != (report.ledger.cash_sales, report.ledger.cash_refunds):
+            # Ручные операции кассы не трогаем — только наличные из чеков
+            counters_ok = False
+            self.ledger.cash_sales = report.ledger.cash_sales
+            self.ledger.cash_refunds = report.ledger.cash_refunds
+        if not counters_ok and not rebuild:
+            logger.warning("🩹 Показатели смены или касса расходились с чеками — пересчитаны")
+        if report.changed or not counters_ok:
+            self.revision += 1
+        if report.changed:
+            # Исправленные чеки — в бэкап сразу, а не отложенным автосохранением:
+            # после этой записи старый файл чеков удаляется (см. save_backup)
+            if self.save_backup():
+                self.autosave.discard()
+            else:
+                self.autosave.mark_dirty()
+        
+        log_event(logger, "integrity_checked", f"🔍 Проверка смены: {report.summary()}",
+                  checked=report.checked, repaired=len(report.repaired),
+                  quarantined=len(report.quarantined), flagged=len(report.flagged),
+                  counters_repaired=not counters_ok and not rebuild,
+                  duration_ms=round((time.perf_counter() - started) * 1000, 1))
+        return report
+    
+    def mark_dirty(self):
+        """Отметить изменение смены: новая версия данных и отложенное автосохранение"""
+        self.revision += 1
+        self.autosave.mark_dirty()
+    
+    def snapshot(self):
+        """Состояние открытой смены для бэкапа или общего хранилища"""
+        return {
+            'is_open': self.is_open,
+            # Только чеки в памяти; первые sales_spilled уже записаны в сегмент
+            'sales': self.sales.hot if self.sales.path else list(self.sales),
+            'sales_spilled': self.sales.spilled,
+            'sales_segment': os.path.basename(self.sales.segment_path) if self.sales.segment_path else None,
+            'exchange_cash': self.exchange_cash,
+            'cash_events': self.ledger.events,
+            'open_time': self.open_time.isoformat() if self.open_time else None,
+            'cart': self.cart.to_dict(),
+            'mixed_amount': self.mixed_amount,
+            'custom_item_temp': self.custom_item_temp,
+            'quantity_key': self.quantity_key,
+            'last_backup': datetime.datetime.now().isoformat()
+        }
+    
+    def save_backup(self):
+        """Сохранение резервной копии открытой смены"""
+        started = time.perf_counter()
+        try:
+            if self.is_open:
+                backup_data = self.snapshot()
+                
+                if self.store is not None:
+                    self._put_shared(backup_data, started)
+                    return True
+                
+                # Создаем папку для бэкапов если её нет
+                os.makedirs(self.config.BACKUP_FOLDER, exist_ok=True)
+                
+                backup_file = f"{self.config.BACKUP_FOLDER}/session_backup.json"
+                with open(backup_file, 'w', encoding='utf-8') as f:
+                    json.dump(backup_data, f, ensure_ascii=False, indent=2, default=str)
+                # Прежние файлы сегментов записанный бэкап больше не использует
+                self.sales.remove_files(keep=self.sales.segment_path)
+                
+                log_event(logger, "backup_written", "✅ Бэкап смены сохранен", target="file",
+                          sales=len(self.sales), duration_ms=round((time.perf_counter() - started) * 1000, 1))
+                return True
+                
+        except VersionConflict:
+            # Смену уже изменил другой воркер (этот потерял лидерство) —
+            # его версию не перезаписываем
+            logger.error("❌ Смена изменена другим воркером, запись отклонена")
+            return False
+        except Exception as e:
+            logger.error(f"❌ Ошибка при сохранении бэкапа: {e}")
+            return False
+    
+    def _put_shared(self, data, started=None):
+        """Запись в общее хранилище с проверкой версии"""
+        started = started or time.perf_counter()
+        value = json.dumps(data, ensure_ascii=False, default=str)
+        self.version = self.store.put(SHIFT_STORE_KEY, value, self.version)
+        log_event(logger, "backup_written", f"✅ Смена сохранена в общее хранилище (версия {self.version})",
+                  target="store", version=self.version, sales=len(self.sales),
+                  duration_ms=round((time.perf_counter() - started) * 1000, 1))
+    
+    def load_backup(self):
+        """Загрузка последней резервной копии"""
+        try:
+            backup_data = None
+            if self.store is not None:
+                value, self.version = self.store.get(SHIFT_STORE_KEY)
+                if value:
+                    backup_data = json.loads(value)
+            else:
+                backup_file = f"{self.config.BACKUP_FOLDER}/session_backup.json"
+                if os.path.exists(backup_file):
+                    with open(backup_file, 'r', encoding='utf-8') as f:
+                        backup_data = json.load(f)
+            
+            if backup_data:
+                # Конвертируем время из строки обратно в datetime
+                if backup_data.get('open_time'):
+                    backup_data['open_time'] = datetime.datetime.fromisoformat(backup_data['open_time'])
+                for sale in backup_data.get('sales', []):
+                    try:
+                        sale['time'] = datetime.datetime.fromisoformat(sale['time'])
+                    except (TypeError, KeyError, ValueError):
+                        # Повреждённый чек не срывает загрузку — его разберёт
+                        # проверка целостности
+                        pass
+                
+                logger.info("✅ Бэкап смены загружен")
+                return backup_data
+                
+        except Exception as e:
+            logger.error(f"❌ Ошибка при загрузке бэкапа: {e}")
+        
+        return None
+    
+    def restore_session(self):
+        """Восстановление сессии из бэкапа"""
+        backup_data = self.load_backup()
+        if backup_data and backup_data.get('is_open'):
+            self.revision += 1
+            self.is_open = True
+            self.sales.restore(backup_data.get('sales', []), backup_data.get('sales_spilled', 0),
+                               backup_data.get('sales_segment'))
+            cash_events = backup_data.get('cash_events')
+            if cash_events is None:
+                # Бэкап до журнала кассы: только сумма размена
+                exchange_cash = backup_data.get('exchange_cash', 0)
+                cash_events = []
+                if exchange_cash:
+                    cash_events.append({"type": EXCHANGE, "amount": exchange_cash, "note": None, "time": None})
+            self.ledger = CashLedger.restore(cash_events, ())
+            self.metrics = ShiftMetrics(self.config.TIMELINE_BUCKET_MINUTES)
+            self.open_time = backup_data.get('open_time')
+            self.cart.load(backup_data.get('cart', {}))
+            self.mixed_amount = backup_data.get('mixed_amount')
+            self.custom_item_temp = backup_data.get('custom_item_temp')
+            self.quantity_key = backup_data.get('quantity_key')
+            # Проверка чеков за тот же проход считает показатели и наличные кассы
+            # (последней: исправленная смена сразу пишется в бэкап целиком)
+            self.check_integrity(rebuild=True)
+            
+            last_backup = backup_data.get('last_backup', 'неизвестно')
+            logger.info(f"🔄 Восстановлена открытая смена из бэкапа от {last_backup}")
+            return True
+        
+        if self.store is not None:
+            # Смену мог закрыть другой воркер, пока этот был в резерве
+            self.reset()
+        return False
+    
+    def delete_backup(self):
+        """Удаление файла бэкапа (при корректном закрытии смены)"""
+        try:
+            if self.store is not None:
+                # Запись не удаляется, а помечается закрытой: версия продолжает
+                # расти, и устаревший воркер не воскресит смену своей записью
+                self._put_shared({'is_open': False})
+                logger.info("🗑️ Смена в общем хранилище отмечена закрытой")
+                return True
+            
+            backup_file = f"{self.config.BACKUP_FOLDER}/session_backup.json"
+            # Вытесненные чеки — часть бэкапа: файлы уходят только вместе с ним
+            self.sales.remove_files()
+            if os.path.exists(backup_file):
+                os.remove(backup_file)
+                logger.info("🗑️ Бэкап смены удален")
+                return True
+        except VersionConflict:
+            logger.error("❌ Смена изменена другим воркером, закрытие не записано")
+        except Exception as e:
+            logger.error(f"❌ Ошибка при удалении бэкапа: {e}")
+        
+        return False
+    
+    async def start_auto_save(self):
+        """Запуск автоматического сохранения"""
+        self.autosave.start()
+    
+    def stop_auto_save(self):
+        """Остановка автоматического сохранения (с записью несохранённого)"""
+        self.autosave.stop()
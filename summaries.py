@@ -0,0 +1,158 @@
+import json
+import logging
+from collections import OrderedDict
+
+from archive import ShiftArchive
+from metrics import ShiftMetrics, SalesTimeline, sale_time
+from export import iter_period_shifts
+from reports import build_period_timeline
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SUFFIX = ".summary.json"
+
+
+def shift_name(filename: str) -> str:
+    """Общее имя файлов смены: смена_YYYYMMDD_HHMMSS"""
+    return filename.split(".", 1)[0]
+
+
+def shift_key(filename: str) -> str:
+    """Короткий ключ смены для callback_data: YYYYMMDD_HHMMSS"""
+    return shift_name(filename).replace("смена_", "")
+
+
+def summary_filename(report_filename: str) -> str:
+    """Файл сводки рядом с текстовым отчётом смены"""
+    return report_filename[:-len(".txt")] + SUMMARY_SUFFIX
+
+
+def summarize_metrics(metrics: ShiftMetrics, open_time=None, close_time=None, ledger=None) -> dict:
+    """Компактная сводка смены из счётчиков (без чеков)"""
+    peak = metrics.timeline.peak()
+    summary = {
+        "open_time": open_time.isoformat(timespec="minutes") if open_time else None,
+        "close_time": close_time.isoformat(timespec="minutes") if close_time else None,
+        "receipts": metrics.receipts,
+        "items": metrics.items,
+        "people": metrics.people,
+        "revenue": metrics.revenue,
+        "cash": metrics.cash,
+        "cashless": metrics.cashless,
+        "dops_revenue": metrics.dops_revenue,
+        "shop_revenue": metrics.shop_revenue,
+        "weekday_revenue": metrics.weekday_revenue,
+        "weekend_revenue": metrics.weekend_revenue,
+        "avg_check": round(metrics.avg_check_total),
+        "avg_check_shop": round(metrics.avg_check_shop),
+        "peak_start": peak,
+        "peak_people": metrics.timeline.buckets[peak]["people"] if peak is not None else 0,
+        "bucket_minutes": metrics.timeline.bucket_minutes,
+    }
+    if ledger is not None:
+        summary["expected_cash"] = ledger.expected
+        summary["discrepancy"] = ledger.discrepancy
+    return summary
+
+
+def save_shift_summary(summary: dict, filename: str) -> bool:
+    try:
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False)
+        logger.info(f"Сводка смены сохранена в файл: {filename}")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении сводки смены: {e}")
+        return False
+
+
+class ShiftSummaries:
+    """Сводки закрытых смен с LRU-кэшем недавно просмотренных.
+
+    Сводка читается из файла смены ``*.summary.json`` (свежего или из
+    архивного пакета). Для смен, закрытых до появления сводок, она один
+    раз собирается из построчных продаж ``*.jsonl``.
+    """
+
+    def __init__(self, archive: ShiftArchive, cache_size: int = 32):
+        self.archive = archive
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        """Сводка смены по ключу YYYYMMDD_HHMMSS (None — смены нет)"""
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        self.misses += 1
+        summary = self._load(f"смена_{key}")
+        if summary is not None:
+            self._cache[key] = summary
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return summary
+
+    def precompute(self, keys) -> int:
+        """Загрузка сводок в кэш заранее (в простое); возвращает число прочитанных"""
+        loaded = 0
+        for key in list(keys)[:self.cache_size]:
+            if key not in self._cache:
+                self.get(key)
+                loaded += 1
+        return loaded
+
+    def _load(self, name: str):
+        try:
+            return json.loads(self.archive.read_bytes(name + SUMMARY_SUFFIX))
+        except FileNotFoundError:
+            pass
+
+        try:
+            metrics = ShiftMetrics()
+            first = last = None
+            for line in self.archive.iter_lines(name + ".jsonl"):
+                if not line.strip():
+                    continue
+                sale = json.loads(line)
+                metrics.add_sale(sale)
+                first = first or sale_time(sale)
+                last = sale_time(sale)
+        except FileNotFoundError:
+            return None
+        return summarize_metrics(metrics, first, last)
+
+
+class PeriodTimelines:
+    """Раскладка по времени закрытых смен за период, посчитанная заранее.
+
+    Закрытые смены не меняются, поэтому раскладку за последние дни можно
+    собрать в простое и отдавать /peaks без чтения архива. Сбрасывается
+    при закрытии смены и обслуживании архива.
+    """
+
+    def __init__(self, archive: ShiftArchive, bucket_minutes: int = 60):
+        self.archive = archive
+        self.bucket_minutes = bucket_minutes
+        self._cache = {}
+        self._generation = 0
+
+    def get(self, date_from, date_to):
+        """Готовая раскладка периода или None"""
+        return self._cache.get((date_from, date_to))
+
+    def compute(self, date_from, date_to) -> SalesTimeline:
+        """Сборка раскладки из архива (блокирующая, вызывать в потоке)"""
+        generation = self._generation
+        timeline = build_period_timeline(iter_period_shifts(date_from, date_to, self.archive), self.bucket_minutes)
+        # Смену закрыли во время сборки — результат уже неполный, не кэшируем
+        if generation == self._generation:
+            self._cache = {(date_from, date_to): timeline}
+        return timeline
+
+    def invalidate(self):
+        self._generation += 1
+        self._cache = {}